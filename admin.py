@@ -19,7 +19,7 @@ from .models import DataPoint, DataBundle, DataSource, DataSourceGroup, \
                     DataFile, AppConfiguration, DataGeneratorDefinition, \
                     DataSourceReference, ReportDestination, DataServerAccessRequest, \
                     DataServerAccessRequestPending, DeviceModel, Device, DeviceIssue, \
-                    DataServer
+                    DataServer, LatestDataPoint, DataPointDailySummary, DataSourceSummary
 
 def reset_visualizations(modeladmin, request, queryset): # pylint: disable=unused-argument
     for visualization in queryset:
@@ -212,6 +212,29 @@ class DataServerMetadatumAdmin(admin.OSMGeoAdmin):
     search_fields = ['key', 'value']
 
 
+@admin.register(LatestDataPoint)
+class LatestDataPointAdmin(admin.OSMGeoAdmin):
+    list_display = ('source_reference', 'generator_definition', 'created', 'updated',)
+    list_filter = ('created', 'updated', 'generator_definition',)
+    search_fields = ['source_reference__source', 'generator_definition__generator_identifier']
+    raw_id_fields = ('data_point',)
+
+
+@admin.register(DataPointDailySummary)
+class DataPointDailySummaryAdmin(admin.OSMGeoAdmin):
+    list_display = ('source_reference', 'generator_definition', 'day', 'point_count', 'last_created', 'last_recorded',)
+    list_filter = ('day', 'generator_definition',)
+    search_fields = ['source_reference__source', 'generator_definition__generator_identifier']
+
+
+@admin.register(DataSourceSummary)
+class DataSourceSummaryAdmin(admin.OSMGeoAdmin):
+    list_display = ('source', 'user_agent', 'latest_point_created', 'point_count', 'point_frequency', 'updated',)
+    list_filter = ('updated', 'latest_point_created',)
+    search_fields = ['source__identifier', 'source__name', 'user_agent']
+    raw_id_fields = ('source',)
+
+
 @admin.register(DataSourceAlert)
 class DataSourceAlertAdmin(admin.OSMGeoAdmin):
     list_display = (
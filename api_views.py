@@ -4,8 +4,12 @@ from __future__ import print_function
 
 from builtins import str # pylint: disable=redefined-builtin
 
+import base64
+import binascii
 import datetime
+import gzip
 import importlib
+import io
 import json
 
 import arrow
@@ -13,13 +17,14 @@ import arrow
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseNotAllowed
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, StreamingHttpResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
 from django.contrib.auth import authenticate
 
-from passive_data_kit.models import DataServerApiToken, DataPoint, DataServerAccessRequestPending, DataSource, DataSourceGroup, DataSourceReference, DataGeneratorDefinition
+from passive_data_kit.models import DataServerApiToken, DataPoint, DataServerAccessRequestPending, DataSource, DataSourceGroup, DataSourceReference, DataGeneratorDefinition, \
+                                    install_supports_jsonfield
 
 
 def valid_pdk_token_required(function):
@@ -73,9 +78,191 @@ def pdk_request_token(request):
     return HttpResponseNotAllowed(['POST'])
 
 
+STREAM_ORDER_FIELDS = ('pk', 'created', 'recorded',)
+STREAM_BATCH_SIZE = 1000
+
+def encode_query_cursor(latest, order, point, order_field):
+    value = getattr(point, order_field)
+
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+
+    cursor = {
+        'latest': latest,
+        'order': order,
+        'after': [value, point.pk],
+    }
+
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('utf-8')
+
+def decode_query_cursor(token):
+    # Raises ValueError for any token that encode_query_cursor could not have produced.
+
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(str(token)).decode('utf-8'))
+
+        cursor = {
+            'latest': int(cursor['latest']),
+            'order': cursor['order'],
+            'after': (cursor['after'][0], int(cursor['after'][1]),),
+        }
+    except (KeyError, IndexError, TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor.') # pylint: disable=raise-missing-from
+
+    return cursor
+
+def query_point_properties(item):
+    properties = item.fetch_properties()
+
+    properties['passive-data-metadata']['pdk_server_created'] = arrow.get(item.created.isoformat()).timestamp()
+    properties['passive-data-metadata']['pdk_server_recorded'] = arrow.get(item.recorded.isoformat()).timestamp()
+
+    return properties
+
+def data_point_lines(points, latest, page_size, order_field, order):
+    # Yields one JSON document per line for each point, followed by a final pdk-query line
+    # holding the cursor that resumes after the last point sent (or null when none remain).
+
+    sent = 0
+    last_point = None
+    next_cursor = None
+
+    for point in points:
+        if 0 < page_size <= sent:
+            next_cursor = encode_query_cursor(latest, order, last_point, order_field)
+
+            break
+
+        yield json.dumps(query_point_properties(point)) + '\n'
+
+        sent += 1
+        last_point = point
+
+    yield json.dumps({'pdk-query': {'latest': latest, 'count': sent, 'next': next_cursor}}) + '\n'
+
+def log_data_point_query(request, request_type='api-data-points-request'):
+    token = DataServerApiToken.objects.filter(token=request.POST.get('token', None)).first()
+
+    access_request = DataServerAccessRequestPending()
+
+    if token is not None:
+        access_request.user_identifier = str(token.user.pk) + ': ' + str(token.user.username)
+    else:
+        access_request.user_identifier = 'api_token: ' + request.POST.get('token', None)
+
+    access_request.request_type = request_type
+    access_request.request_time = timezone.now()
+    access_request.request_metadata = json.dumps(request.POST, indent=2)
+    access_request.successful = True
+    access_request.save()
+
+def query_latest_pk(request, cursor=None):
+    if cursor is not None:
+        return cursor['latest']
+
+    if 'latest' in request.POST:
+        return int(request.POST.get('latest_pk', 0))
+
+    latest_point = DataPoint.objects.all().order_by('-pk').first()
+
+    return latest_point.pk
+
+def query_field_lookups(lookups):
+    processed = {}
+
+    for field, value in list(lookups.items()):
+        if value is not None:
+            if field in ('created', 'recorded',):
+                value = arrow.get(value).datetime
+            elif field == 'source':
+                value = DataSourceReference.reference_for_source(value)
+                field = 'source_reference'
+            elif field == 'generator_identifier':
+                value = DataGeneratorDefinition.definition_for_identifier(value)
+                field = 'generator_definition'
+
+        processed[field] = value
+
+    return processed
+
+def filtered_data_point_query(request, latest):
+    query = DataPoint.objects.filter(pk__lte=latest)
+
+    for filter_obj in json.loads(request.POST['filters']):
+        query = query.filter(**query_field_lookups(filter_obj))
+
+    for exclude in json.loads(request.POST['excludes']):
+        query = query.exclude(**query_field_lookups(exclude))
+
+    return query
+
+def query_order_by(request):
+    processed_order_by = []
+
+    for order_by in json.loads(request.POST['order_by']):
+        for item in order_by:
+            processed_order_by.append(item)
+
+    return processed_order_by
+
+def stream_data_point_query(request):
+    # Streams the matching points as NDJSON in keyset order, resuming after the cursor sent
+    # by the previous page.
+
+    page_size = int(request.POST.get('page_size', '0'))
+
+    cursor = None
+
+    if request.POST.get('cursor', ''):
+        try:
+            cursor = decode_query_cursor(request.POST['cursor'])
+        except ValueError:
+            return HttpResponseBadRequest('Invalid cursor.')
+
+    latest = query_latest_pk(request, cursor)
+
+    query = filtered_data_point_query(request, latest)
+
+    processed_order_by = query_order_by(request)
+
+    if len(processed_order_by) > 1 or (processed_order_by and (processed_order_by[0].lstrip('-') in STREAM_ORDER_FIELDS) is False):
+        return HttpResponseBadRequest('Streamed queries may only be ordered by one of: ' + ', '.join(STREAM_ORDER_FIELDS) + '.')
+
+    order_field = 'pk'
+    descending = False
+
+    if processed_order_by:
+        order_field = processed_order_by[0].lstrip('-')
+        descending = processed_order_by[0].startswith('-')
+
+    after = None
+
+    if cursor is not None:
+        if cursor['order'] != processed_order_by[:1]:
+            return HttpResponseBadRequest('Cursor does not match the requested order.')
+
+        try:
+            if order_field == 'pk':
+                after = (int(cursor['after'][0]), cursor['after'][1])
+            else:
+                after = (arrow.get(cursor['after'][0]).datetime, cursor['after'][1])
+        except (TypeError, ValueError, arrow.parser.ParserError):
+            return HttpResponseBadRequest('Invalid cursor.')
+
+    log_data_point_query(request)
+
+    batch_size = STREAM_BATCH_SIZE
+
+    if page_size > 0:
+        batch_size = min(batch_size, page_size + 1)
+
+    points = query.keyset_iterator(batch_size=batch_size, field=order_field, descending=descending, after=after)
+
+    return StreamingHttpResponse(data_point_lines(points, latest, page_size, order_field, processed_order_by[:1]), content_type='application/x-ndjson')
+
 @csrf_exempt
 @valid_pdk_token_required
-def pdk_data_point_query(request): # pylint: disable=too-many-locals, too-many-branches, too-many-statements
+def pdk_data_point_query(request):
     if request.method == 'POST':
         for app in settings.INSTALLED_APPS:
             try:
@@ -90,59 +277,15 @@ def pdk_data_point_query(request): # pylint: disable=too-many-locals, too-many-b
             except AttributeError:
                 pass
 
+        if request.POST.get('format', 'json') == 'ndjson':
+            return stream_data_point_query(request)
+
         page_size = int(request.POST['page_size'])
         page_index = int(request.POST['page_index'])
 
-        filters = json.loads(request.POST['filters'])
-        excludes = json.loads(request.POST['excludes'])
-        order_bys = json.loads(request.POST['order_by'])
+        latest = query_latest_pk(request)
 
-        latest = None
-
-        if 'latest' in request.POST:
-            latest = int(request.POST.get('latest_pk', 0))
-        else:
-            latest_point = DataPoint.objects.all().order_by('-pk').first()
-
-            latest = latest_point.pk
-
-        query = DataPoint.objects.filter(pk__lte=latest)
-
-        for filter_obj in filters:
-            processed_filter = {}
-
-            for field, value in list(filter_obj.items()):
-                if value is not None:
-                    if field == 'created' or field == 'recorded':
-                        value = arrow.get(value).datetime
-                    elif field == 'source':
-                        value = DataSourceReference.reference_for_source(value)
-                        field = 'source_reference'
-                    elif field == 'generator_identifier':
-                        value = DataGeneratorDefinition.definition_for_identifier(value)
-                        field = 'generator_definition'
-
-                processed_filter[field] = value
-
-            query = query.filter(**processed_filter)
-
-        for exclude in excludes:
-            processed_exclude = {}
-
-            for field, value in list(exclude.items()):
-                if value is not None:
-                    if field == 'created' or field == 'recorded':
-                        value = arrow.get(value).datetime
-                    elif field == 'source':
-                        value = DataSourceReference.reference_for_source(value)
-                        field = 'source_reference'
-                    elif field == 'generator_identifier':
-                        value = DataGeneratorDefinition.definition_for_identifier(value)
-                        field = 'generator_definition'
-
-                processed_exclude[field] = value
-
-            query = query.exclude(**processed_exclude)
+        query = filtered_data_point_query(request, latest)
 
         payload = {
             'latest': latest,
@@ -151,11 +294,7 @@ def pdk_data_point_query(request): # pylint: disable=too-many-locals, too-many-b
             'page_size': page_size,
         }
 
-        processed_order_by = []
-
-        for order_by in order_bys:
-            for item in order_by:
-                processed_order_by.append(item)
+        processed_order_by = query_order_by(request)
 
         if processed_order_by:
             query = query.order_by(*processed_order_by)
@@ -164,29 +303,11 @@ def pdk_data_point_query(request): # pylint: disable=too-many-locals, too-many-b
 
         if payload['count'] > 0:
             for item in query[(page_index * page_size):((page_index + 1) * page_size)]:
-                properties = item.fetch_properties()
-
-                properties['passive-data-metadata']['pdk_server_created'] = arrow.get(item.created.isoformat()).timestamp()
-                properties['passive-data-metadata']['pdk_server_recorded'] = arrow.get(item.recorded.isoformat()).timestamp()
-
-                matches.append(properties)
+                matches.append(query_point_properties(item))
 
         payload['matches'] = matches
 
-        token = DataServerApiToken.objects.filter(token=request.POST.get('token', None)).first()
-
-        access_request = DataServerAccessRequestPending()
-
-        if token is not None:
-            access_request.user_identifier = str(token.user.pk) + ': ' + str(token.user.username)
-        else:
-            access_request.user_identifier = 'api_token: ' + request.POST.get('token', None)
-
-        access_request.request_type = 'api-data-points-request'
-        access_request.request_time = timezone.now()
-        access_request.request_metadata = json.dumps(request.POST, indent=2)
-        access_request.successful = True
-        access_request.save()
+        log_data_point_query(request)
 
         return HttpResponse(json.dumps(payload, indent=2), content_type='application/json')
 
@@ -373,3 +494,88 @@ def pdk_data_source_update(request): # pylint: disable=too-many-locals, too-many
         return HttpResponse(json.dumps(payload), content_type='application/json')
 
     return HttpResponseNotAllowed(['POST'])
+
+SYNC_COLUMNS = ('pk', 'source', 'generator_identifier', 'secondary_identifier', 'created', 'recorded', 'properties',)
+SYNC_PAGE_SIZE = 1000
+SYNC_MAX_PAGE_SIZE = 10000
+SYNC_SETTLE_SECONDS = 300
+
+@csrf_exempt
+@valid_pdk_token_required
+def pdk_data_point_sync(request): # pylint: disable=too-many-locals
+    # Returns the points with primary keys above the since watermark in key order, as compact
+    # rows, with the watermark to send next time. Points recorded in the last
+    # PDK_SYNC_SETTLE_SECONDS (default SYNC_SETTLE_SECONDS) are held back, with everything after
+    # them, so keys that ingest transactions still running have not committed yet are not
+    # skipped over. Ingest writes each bundle in its own short transaction; points committed
+    # by transactions running longer than the window may be missed.
+
+    if request.method == 'POST':
+        try:
+            since = int(request.POST.get('since', '0'))
+            page_size = min(int(request.POST.get('page_size', SYNC_PAGE_SIZE)), SYNC_MAX_PAGE_SIZE)
+
+            sources = json.loads(request.POST.get('sources', '[]'))
+            generators = json.loads(request.POST.get('generators', '[]'))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid since, page_size, sources, or generators parameter.')
+
+        settle_seconds = SYNC_SETTLE_SECONDS
+
+        try:
+            settle_seconds = settings.PDK_SYNC_SETTLE_SECONDS
+        except AttributeError:
+            pass
+
+        settled = timezone.now() - datetime.timedelta(seconds=settle_seconds)
+
+        query = DataPoint.objects.filter(pk__gt=since)
+
+        if sources:
+            query = query.filter(source_reference__in=DataSourceReference.objects.filter(source__in=sources))
+
+        if generators:
+            query = query.filter(generator_definition__in=DataGeneratorDefinition.objects.filter(generator_identifier__in=generators))
+
+        rows = []
+
+        watermark = since
+
+        for point in query.order_by('pk').values_list(*SYNC_COLUMNS)[:max(page_size, 1)]:
+            point_pk, source, generator_identifier, secondary_identifier, created, recorded, properties = point
+
+            if recorded > settled:
+                break
+
+            if install_supports_jsonfield() is False:
+                properties = json.loads(properties)
+
+            rows.append([point_pk, source, generator_identifier, secondary_identifier, arrow.get(created.isoformat()).timestamp(), arrow.get(recorded.isoformat()).timestamp(), properties])
+
+            watermark = point_pk
+
+        payload = {
+            'since': since,
+            'next': watermark,
+            'columns': SYNC_COLUMNS,
+            'points': rows,
+        }
+
+        log_data_point_query(request, 'api-data-points-sync')
+
+        content = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+        if request.POST.get('gzip', 'false') == 'true':
+            compressed = io.BytesIO()
+
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as gzip_file:
+                gzip_file.write(content)
+
+            response = HttpResponse(compressed.getvalue(), content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+
+            return response
+
+        return HttpResponse(content, content_type='application/json')
+
+    return HttpResponseNotAllowed(['POST'])
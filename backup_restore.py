@@ -0,0 +1,241 @@
+# pylint: disable=line-too-long, no-member
+
+from __future__ import print_function
+
+from builtins import str # pylint: disable=redefined-builtin
+
+import codecs
+import datetime
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.core import management
+from django.utils import timezone
+
+from .models import DataPoint, DataBundle, DataPointDailySummary, DataSource, install_supports_jsonfield
+
+BACKUP_BUNDLE_SIZE = 100
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iterate_json_array(chunks):
+    # Yields the items of a top-level JSON array read from an iterable of UTF-8 byte chunks,
+    # holding at most one chunk and one partial item in memory.
+
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+
+    buffer = ''
+    started = False
+
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+
+        position = 0
+
+        while True:
+            position = JSON_WHITESPACE.match(buffer, position).end()
+
+            if position >= len(buffer):
+                break
+
+            if started is False:
+                if buffer[position] != '[':
+                    raise ValueError('Backup content is not a JSON array.')
+
+                started = True
+                position += 1
+            elif buffer[position] == ',':
+                position += 1
+            elif buffer[position] == ']':
+                return
+            else:
+                try:
+                    item, item_end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    break # Item continues in the next chunk.
+
+                if item_end >= len(buffer) and isinstance(item, (dict, list)) is False:
+                    break # Scalars at the end of the buffer may be truncated.
+
+                yield item
+
+                position = item_end
+
+        buffer = buffer[position:]
+
+    raise ValueError('Backup content ended before the end of the JSON array.')
+
+def queue_backup_items(items):
+    # Re-queues backed-up point payloads as DataBundle objects for pdk_process_bundles.
+
+    supports_json = install_supports_jsonfield()
+
+    bundle_index = 0
+
+    for bundle_content in iter(lambda: list(itertools.islice(items, BACKUP_BUNDLE_SIZE)), []):
+        if (bundle_index % 50) == 0:
+            print('[passive_data_kit.backup_restore] ' + str(bundle_index * BACKUP_BUNDLE_SIZE) + ' items written...')
+
+        bundle = DataBundle(recorded=timezone.now())
+
+        if supports_json:
+            bundle.properties = bundle_content
+        else:
+            bundle.properties = json.dumps(bundle_content, indent=2)
+
+        bundle.save()
+
+        bundle_index += 1
+
+def backup_data_point(item, now):
+    # Builds the DataPoint for a backed-up payload, as bundle ingest would.
+
+    metadata = item['passive-data-metadata']
+
+    point = DataPoint(recorded=now, created=datetime.datetime.fromtimestamp(metadata['timestamp'], tz=timezone.get_default_timezone()), generator=metadata['generator'])
+
+    point.source = metadata.get('source', None)
+
+    if point.source is None:
+        point.source = '-'
+
+    if 'generator-id' in metadata:
+        point.generator_identifier = metadata['generator-id']
+
+    if 'latitude' in metadata and 'longitude' in metadata:
+        point.generated_at = GEOSGeometry('POINT(' + str(metadata['longitude']) + ' ' + str(metadata['latitude']) + ')')
+
+    if install_supports_jsonfield():
+        point.properties = item
+    else:
+        point.properties = json.dumps(item, indent=2)
+
+    point.fetch_secondary_identifier(skip_save=True, properties=item)
+    point.fetch_user_agent(skip_save=True, properties=item)
+    point.fetch_generator_definition(skip_save=True)
+    point.fetch_source_reference(skip_save=True)
+
+    return point
+
+def record_point_statistics(statistics, points):
+    for point in points:
+        if (point.source in statistics['seen_sources']) is False:
+            statistics['seen_sources'].append(point.source)
+
+        if (point.source in statistics['source_identifiers']) is False:
+            statistics['source_identifiers'][point.source] = []
+
+        if (point.generator_identifier in statistics['source_identifiers'][point.source]) is False:
+            statistics['source_identifiers'][point.source].append(point.generator_identifier)
+
+        if (point.generator_identifier in statistics['seen_generators']) is False:
+            statistics['seen_generators'].append(point.generator_identifier)
+
+        latest_key = point.source + '--' + point.generator_identifier
+
+        if (latest_key in statistics['latest_points']) is False or statistics['latest_points'][latest_key].created < point.created:
+            statistics['latest_points'][latest_key] = point
+
+    statistics['new_point_count'] += len(points)
+
+def restore_data_points(items, batch_size=1000):
+    # Writes backed-up point payloads straight to DataPoint with one bulk_create per batch.
+    # Payloads pass through the same steps as bundle ingest: 0x00 characters are stripped,
+    # sources are handled by ingest_source (renames, new sources and groups) and
+    # PDK_INSPECT_DATA_POINT_AT_INGEST is called. Points of sources assigned to remote servers
+    # are queued as DataBundle objects, so pdk_process_bundles forwards them.
+    #
+    # Returns the run's statistics in the pdk_process_bundles format. The caller merges them
+    # and applies them with update_bundle_statistics once, so parallel restores do not
+    # overwrite each other's metadata updates.
+
+    server_urls = {}
+
+    statistics = {
+        'processed_bundle_count': 0,
+        'new_point_count': 0,
+        'bundle_size': 0,
+        'elapsed': 0,
+        'seen_sources': [],
+        'seen_generators': [],
+        'source_identifiers': {},
+        'latest_points': {},
+    }
+
+    for batch in iter(lambda: list(itertools.islice(items, batch_size)), []):
+        now = timezone.now()
+
+        points = []
+        remote_items = []
+
+        for item in batch:
+            try:
+                item = json.loads(json.dumps(item).replace(r'\u0000', ''))
+
+                metadata = item['passive-data-metadata']
+
+                if metadata.get('source', None) is not None and DataSource.objects.ingest_source(metadata, server_urls) != '':
+                    remote_items.append(item)
+
+                    continue
+
+                try:
+                    settings.PDK_INSPECT_DATA_POINT_AT_INGEST(item)
+                except AttributeError:
+                    pass # Optional method not defined
+
+                points.append(backup_data_point(item, now))
+            except (KeyError, TypeError, ValueError, OverflowError):
+                print('[passive_data_kit.backup_restore.restore_data_points] Skipping malformed item: ' + str(item)[:256])
+
+        DataPoint.objects.bulk_create(points)
+
+        DataPointDailySummary.objects.record_points(points)
+
+        record_point_statistics(statistics, points)
+
+        queue_backup_items(iter(remote_items))
+
+    return statistics
+
+def load_backup_content(filename, content, direct=False):
+    # See pdk_api.load_backup. Returns the restore statistics for direct restores of point
+    # bundles, otherwise None.
+
+    if isinstance(content, bytes):
+        content = [content]
+
+    if 'json-dumpdata' in filename:
+        filename = filename.replace('.json-dumpdata.bz2.encrypted', '.json')
+
+        path = os.path.join(tempfile.gettempdir(), filename)
+
+        with io.open(path, 'wb') as fixture_file:
+            for chunk in content:
+                fixture_file.write(chunk)
+
+        management.call_command('loaddata', path)
+
+        os.remove(path)
+    elif 'pdk-bundle' in filename:
+        items = iterate_json_array(content)
+
+        if direct:
+            statistics = restore_data_points(items)
+
+            print('[passive_data_kit.backup_restore.load_backup_content] Restored ' + str(statistics['new_point_count']) + ' data points from ' + filename + '.')
+
+            return statistics
+
+        queue_backup_items(items)
+    else:
+        print('[passive_data_kit.backup_restore.load_backup_content] Unknown file type: ' + filename)
+
+    return None
@@ -0,0 +1,137 @@
+# pylint: disable=no-member,line-too-long,wrong-import-position
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zip_assembly import ZipAssembler # pylint: disable=import-error
+
+parser = argparse.ArgumentParser(description='Compare report zip merging by extraction and recompression against raw member copies on a synthetic export.')
+
+parser.add_argument('--size', type=float, default=2.0, help='uncompressed size of the synthetic export in GB')
+parser.add_argument('--generators', type=int, default=20, help='number of generator archives to merge')
+parser.add_argument('--sources', type=int, default=10, help='number of source files per generator archive')
+parser.add_argument('--directory', type=str, default=None, help='scratch directory (defaults to the system temporary directory)')
+parser.add_argument('--skip-recompress', action='store_true', help='only time the raw member copy')
+
+args = vars(parser.parse_args())
+
+def directory_size(path):
+    total = 0
+
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+
+    return total
+
+def synthetic_rows(row_count, generator_index):
+    now = int(time.time())
+
+    for index in range(0, row_count):
+        yield 'source-%d\tpdk-generator-%d\t%d\t%.6f\t%.6f\t%d\n' % (index % 97, generator_index, now - index, random.uniform(-90, 90), random.uniform(-180, 180), random.randint(0, 100))
+
+def build_generator_zips(scratch, size, generators, sources):
+    # Tab-separated rows like the generators' own exports, deflated as compile_report does.
+
+    row_count = int((size * 1024 * 1024 * 1024) / (generators * sources * 64))
+
+    zip_filenames = []
+
+    for generator_index in range(0, generators):
+        zip_filename = os.path.join(scratch, 'pdk_generator_%d.zip' % generator_index)
+
+        with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as export_file:
+            for source_index in range(0, sources):
+                with export_file.open('source-%d/pdk-generator-%d.txt' % (source_index, generator_index), 'w', force_zip64=True) as member_file:
+                    batch = []
+
+                    for row in synthetic_rows(row_count, generator_index):
+                        batch.append(row)
+
+                        if len(batch) >= 10000:
+                            member_file.write(''.join(batch).encode('utf-8'))
+                            batch = []
+
+                    member_file.write(''.join(batch).encode('utf-8'))
+
+        zip_filenames.append(zip_filename)
+
+    return zip_filenames
+
+def merge_by_recompressing(scratch, zip_filenames):
+    # The former pdk_compile_reports approach: extract each member, then rewrite it with BZIP2.
+
+    filename = os.path.join(scratch, 'recompressed.zip')
+    extract_path = os.path.join(scratch, 'extracted')
+
+    peak_disk = 0
+
+    with zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_BZIP2, allowZip64=True) as zip_output:
+        for zip_filename in zip_filenames:
+            with zipfile.ZipFile(zip_filename, 'r') as zip_file:
+                for child_file in zip_file.namelist():
+                    zip_file.extract(child_file, path=extract_path)
+
+                    peak_disk = max(peak_disk, directory_size(extract_path))
+
+                    zip_output.write(os.path.join(extract_path, child_file), child_file, compress_type=zipfile.ZIP_BZIP2)
+
+                    os.remove(os.path.join(extract_path, child_file))
+
+    return filename, peak_disk
+
+def merge_by_copying(scratch, zip_filenames):
+    filename = os.path.join(scratch, 'assembled.zip')
+
+    with open(filename, 'wb') as final_output_file:
+        with ZipAssembler(mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as export_stream:
+            for zip_filename in zip_filenames:
+                export_stream.write_zip(zip_filename)
+
+            for data in export_stream:
+                final_output_file.write(data)
+
+    return filename, 0
+
+scratch_directory = tempfile.mkdtemp(prefix='pdk_zip_benchmark_', dir=args['directory'])
+
+try:
+    print('Building ' + str(args['generators']) + ' generator archives (' + str(args['size']) + ' GB uncompressed)...')
+
+    start = time.time()
+
+    child_zips = build_generator_zips(scratch_directory, args['size'], args['generators'], args['sources'])
+
+    child_bytes = sum(os.path.getsize(child_zip) for child_zip in child_zips)
+
+    print('Built ' + '{0:.1f}'.format(child_bytes / (1024.0 * 1024.0)) + ' MB of archives in ' + '{0:.1f}'.format(time.time() - start) + ' seconds.')
+
+    strategies = [('raw member copy', merge_by_copying)]
+
+    if args['skip_recompress'] is False:
+        strategies.insert(0, ('extract and recompress', merge_by_recompressing))
+
+    for label, strategy in strategies:
+        start = time.time()
+
+        output_filename, extra_disk = strategy(scratch_directory, child_zips)
+
+        elapsed = time.time() - start
+
+        with zipfile.ZipFile(output_filename, 'r') as merged:
+            if merged.testzip() is not None:
+                print(label + ': merged archive failed verification!')
+
+        print(label + ': ' + '{0:.1f}'.format(elapsed) + ' seconds, ' + '{0:.1f}'.format(child_bytes / (1024.0 * 1024.0) / max(elapsed, 0.001)) + ' MB/sec, ' + '{0:.1f}'.format(os.path.getsize(output_filename) / (1024.0 * 1024.0)) + ' MB output, ' + '{0:.1f}'.format(extra_disk / (1024.0 * 1024.0)) + ' MB peak extracted temp files.')
+
+        os.remove(output_filename)
+finally:
+    shutil.rmtree(scratch_directory, ignore_errors=True)
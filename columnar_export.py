@@ -0,0 +1,174 @@
+# pylint: disable=line-too-long
+
+import csv
+import io
+import logging
+import os
+import shutil
+import zipfile
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMATS = ('tsv', 'parquet')
+
+DICTIONARY_COLUMNS = ('Source', 'Generator', 'Generator Identifier')
+EPOCH_COLUMNS = ('Created Timestamp', 'Recorded Timestamp')
+DATE_COLUMNS = ('Created Date', 'Recorded Date')
+FLOAT_COLUMNS = ('Latitude', 'Longitude', 'Center Latitude', 'Center Longitude')
+
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+def columnar_export_available():
+    return pyarrow is not None
+
+def column_types(columns, infer=True):
+    types = {}
+
+    for column in columns:
+        if column in DICTIONARY_COLUMNS:
+            types[column] = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        elif column in EPOCH_COLUMNS or column in FLOAT_COLUMNS:
+            types[column] = pyarrow.float64()
+        elif column in DATE_COLUMNS:
+            types[column] = pyarrow.timestamp('us', tz='UTC')
+        elif infer is False:
+            types[column] = pyarrow.string()
+
+    return types
+
+def typed_batch(batch):
+    # Epoch seconds become millisecond timestamps, so readers do not have to know the unit.
+
+    arrays = []
+    names = []
+
+    for name, array in zip(batch.schema.names, batch.columns):
+        if name in EPOCH_COLUMNS:
+            array = pyarrow.compute.round(pyarrow.compute.multiply(array, 1000)).cast(pyarrow.int64()).cast(pyarrow.timestamp('ms', tz='UTC')) # pylint: disable=no-member
+
+        arrays.append(array)
+        names.append(name)
+
+    return pyarrow.RecordBatch.from_arrays(arrays, names=names)
+
+def header_schema(columns):
+    # The schema typed_batch would produce for the header's columns, used when a report has no
+    # rows to infer types from.
+
+    types = column_types(columns, infer=False)
+
+    fields = []
+
+    for column in columns:
+        if column in EPOCH_COLUMNS:
+            fields.append(pyarrow.field(column, pyarrow.timestamp('ms', tz='UTC')))
+        else:
+            fields.append(pyarrow.field(column, types[column]))
+
+    return pyarrow.schema(fields)
+
+def write_parquet(text_filename, parquet_filename, infer=True):
+    with io.open(text_filename, 'r', encoding='utf-8', newline='') as text_file:
+        columns = next(csv.reader(text_file, delimiter='\t'), [])
+
+    if not columns: # Empty file
+        pyarrow.parquet.write_table(header_schema(columns).empty_table(), parquet_filename, compression='zstd')
+
+        return
+
+    reader = pyarrow.csv.open_csv(text_filename,
+                                  read_options=pyarrow.csv.ReadOptions(block_size=READ_BLOCK_SIZE),
+                                  parse_options=pyarrow.csv.ParseOptions(delimiter='\t', newlines_in_values=True),
+                                  convert_options=pyarrow.csv.ConvertOptions(column_types=column_types(columns, infer=infer), strings_can_be_null=True))
+
+    writer = None
+
+    try:
+        for batch in reader:
+            batch = typed_batch(batch)
+
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(parquet_filename, batch.schema, compression='zstd')
+
+            writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None: # Header only, as for sources without data in range.
+        pyarrow.parquet.write_table(header_schema(columns).empty_table(), parquet_filename, compression='zstd')
+
+def convert_text_file(text_filename, parquet_filename):
+    # Column types are inferred from the first block of rows. Files where a later block
+    # disagrees are converted again with every untyped column read as text.
+
+    try:
+        write_parquet(text_filename, parquet_filename)
+    except pyarrow.ArrowInvalid:
+        logging.info('columnar_export: Inferred types do not fit %s, exporting untyped columns as text.', text_filename)
+
+        write_parquet(text_filename, parquet_filename, infer=False)
+
+def convert_report(output_file):
+    # Converts a generator's tab-separated report (a text file or a zip of them) into Parquet.
+    # Other files are carried over unchanged. Returns the path of the converted report.
+
+    if pyarrow is None:
+        logging.warning('columnar_export: pyarrow is not installed, keeping %s as tab-separated text.', output_file)
+
+        return output_file
+
+    if output_file.lower().endswith('.txt'):
+        parquet_filename = os.path.splitext(output_file)[0] + '.parquet'
+
+        convert_text_file(output_file, parquet_filename)
+
+        if os.path.exists(parquet_filename) is False:
+            logging.warning('columnar_export: No Parquet output for %s, keeping it as tab-separated text.', output_file)
+
+            return output_file
+
+        os.remove(output_file)
+
+        return parquet_filename
+
+    if output_file.lower().endswith('.zip') is False:
+        return output_file
+
+    converted_filename = os.path.splitext(output_file)[0] + '_parquet.zip'
+    staged_filename = os.path.splitext(output_file)[0] + '_staged.txt'
+
+    with zipfile.ZipFile(output_file, 'r') as text_zip:
+        with zipfile.ZipFile(converted_filename, 'w', zipfile.ZIP_STORED, allowZip64=True) as parquet_zip:
+            for member in text_zip.infolist():
+                if member.filename.lower().endswith('.txt'):
+                    staged_parquet = os.path.splitext(staged_filename)[0] + '.parquet'
+
+                    with text_zip.open(member) as member_file:
+                        with io.open(staged_filename, 'wb') as staged_file:
+                            shutil.copyfileobj(member_file, staged_file)
+
+                    convert_text_file(staged_filename, staged_parquet)
+
+                    if os.path.exists(staged_parquet):
+                        parquet_zip.write(staged_parquet, os.path.splitext(member.filename)[0] + '.parquet')
+
+                        os.remove(staged_parquet)
+                    else:
+                        parquet_zip.write(staged_filename, member.filename)
+
+                    os.remove(staged_filename)
+                else:
+                    with text_zip.open(member) as member_file:
+                        with parquet_zip.open(member, 'w') as copied_file:
+                            shutil.copyfileobj(member_file, copied_file)
+
+    os.remove(output_file)
+
+    return converted_filename
@@ -1,7 +1,5 @@
 # pylint: disable=line-too-long, no-member
 
-from builtins import str # pylint: disable=redefined-builtin
-
 import calendar
 import csv
 import datetime
@@ -9,7 +7,6 @@ import io
 import json
 import os
 import tempfile
-import time
 
 import pytz
 
@@ -62,40 +59,32 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                 else:
                     points = points.filter(created__lte=data_end)
 
-            points = points.order_by('source', 'created')
-
-            index = 0
-            count = points.count()
-
-            while index < count:
-                for point in points[index:(index + 5000)]:
-                    row = []
+            for point in points.keyset_iterator():
+                row = []
 
-                    created = point.created.astimezone(pytz.timezone(settings.TIME_ZONE))
-                    recorded = point.recorded.astimezone(pytz.timezone(settings.TIME_ZONE))
+                created = point.created.astimezone(pytz.timezone(settings.TIME_ZONE))
+                recorded = point.recorded.astimezone(pytz.timezone(settings.TIME_ZONE))
 
-                    row.append(point.source)
-                    row.append(calendar.timegm(point.created.utctimetuple()))
-                    row.append(created.isoformat())
+                row.append(point.source)
+                row.append(calendar.timegm(point.created.utctimetuple()))
+                row.append(created.isoformat())
 
-                    row.append(calendar.timegm(point.recorded.utctimetuple()))
-                    row.append(recorded.isoformat())
+                row.append(calendar.timegm(point.recorded.utctimetuple()))
+                row.append(recorded.isoformat())
 
-                    properties = {}
+                properties = {}
 
-                    if install_supports_jsonfield():
-                        properties = point.properties
-                    else:
-                        properties = json.loads(point.properties)
-
-                    row.append(properties['event_name'])
+                if install_supports_jsonfield():
+                    properties = point.properties
+                else:
+                    properties = json.loads(point.properties)
 
-                    if 'event_details' in properties:
-                        row.append(json.dumps(properties['event_details']))
+                row.append(properties['event_name'])
 
-                    writer.writerow(row)
+                if 'event_details' in properties:
+                    row.append(json.dumps(properties['event_details']))
 
-                index += 5000
+                writer.writerow(row)
 
     return filename
 
@@ -136,39 +125,7 @@ def compile_visualization(identifier, points, folder, source=None): # pylint: di
 
     start = now - datetime.timedelta(days=2)
 
-    points = points.filter(created__lte=now, created__gte=start).order_by('created')
-
-    end = start + datetime.timedelta(seconds=600)
-    point_index = 0
-    point_count = points.count()
-
-    point = None
-
-    if point_count > 0:
-        point = points[point_index]
-
-    timestamp_counts = {}
-
-    keys = []
-
-    while start < now:
-        timestamp = str(time.mktime(start.timetuple()))
-
-        keys.append(timestamp)
-
-        timestamp_counts[timestamp] = 0
-
-        while point is not None and point.created < end and point_index < (point_count - 1):
-            timestamp_counts[timestamp] += 1
-
-            point_index += 1
-
-            point = points[point_index]
-
-        start = end
-        end = start + datetime.timedelta(seconds=600)
-
-    timestamp_counts['keys'] = keys
+    timestamp_counts = points.timestamp_counts(start, now, 600)
 
     with io.open(folder + os.path.sep + 'timestamp-counts.json', 'w', encoding='utf-8') as outfile:
         outfile.write(json.dumps(timestamp_counts, indent=2, ensure_ascii=False))
@@ -2,8 +2,6 @@
 
 from __future__ import division
 
-from builtins import str # pylint: disable=redefined-builtin
-import calendar
 import datetime
 import io
 import json
@@ -58,12 +56,6 @@ def compile_visualization(identifier, points, folder, source): # pylint: disable
 
     start = now - datetime.timedelta(days=visualize_days)
 
-    end = start + datetime.timedelta(seconds=interval)
-
-    timestamp_counts = {}
-
-    keys = []
-
     if source is None:
         source = 'passive-data-kit'
 
@@ -71,17 +63,7 @@ def compile_visualization(identifier, points, folder, source): # pylint: disable
 
     points = DataPoint.objects.filter(source_reference=source_reference)
 
-    while start < now:
-        timestamp = str(calendar.timegm(start.timetuple()))
-
-        keys.append(timestamp)
-
-        timestamp_counts[timestamp] = points.filter(created__lte=end, created__gte=start).count()
-
-        start = end
-        end = start + datetime.timedelta(seconds=interval)
-
-    timestamp_counts['keys'] = keys
+    timestamp_counts = points.timestamp_counts(start, now, interval)
 
     with io.open(folder + os.path.sep + 'timestamp-counts.json', 'w', encoding='utf-8') as outfile:
         outfile.write(json.dumps(timestamp_counts, indent=2, ensure_ascii=False))
@@ -106,23 +88,7 @@ def compile_visualization(identifier, points, folder, source): # pylint: disable
 
     start = now - datetime.timedelta(days=visualize_days)
 
-    end = start + datetime.timedelta(seconds=interval)
-
-    timestamp_counts = {}
-
-    keys = []
-
-    while start < now:
-        timestamp = str(calendar.timegm(start.timetuple()))
-
-        keys.append(timestamp)
-
-        timestamp_counts[timestamp] = points.filter(recorded__lte=end, recorded__gte=start).count()
-
-        start = end
-        end = start + datetime.timedelta(seconds=interval)
-
-    timestamp_counts['keys'] = keys
+    timestamp_counts = points.timestamp_counts(start, now, interval, field='recorded')
 
     with io.open(folder + os.path.sep + 'timestamp-recorded-counts.json', 'w', encoding='utf-8') as outfile:
         outfile.write(json.dumps(timestamp_counts, indent=2, ensure_ascii=False))
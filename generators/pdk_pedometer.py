@@ -111,42 +111,10 @@ def compile_frequency_visualization(identifier, points, folder): # pylint: disab
 
     start = now - datetime.timedelta(days=7)
 
-    points = points.filter(created__lte=now, created__gte=start).order_by('created')
+    timestamp_counts = points.timestamp_counts(start, now, 600)
 
-    end = start + datetime.timedelta(seconds=600)
-    point_index = 0
-    point_count = points.count()
-
-    point = None
-
-    if point_count > 0:
-        point = points[point_index]
-
-    timestamp_counts = {}
-
-    keys = []
-
-    while start < now:
-        timestamp = str(calendar.timegm(start.timetuple()))
-
-        keys.append(timestamp)
-
-        timestamp_counts[timestamp] = 0
-
-        while point is not None and point.created < end and point_index < (point_count - 1):
-            timestamp_counts[timestamp] += 1
-
-            point_index += 1
-
-            point = points[point_index]
-
-        start = end
-        end = start + datetime.timedelta(seconds=600)
-
-    timestamp_counts['keys'] = keys
-
-    with io.open(folder + os.path.sep + 'timestamp-counts.json', 'wb') as outfile:
-        json.dump(timestamp_counts, outfile, indent=2)
+    with io.open(folder + os.path.sep + 'timestamp-counts.json', 'w', encoding='utf-8') as outfile:
+        outfile.write(json.dumps(timestamp_counts, indent=2, ensure_ascii=False))
 
 def data_table(source, generator):
     context = {}
@@ -9,6 +9,7 @@ import calendar
 import csv
 import datetime
 import io
+import itertools
 import json
 import math
 import os
@@ -46,16 +47,11 @@ def compile_frequency_visualization(identifier, points, folder): # pylint: disab
 
     start = now - datetime.timedelta(days=2)
 
-    points = list(points.filter(created__lte=now, created__gte=start).order_by('created'))
+    point_iterator = points.filter(created__lte=now, created__gte=start).keyset_iterator(batch_size=1000)
 
     end = start + datetime.timedelta(seconds=600)
-    point_index = 0
-    point_count = len(points)
 
-    point = None
-
-    if point_count > 0:
-        point = points[point_index]
+    point = next(point_iterator, None)
 
     timestamp_counts = {}
 
@@ -68,7 +64,7 @@ def compile_frequency_visualization(identifier, points, folder): # pylint: disab
 
         timestamp_counts[timestamp] = 0
 
-        while point is not None and point.created < end and point_index < (point_count - 1):
+        while point is not None and point.created < end:
             properties = point.fetch_properties()
 
             if 'sensor_data' in properties:
@@ -86,9 +82,7 @@ def compile_frequency_visualization(identifier, points, folder): # pylint: disab
                 except TypeError:
                     pass
 
-            point_index += 1
-
-            point = points[point_index]
+            point = next(point_iterator, None)
 
         start = end
         end = start + datetime.timedelta(seconds=600)
@@ -113,11 +107,7 @@ def compile_visualization(identifier, points, folder, source=None): # pylint: di
 
     points = points.filter(created__gte=start)
 
-    point_ids = points.values_list('pk', flat=True).order_by('created')
-
-    for point_id in point_ids:
-        point = DataPoint.objects.get(pk=point_id)
-
+    for point in points.keyset_iterator(batch_size=1000):
         properties = point.fetch_properties()
 
         if 'sensor_data' in properties:
@@ -205,12 +195,12 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                 else:
                     points = points.filter(created__lte=data_end)
 
-            points = points.order_by('source', 'created')
-
             points_count = float(points.count())
 
             splits = int(math.ceil(old_div(points_count, SPLIT_SIZE)))
 
+            point_iterator = points.keyset_iterator(batch_size=1000)
+
             for split_index in range(0, splits):
                 identifier = slugify(generator + '__' + source)
 
@@ -238,56 +228,51 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
 
                     writer.writerow(columns)
 
-                    index = split_index * SPLIT_SIZE
-
-                    while index < (split_index + 1) * SPLIT_SIZE and index < points_count:
-                        for point in points[index:(index + 1000)]:
-                            properties = point.fetch_properties()
-
-                            if 'observed' in properties['sensor_data']:
-                                for i in range(0, len(properties['sensor_data']['observed'])):
-                                    row = []
+                    for point in itertools.islice(point_iterator, SPLIT_SIZE):
+                        properties = point.fetch_properties()
 
-                                    row.append(point.source)
-                                    row.append(calendar.timegm(point.created.utctimetuple()))
-                                    row.append(point.created.isoformat())
+                        if 'observed' in properties['sensor_data']:
+                            for i in range(0, len(properties['sensor_data']['observed'])):
+                                row = []
 
-                                    row.append(calendar.timegm(point.recorded.utctimetuple()))
-                                    row.append(point.recorded.isoformat())
+                                row.append(point.source)
+                                row.append(calendar.timegm(point.created.utctimetuple()))
+                                row.append(point.created.isoformat())
 
-                                    try:
-                                        row.append(properties['sensor_data']['raw_timestamp'][i])
-                                    except IndexError:
-                                        row.append('')
+                                row.append(calendar.timegm(point.recorded.utctimetuple()))
+                                row.append(point.recorded.isoformat())
 
-                                    try:
-                                        row.append(properties['sensor_data']['observed'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['raw_timestamp'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    try:
-                                        row.append(properties['sensor_data']['x'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['observed'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    try:
-                                        row.append(properties['sensor_data']['y'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['x'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    try:
-                                        row.append(properties['sensor_data']['z'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['y'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    try:
-                                        row.append(properties['sensor_data']['accuracy'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['z'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    writer.writerow(row)
+                                try:
+                                    row.append(properties['sensor_data']['accuracy'][i])
+                                except IndexError:
+                                    row.append('')
 
-                        index += 1000
+                                writer.writerow(row)
 
                 source_name = source
 
@@ -9,6 +9,7 @@ import calendar
 import csv
 import datetime
 import io
+import itertools
 import math
 import os
 import tempfile
@@ -132,12 +133,12 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                 else:
                     points = points.filter(created__lte=data_end)
 
-            point_ids = points.values_list('pk', flat=True).order_by('created')
-
-            points_count = len(point_ids)
+            points_count = points.count()
 
             splits = int(math.ceil(old_div(points_count, SPLIT_SIZE)))
 
+            point_iterator = points.keyset_iterator(batch_size=1000)
+
             for split_index in range(0, splits):
                 identifier = slugify(generator + '__' + source)
 
@@ -163,48 +164,41 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
 
                     writer.writerow(columns)
 
-                    index = split_index * SPLIT_SIZE
-
-                    while index < (split_index + 1) * SPLIT_SIZE and index < points_count:
-                        for point_id in point_ids[index:(index + 1000)]:
-                            point = DataPoint.objects.get(pk=point_id)
-
-                            properties = point.fetch_properties()
-
-                            if 'observed' in properties['sensor_data']:
-                                for i in range(0, len(properties['sensor_data']['observed'])):
-                                    row = []
+                    for point in itertools.islice(point_iterator, SPLIT_SIZE):
+                        properties = point.fetch_properties()
 
-                                    row.append(point.source)
-                                    row.append(calendar.timegm(point.created.utctimetuple()))
-                                    row.append(point.created.isoformat())
+                        if 'observed' in properties['sensor_data']:
+                            for i in range(0, len(properties['sensor_data']['observed'])):
+                                row = []
 
-                                    row.append(calendar.timegm(point.recorded.utctimetuple()))
-                                    row.append(point.recorded.isoformat())
+                                row.append(point.source)
+                                row.append(calendar.timegm(point.created.utctimetuple()))
+                                row.append(point.created.isoformat())
 
-                                    try:
-                                        row.append(properties['sensor_data']['raw_timestamp'][i])
-                                    except IndexError:
-                                        row.append('')
+                                row.append(calendar.timegm(point.recorded.utctimetuple()))
+                                row.append(point.recorded.isoformat())
 
-                                    try:
-                                        row.append(properties['sensor_data']['observed'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['raw_timestamp'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    try:
-                                        row.append(properties['sensor_data']['light_level'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['observed'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    try:
-                                        row.append(properties['sensor_data']['accuracy'][i])
-                                    except IndexError:
-                                        row.append('')
+                                try:
+                                    row.append(properties['sensor_data']['light_level'][i])
+                                except IndexError:
+                                    row.append('')
 
-                                    writer.writerow(row)
+                                try:
+                                    row.append(properties['sensor_data']['accuracy'][i])
+                                except IndexError:
+                                    row.append('')
 
-                        index += 1000
+                                writer.writerow(row)
 
                 source_name = source
 
@@ -2,8 +2,6 @@
 
 from __future__ import division
 
-from builtins import str # pylint: disable=redefined-builtin
-
 import calendar
 import csv
 import datetime
@@ -11,7 +9,6 @@ import io
 import json
 import os
 import tempfile
-import time
 
 from past.utils import old_div
 
@@ -71,43 +68,35 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                 else:
                     points = points.filter(created__lte=data_end)
 
-            points = points.order_by('source', 'created')
-
-            index = 0
-            count = points.count()
-
-            while index < count:
-                for point in points[index:(index + 5000)]:
-                    properties = point.fetch_properties()
+            for point in points.keyset_iterator():
+                properties = point.fetch_properties()
 
-                    point_tz = pytz.timezone(settings.TIME_ZONE)
+                point_tz = pytz.timezone(settings.TIME_ZONE)
 
-                    if 'timezone' in properties['passive-data-metadata']:
-                        point_tz = pytz.timezone(properties['passive-data-metadata']['timezone'])
+                if 'timezone' in properties['passive-data-metadata']:
+                    point_tz = pytz.timezone(properties['passive-data-metadata']['timezone'])
 
-                    created = datetime.datetime.fromtimestamp(old_div(properties['date'], 1000), tz=default_tz)
+                created = datetime.datetime.fromtimestamp(old_div(properties['date'], 1000), tz=default_tz)
 
-                    row = []
+                row = []
 
-                    created = created.astimezone(point_tz)
-                    recorded = point.recorded.astimezone(point_tz)
+                created = created.astimezone(point_tz)
+                recorded = point.recorded.astimezone(point_tz)
 
-                    row.append(point.source)
-                    row.append(calendar.timegm(created.utctimetuple()))
-                    row.append(created.isoformat())
+                row.append(point.source)
+                row.append(calendar.timegm(created.utctimetuple()))
+                row.append(created.isoformat())
 
-                    row.append(calendar.timegm(point.recorded.utctimetuple()))
-                    row.append(recorded.isoformat())
+                row.append(calendar.timegm(point.recorded.utctimetuple()))
+                row.append(recorded.isoformat())
 
-                    row.append(properties['direction'])
-                    row.append(properties['person'])
-                    row.append(properties['address'])
-                    row.append(properties['length'])
-                    row.append(properties['body'])
+                row.append(properties['direction'])
+                row.append(properties['person'])
+                row.append(properties['address'])
+                row.append(properties['length'])
+                row.append(properties['body'])
 
-                    writer.writerow(row)
-
-                index += 5000
+                writer.writerow(row)
 
     return filename
 
@@ -144,39 +133,7 @@ def compile_visualization(identifier, points, folder, source=None): # pylint: di
 
     start = now - datetime.timedelta(days=30)
 
-    points = points.filter(created__lte=now, created__gte=start).order_by('created')
-
-    end = start + datetime.timedelta(hours=1)
-    point_index = 0
-    point_count = points.count()
-
-    point = None
-
-    if point_count > 0:
-        point = points[point_index]
-
-    timestamp_counts = {}
-
-    keys = []
-
-    while start < now:
-        timestamp = str(time.mktime(start.timetuple()))
-
-        keys.append(timestamp)
-
-        timestamp_counts[timestamp] = 0
-
-        while point is not None and point.created < end and point_index < (point_count - 1):
-            timestamp_counts[timestamp] += 1
-
-            point_index += 1
-
-            point = points[point_index]
-
-        start = end
-        end = start + datetime.timedelta(hours=1)
-
-    timestamp_counts['keys'] = keys
+    timestamp_counts = points.timestamp_counts(start, now, 3600)
 
     with io.open(folder + os.path.sep + 'timestamp-counts.json', 'w', encoding='utf-8') as outfile:
         outfile.write(json.dumps(timestamp_counts, indent=2, ensure_ascii=False))
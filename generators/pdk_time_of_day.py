@@ -186,35 +186,27 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                 if data_end is not None:
                     points = points.filter(created__lte=data_end)
 
-                points = points.order_by('created')
+                for point in points.keyset_iterator(batch_size=500):
+                    properties = point.fetch_properties()
 
-                index = 0
-                count = points.count()
+                    row = []
 
-                while index < count:
-                    for point in points[index:(index + 500)]:
-                        properties = point.fetch_properties()
+                    row.append(point.source)
+                    row.append(calendar.timegm(point.created.utctimetuple()))
+                    row.append(point.created.isoformat())
 
-                        row = []
+                    row.append(calendar.timegm(point.recorded.utctimetuple()))
+                    row.append(point.recorded.isoformat())
 
-                        row.append(point.source)
-                        row.append(calendar.timegm(point.created.utctimetuple()))
-                        row.append(point.created.isoformat())
+                    row.append(properties['sunrise'])
+                    row.append(properties['sunset'])
 
-                        row.append(calendar.timegm(point.recorded.utctimetuple()))
-                        row.append(point.recorded.isoformat())
-
-                        row.append(properties['sunrise'])
-                        row.append(properties['sunset'])
-
-                        if (properties['observed'] > properties['sunrise']) and (properties['observed'] < properties['sunset']):
-                            row.append(1)
-                        else:
-                            row.append(0)
-
-                        writer.writerow(row)
+                    if (properties['observed'] > properties['sunrise']) and (properties['observed'] < properties['sunset']):
+                        row.append(1)
+                    else:
+                        row.append(0)
 
-                    index += 500
+                    writer.writerow(row)
 
             export_file.write(secondary_filename, slugify(generator) + '/' + slugify(source) + '.txt')
 
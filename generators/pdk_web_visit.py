@@ -6,12 +6,10 @@ from builtins import str # pylint: disable=redefined-builtin
 
 import csv
 import calendar
-import datetime
 import io
 import json
 import os
 import tempfile
-import time
 
 from zipfile import ZipFile
 
@@ -142,44 +140,11 @@ def visualization(source, generator): # pylint: disable=unused-argument
 def compile_visualization(identifier, points, folder): # pylint: disable=unused-argument, too-many-locals
     now = timezone.now()
 
-    points = list(points.order_by('-created'))
-    points.reverse()
-
-    first = points[0]
+    first = points.order_by('created').first()
 
     start = first.created.replace(minute=0, second=0, microsecond=0)
 
-    end = start + datetime.timedelta(hours=1)
-    point_index = 0
-    point_count = len(points)
-
-    point = None
-
-    if point_count > 0:
-        point = points[point_index]
-
-    timestamp_counts = {}
-
-    keys = []
-
-    while start < now:
-        timestamp = str(time.mktime(start.timetuple()))
-
-        keys.append(timestamp)
-
-        timestamp_counts[timestamp] = 0
-
-        while point is not None and point.created < end and point_index < (point_count - 1):
-            timestamp_counts[timestamp] += 1
-
-            point_index += 1
-
-            point = points[point_index]
-
-        start = end
-        end = start + datetime.timedelta(hours=1)
-
-    timestamp_counts['keys'] = keys
+    timestamp_counts = points.timestamp_counts(start, now, 3600)
 
     with io.open(folder + os.path.sep + 'timestamp-counts.json', 'w', encoding='utf-8') as outfile:
-        json.dump(timestamp_counts, outfile, indent=2)
+        outfile.write(json.dumps(timestamp_counts, indent=2, ensure_ascii=False))
@@ -122,32 +122,24 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                             else:
                                 points = points.filter(created__lte=data_end)
 
-                        points = points.order_by('source', 'created')
+                        for point in points.keyset_iterator():
+                            row = []
 
-                        index = 0
-                        count = points.count()
+                            row.append(point.source)
+                            row.append(calendar.timegm(point.created.utctimetuple()))
+                            row.append(point.created.isoformat())
+                            row.append(calendar.timegm(point.recorded.utctimetuple()))
+                            row.append(point.recorded.isoformat())
 
-                        while index < count:
-                            for point in points[index:(index + 5000)]:
-                                row = []
+                            properties = point.fetch_properties()
 
-                                row.append(point.source)
-                                row.append(calendar.timegm(point.created.utctimetuple()))
-                                row.append(point.created.isoformat())
-                                row.append(calendar.timegm(point.recorded.utctimetuple()))
-                                row.append(point.recorded.isoformat())
+                            for column in identifier_columns:
+                                if column in properties:
+                                    row.append(properties[column])
+                                else:
+                                    row.append('')
 
-                                properties = point.fetch_properties()
-
-                                for column in identifier_columns:
-                                    if column in properties:
-                                        row.append(properties[column])
-                                    else:
-                                        row.append('')
-
-                                writer.writerow(row)
-
-                            index += 5000
+                            writer.writerow(row)
 
                 export_file.write(secondary_filename, secondary_filename.split(os.path.sep)[-1])
 
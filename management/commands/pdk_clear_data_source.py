@@ -114,33 +114,13 @@ class Command(BaseCommand):
 
         points_query = DataPoint.objects.filter(source=source)
 
-        index = 0
-        total = points_query.count()
+        to_delete = list(points_query.values_list('pk', flat=True))
 
-        print('Matching DataPoint objects by source identifier: ' + str(total))
+        print('Matching DataPoint objects by source identifier: ' + str(len(to_delete)))
 
-        to_delete = []
+        deleted = DataPoint.objects.purge_points(to_delete)
 
-        while index < total:
-            print('Queuing DataPoint objects for deletion: ' + str(index) + ' of ' + str(total))
-
-            for point in points_query.order_by('pk')[index:(index + PAGE_SIZE)]:
-                to_delete.append(point.pk)
-
-            index += PAGE_SIZE
-
-        index = 0
-        total = len(to_delete)
-
-        while index < total:
-            print('Removing DataPoint objects: ' + str(index) + ' of ' + str(total))
-
-            for point_pk in to_delete[index:(index + PAGE_SIZE)]:
-                DataPoint.objects.get(pk=point_pk).delete()
-
-            index += PAGE_SIZE
-
-        print('Removed ' + str(len(to_delete)) + ' DataPoint objects by source match.')
+        print('Removed ' + str(deleted) + ' DataPoint objects by source match.')
 
         source_obj = DataSource.objects.filter(identifier=source).first()
 
@@ -8,331 +8,414 @@ from builtins import str # pylint: disable=redefined-builtin
 import datetime
 import importlib
 import io
+import itertools
 import json
 import logging
+import multiprocessing
 import os
+import shutil
 import tempfile
 import traceback
 import zipfile
 
-import zipstream
-
 import pytz
 
 from django.conf import settings
 from django.core.files import File
 from django.core.mail import send_mail
 from django.core.management.base import BaseCommand
+from django.db import connections, transaction, DatabaseError
 from django.template.loader import render_to_string
 from django.utils import timezone
 
+from ...columnar_export import EXPORT_FORMATS, convert_report
 from ...decorators import handle_lock, log_scheduled_event
 from ...models import DataPoint, ReportJob, ReportJobBatchRequest, DataGeneratorDefinition, DataSourceReference, DataSource
+from ...zip_assembly import ZipAssembler
 
 REMOVE_SLEEP_MAX = 60 # Added to avoid "WindowsError: [Error 32] The process cannot access the file because it is being used by another process"
 
-class Command(BaseCommand):
-    help = 'Compiles data reports requested by end users.'
+def compile_generator_report(task):
+    # Runs one generator's compile_report inside a private temporary directory, since several
+    # generators stage their files under fixed names. The directory is returned for cleanup.
 
-    def add_arguments(self, parser):
-        pass
+    generator, sources, data_start, data_end, date_type, export_format = task
 
-    @handle_lock
-    @log_scheduled_event
-    def handle(self, *args, **options): # pylint: disable=too-many-locals,too-many-branches,too-many-statements
-        os.umask(000)
+    parent_tempdir = tempfile.tempdir
+    generator_tempdir = tempfile.mkdtemp(prefix='pdk_generator_')
 
-        pending = ReportJob.objects.filter(started=None, completed=None)
+    tempfile.tempdir = generator_tempdir
 
-        while pending.count() > 0:
-            report = ReportJob.objects.filter(started=None, completed=None)\
-                                      .order_by('-priority', 'requested', 'pk')\
-                                      .first()
+    output_file = None
 
-            if report is not None:
-                report.started = timezone.now()
-                report.save()
+    try:
+        for app in settings.INSTALLED_APPS:
+            if output_file is None:
+                try:
+                    pdk_api = importlib.import_module(app + '.pdk_api')
 
-                parameters = report.fetch_parameters()
+                    try:
+                        logging.info('pdk_compile_reports: Exporting for %s: %s.%s.', sources, app, generator)
+
+                        output_file = pdk_api.compile_report(generator, sources, data_start=data_start, data_end=data_end, date_type=date_type)
+                    except TypeError as exception:
+                        traceback.print_exc()
+                        logging.warning('Verify that %s.%s implements all compile_report arguments!', app, generator)
+                        raise exception
+                except ImportError:
+                    output_file = None
+                except AttributeError:
+                    output_file = None
+    finally:
+        tempfile.tempdir = parent_tempdir
 
-                sources = parameters['sources']
-                generators = parameters['generators']
+    if output_file is not None:
+        output_file = os.path.normpath(output_file)
 
-                data_start = None
-                data_end = None
+        if export_format == 'parquet' and generator != 'pdk-personal-data':
+            output_file = convert_report(output_file)
 
-                tz_info = pytz.timezone(settings.TIME_ZONE)
+    return (output_file, generator_tempdir)
 
-                if 'data_start' in parameters and parameters['data_start']:
-                    tokens = parameters['data_start'].split('/')
+def compile_generator_reports(tasks, workers):
+    # Pool workers are daemonic and may not fork children of their own, so jobs compiled by
+    # parallel report workers run their generators in sequence.
 
-                    data_start = datetime.datetime(int(tokens[2]), \
-                                                   int(tokens[0]), \
-                                                   int(tokens[1]), \
-                                                   0, \
-                                                   0, \
-                                                   0, \
-                                                   0).astimezone(tz_info)
+    if workers > 1 and len(tasks) > 1 and multiprocessing.current_process().daemon is False:
+        # Forked children must not share the parent's database sockets.
 
-                if 'data_end' in parameters and parameters['data_end']:
-                    tokens = parameters['data_end'].split('/')
+        for connection in connections.all():
+            connection.close()
 
-                    data_end = datetime.datetime(int(tokens[2]), \
-                                                 int(tokens[0]), \
-                                                 int(tokens[1]), \
-                                                 23, \
-                                                 59, \
-                                                 59, \
-                                                 999999).astimezone(tz_info)
+        pool = multiprocessing.Pool(processes=min(workers, len(tasks))) # pylint: disable=consider-using-with
 
-                date_type = 'created'
+        try:
+            return pool.map(compile_generator_report, tasks, 1)
+        finally:
+            pool.close()
+            pool.join()
 
-                if 'date_type' in parameters and parameters['date_type']:
-                    date_type = parameters['date_type']
+    return [compile_generator_report(task) for task in tasks]
 
-                raw_json = False
+RAW_JSON_BATCH_SIZE = 500
 
-                if ('raw_data' in parameters) and (parameters['raw_data'] is True or parameters['raw_data'] == 'on'):
-                    raw_json = True
+def raw_json_array(points):
+    # Encodes points as a JSON array a few hundred at a time, so no day is held in memory whole.
 
-                prefix = 'pdk_export_final'
+    yield b'['
 
-                if 'prefix' in parameters:
-                    prefix = parameters['prefix']
+    separator = ''
+    batch = []
 
-                suffix = report.started.date().isoformat()
+    for point in points:
+        batch.append(separator + json.dumps(point.fetch_properties()))
 
-                if 'suffix' in parameters:
-                    suffix = parameters['suffix']
+        separator = ', '
 
-                filename = tempfile.gettempdir() + os.path.sep + prefix + '_' + str(report.pk) + '_' + suffix + '.zip'
+        if len(batch) >= RAW_JSON_BATCH_SIZE:
+            yield ''.join(batch).encode('utf-8')
 
-                zips_to_merge = []
+            batch = []
 
-                excluded_sources = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
 
-                try:
-                    excluded_sources = settings.PDK_EXCLUDED_SOURCES
-                except AttributeError:
-                    pass
+    yield b']'
+
+def raw_json_day_files(source, generator, points):
+    # Reads the points through one ordered server-side cursor and yields a (filename, content)
+    # pair per day. Both are consumed lazily while the export archive is being written.
+
+    point_iterator = points.order_by('created', 'pk').iterator()
+
+    for day, day_points in itertools.groupby(point_iterator, key=lambda point: point.created.date()):
+        yield (source + '__' + generator + '__' + day.isoformat() + '.json', raw_json_array(day_points))
+
+def compile_report_job(report, generator_workers=1): # pylint: disable=too-many-locals,too-many-branches,too-many-statements
+    parameters = report.fetch_parameters()
+
+    sources = parameters['sources']
+    generators = parameters['generators']
+
+    data_start = None
+    data_end = None
+
+    tz_info = pytz.timezone(settings.TIME_ZONE)
+
+    if 'data_start' in parameters and parameters['data_start']:
+        tokens = parameters['data_start'].split('/')
+
+        data_start = datetime.datetime(int(tokens[2]), \
+                                       int(tokens[0]), \
+                                       int(tokens[1]), \
+                                       0, \
+                                       0, \
+                                       0, \
+                                       0).astimezone(tz_info)
+
+    if 'data_end' in parameters and parameters['data_end']:
+        tokens = parameters['data_end'].split('/')
+
+        data_end = datetime.datetime(int(tokens[2]), \
+                                     int(tokens[0]), \
+                                     int(tokens[1]), \
+                                     23, \
+                                     59, \
+                                     59, \
+                                     999999).astimezone(tz_info)
+
+    date_type = 'created'
 
-                for excluded_source in excluded_sources:
-                    while excluded_source in sources:
-                        sources.remove(excluded_source)
+    if 'date_type' in parameters and parameters['date_type']:
+        date_type = parameters['date_type']
 
-                with open(filename, 'wb') as final_output_file:
-                    to_delete = []
+    raw_json = False
 
-                    with zipstream.ZipFile(mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as export_stream: # pylint: disable=line-too-long
-                        for generator in generators: # pylint: disable=too-many-nested-blocks
-                            logging.info('pdk_compile_reports: Exporting %s for %s.', generator, sources)
+    if ('raw_data' in parameters) and (parameters['raw_data'] is True or parameters['raw_data'] == 'on'):
+        raw_json = True
 
-                            if raw_json:
-                                for source in sources:
-                                    data_source = DataSource.objects.filter(identifier=source).first()
+    export_format = 'tsv'
 
-                                    if data_source is not None and data_source.server is None:
-                                        generator_definition = DataGeneratorDefinition.definition_for_identifier(generator)
-                                        source_reference = DataSourceReference.reference_for_source(source)
+    if 'export_format' in parameters and parameters['export_format'] in EXPORT_FORMATS:
+        export_format = parameters['export_format']
 
-                                        points = DataPoint.objects.filter(source_reference=source_reference, generator_definition=generator_definition)
+    prefix = 'pdk_export_final'
 
-                                        if data_start is not None:
-                                            if date_type == 'recorded':
-                                                points = points.filter(recorded__gte=data_start)
-                                            else:
-                                                points = points.filter(created__gte=data_start)
+    if 'prefix' in parameters:
+        prefix = parameters['prefix']
 
-                                        if data_end is not None:
-                                            if date_type == 'recorded':
-                                                points = points.filter(recorded__lte=data_end)
-                                            else:
-                                                points = points.filter(created__lte=data_end)
+    suffix = report.started.date().isoformat()
 
-                                        points = points.order_by('created')
+    if 'suffix' in parameters:
+        suffix = parameters['suffix']
 
-                                        first = points.first() # pylint: disable=line-too-long
-                                        last = points.last() # pylint: disable=line-too-long
+    filename = tempfile.gettempdir() + os.path.sep + prefix + '_' + str(report.pk) + '_' + suffix + '.zip'
 
-                                        if first is not None:
-                                            first_create = first.created
-                                            last_create = last.created
+    excluded_sources = []
 
-                                            start = datetime.datetime(first_create.year, \
-                                                                      first_create.month, \
-                                                                      first_create.day, \
-                                                                      0, \
-                                                                      0, \
-                                                                      0, \
-                                                                      0, \
-                                                                      first_create.tzinfo)
+    try:
+        excluded_sources = settings.PDK_EXCLUDED_SOURCES
+    except AttributeError:
+        pass
+
+    for excluded_source in excluded_sources:
+        while excluded_source in sources:
+            sources.remove(excluded_source)
+
+    compiled_reports = {}
+    generator_tempdirs = []
+
+    if raw_json is False:
+        tasks = [(generator, sources, data_start, data_end, date_type, export_format) for generator in generators]
 
-                                            end = datetime.datetime(last_create.year, \
-                                                                    last_create.month, \
-                                                                    last_create.day, \
-                                                                    0, \
-                                                                    0, \
-                                                                    0, \
-                                                                    0, \
-                                                                    first_create.tzinfo) + \
-                                                                    datetime.timedelta(days=1)
+        for generator, (output_file, generator_tempdir) in zip(generators, compile_generator_reports(tasks, generator_workers)):
+            compiled_reports[generator] = output_file
+            generator_tempdirs.append(generator_tempdir)
 
-                                            if data_start is not None and data_start > start:
-                                                start = data_start
+    with open(filename, 'wb') as final_output_file:
+        to_delete = []
 
-                                            if data_end is not None and data_end < end:
-                                                end = data_end
+        with ZipAssembler(mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as export_stream: # pylint: disable=line-too-long
+            for generator in generators: # pylint: disable=too-many-nested-blocks
+                logging.info('pdk_compile_reports: Exporting %s for %s.', generator, sources)
 
-                                            while start <= end:
-                                                day_end = start + datetime.timedelta(days=1)
+                if raw_json:
+                    for source in sources:
+                        data_source = DataSource.objects.filter(identifier=source).first()
 
-                                                day_filename = source + '__' + generator + '__' + \
-                                                               start.date().isoformat() + '.json'
+                        if data_source is not None and data_source.server is None:
+                            generator_definition = DataGeneratorDefinition.definition_for_identifier(generator)
+                            source_reference = DataSourceReference.reference_for_source(source)
 
-                                                points = DataPoint.objects.filter(source_reference=source_reference, generator_definition=generator_definition, created__gte=start, created__lt=day_end).order_by('created') # pylint: disable=line-too-long
+                            points = DataPoint.objects.filter(source_reference=source_reference, generator_definition=generator_definition)
 
-                                                out_points = []
+                            if data_start is not None:
+                                if date_type == 'recorded':
+                                    points = points.filter(recorded__gte=data_start)
+                                else:
+                                    points = points.filter(created__gte=data_start)
 
-                                                for point in points:
-                                                    out_points.append(point.fetch_properties())
+                            if data_end is not None:
+                                if date_type == 'recorded':
+                                    points = points.filter(recorded__lte=data_end)
+                                else:
+                                    points = points.filter(created__lte=data_end)
 
-                                                if out_points:
-                                                    export_stream.writestr(day_filename, str(json.dumps(out_points, indent=2)).encode("utf-8")) # pylint: disable=line-too-long
+                            export_stream.write_iter_files(raw_json_day_files(source, generator, points))
+                else:
+                    output_file = compiled_reports[generator]
 
-                                                start = day_end
+                    if output_file is not None:
+                        if generator != 'pdk-personal-data':
+                            if output_file.lower().endswith('.zip'):
+                                export_stream.write_zip(output_file)
+
+                                to_delete.append(output_file)
                             else:
-                                output_file = None
+                                name = os.path.basename(os.path.normpath(output_file))
 
-                                for app in settings.INSTALLED_APPS:
-                                    if output_file is None:
-                                        try:
-                                            pdk_api = importlib.import_module(app + '.pdk_api')
+                                export_stream.write(output_file, name, compress_type=zipfile.ZIP_DEFLATED)
 
-                                            try:
-                                                logging.info('pdk_compile_reports: Exporting for %s: %s.%s.', sources, app, generator)
+                                to_delete.append(output_file)
+                        else:
+                            name = os.path.basename(os.path.normpath(output_file))
 
-                                                output_file = pdk_api.compile_report(generator, sources, data_start=data_start, data_end=data_end, date_type=date_type)
+                            export_stream.write(output_file, name, compress_type=zipfile.ZIP_DEFLATED)
 
-                                                if output_file is not None:
-                                                    output_file = os.path.normpath(output_file)
+            for data in export_stream:
+                final_output_file.write(data)
 
-                                                    if generator != 'pdk-personal-data':
-                                                        if output_file.lower().endswith('.zip'):
-                                                            zips_to_merge.append(output_file)
+    for output_file in to_delete:
+        remove_sleep = 1.0
 
-                                                            # with zipfile.ZipFile(output_file, 'r') as source_file:
-                                                            #    for name in source_file.namelist():
-                                                            #        data_file = source_file.open(name)
+        while remove_sleep < REMOVE_SLEEP_MAX:
+            try:
+                os.remove(output_file)
 
-                                                            #        export_stream.write_iter(name, data_file, compress_type=zipfile.ZIP_DEFLATED)
-                                                        else:
-                                                            name = os.path.basename(os.path.normpath(output_file))
+                remove_sleep = REMOVE_SLEEP_MAX
+            except OSError:
+                remove_sleep = remove_sleep * 2
 
-                                                            export_stream.write(output_file, name, compress_type=zipfile.ZIP_DEFLATED)
+                if remove_sleep >= REMOVE_SLEEP_MAX:
+                    traceback.print_exc()
 
-                                                            to_delete.append(output_file)
-                                                    else:
-                                                        name = os.path.basename(os.path.normpath(output_file))
+    for generator_tempdir in generator_tempdirs:
+        shutil.rmtree(generator_tempdir, ignore_errors=True)
 
-                                                        export_stream.write(output_file, name, compress_type=zipfile.ZIP_DEFLATED)
-                                            except TypeError as exception:
-                                                traceback.print_exc()
-                                                logging.warning('Verify that %s.%s implements all compile_report arguments!', app, generator)
-                                                raise exception
-                                        except ImportError:
-                                            output_file = None
-                                        except AttributeError:
-                                            output_file = None
+    report.completed = timezone.now()
 
-                        for data in export_stream:
-                            final_output_file.write(data)
+    with io.open(filename, 'rb') as report_file:
+        report.report.save(filename.split(os.path.sep)[-1], File(report_file))
 
-                if zips_to_merge:
-                    with zipfile.ZipFile(filename, 'a', compression=zipfile.ZIP_BZIP2) as zip_output:
-                        for zip_filename in zips_to_merge:
-                            with zipfile.ZipFile(zip_filename, 'r') as zip_file:
-                                for child_file in zip_file.namelist():
-                                    child_filename = tempfile.gettempdir() + os.path.sep + child_file
+    report.save()
 
-                                    logging.info('pdk_compile_reports: Extracting %s to %s.', child_file, child_filename)
+    if report.requester.email is not None:
+        subject = render_to_string('pdk_report_subject.txt', {
+            'report': report,
+            'url': settings.SITE_URL
+        })
 
-                                    zip_file.extract(child_file, path=tempfile.gettempdir())
+        if 'email_subject' in parameters:
+            subject = parameters['email_subject']
 
-                                    logging.info('pdk_compile_reports: Extracted %s to %s.', child_file, child_filename)
+        message = render_to_string('pdk_report_message.txt', {
+            'report': report,
+            'url': settings.SITE_URL
+        })
 
-                                    zip_output.write(child_filename, child_file, compress_type=zipfile.ZIP_BZIP2)
+        tokens = settings.SITE_URL.split('/')
+        host = ''
 
-                                    logging.info('pdk_compile_reports: Finished writing %s.', child_file)
+        while tokens and tokens[-1] == '':
+            tokens.pop()
 
-                                    os.remove(child_filename)
+        if tokens:
+            host = tokens[-1]
 
-                            to_delete.append(zip_filename)
+        send_mail(subject, \
+                  message, \
+                  'Petey Kay <noreply@' + host + '>', \
+                  [report.requester.email], \
+                  fail_silently=False)
 
-                for output_file in to_delete:
-                    remove_sleep = 1.0
+    for extra_destination in report.requester.pdk_report_destinations.all():
+        extra_destination.transmit(report, filename)
 
-                    while remove_sleep < REMOVE_SLEEP_MAX:
-                        try:
-                            os.remove(output_file)
+    remove_sleep = 1.0
 
-                            remove_sleep = REMOVE_SLEEP_MAX
-                        except OSError:
-                            remove_sleep = remove_sleep * 2
+    while remove_sleep < REMOVE_SLEEP_MAX:
+        try:
+            os.remove(filename)
 
-                            if remove_sleep >= REMOVE_SLEEP_MAX:
-                                traceback.print_exc()
+            remove_sleep = REMOVE_SLEEP_MAX
+        except OSError:
+            remove_sleep = remove_sleep * 2
 
-                report.completed = timezone.now()
+            if remove_sleep >= REMOVE_SLEEP_MAX:
+                traceback.print_exc()
 
-                with io.open(filename, 'rb') as report_file:
-                    report.report.save(filename.split(os.path.sep)[-1], File(report_file))
+def claim_report_job():
+    # Marks the next pending job as started inside a row lock. Rows locked by other workers or
+    # hosts are skipped, so each job is compiled exactly once.
 
-                report.save()
+    with transaction.atomic():
+        report = ReportJob.objects.select_for_update(skip_locked=True)\
+                                  .filter(started=None, completed=None)\
+                                  .order_by('-priority', 'requested', 'pk')\
+                                  .first()
 
-                if report.requester.email is not None:
-                    subject = render_to_string('pdk_report_subject.txt', {
-                        'report': report,
-                        'url': settings.SITE_URL
-                    })
+        if report is not None:
+            report.started = timezone.now()
+            report.save()
 
-                    if 'email_subject' in parameters:
-                        subject = parameters['email_subject']
+    return report
 
-                    message = render_to_string('pdk_report_message.txt', {
-                        'report': report,
-                        'url': settings.SITE_URL
-                    })
+def record_failed_job(report):
+    # Marks a job that could not be compiled as completed without a report, so it does not stay
+    # started (and unclaimable) forever. The "Reset report jobs" admin action queues it again.
 
-                    tokens = settings.SITE_URL.split('/')
-                    host = ''
+    try:
+        ReportJob.objects.filter(pk=report.pk).update(completed=timezone.now())
+    except DatabaseError:
+        traceback.print_exc()
 
-                    while tokens and tokens[-1] == '':
-                        tokens.pop()
+def compile_claimed_reports(worker_index=None, generator_workers=1):
+    # Claims and compiles jobs until the queue is empty. Parallel workers get a private
+    # temporary directory, since generators stage their files under fixed names there.
 
-                    if tokens:
-                        host = tokens[-1]
+    worker_tempdir = None
 
-                    send_mail(subject, \
-                              message, \
-                              'Petey Kay <noreply@' + host + '>', \
-                              [report.requester.email], \
-                              fail_silently=False)
+    if worker_index is not None:
+        worker_tempdir = tempfile.mkdtemp(prefix='pdk_compile_reports_' + str(worker_index) + '_')
 
-                for extra_destination in report.requester.pdk_report_destinations.all():
-                    extra_destination.transmit(report, filename)
+        tempfile.tempdir = worker_tempdir
 
-                remove_sleep = 1.0
+    compiled = 0
 
-                while remove_sleep < REMOVE_SLEEP_MAX:
-                    try:
-                        os.remove(filename)
+    try:
+        report = claim_report_job()
+
+        while report is not None:
+            try:
+                compile_report_job(report, generator_workers=generator_workers)
 
-                        remove_sleep = REMOVE_SLEEP_MAX
-                    except OSError:
-                        remove_sleep = remove_sleep * 2
+                compiled += 1
+            except Exception: # pylint: disable=broad-except
+                traceback.print_exc()
 
-                        if remove_sleep >= REMOVE_SLEEP_MAX:
-                            traceback.print_exc()
+                logging.error('pdk_compile_reports: Unable to compile report job %d.', report.pk)
+
+                record_failed_job(report)
+
+            report = claim_report_job()
+    finally:
+        if worker_tempdir is not None:
+            tempfile.tempdir = None
+
+            shutil.rmtree(worker_tempdir, ignore_errors=True)
+
+    return compiled
+
+class Command(BaseCommand):
+    help = 'Compiles data reports requested by end users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',
+                            type=int,
+                            dest='workers',
+                            default=1,
+                            help='Number of processes compiling report jobs in parallel')
+
+        parser.add_argument('--generator-workers',
+                            type=int,
+                            dest='generator_workers',
+                            default=4,
+                            help='Number of processes compiling the generators of a single report job in parallel (used when --workers is 1)')
+
+    @handle_lock
+    @log_scheduled_event
+    def handle(self, *args, **options):
+        os.umask(000)
 
         request = ReportJobBatchRequest.objects.filter(started=None, completed=None)\
                       .order_by('-priority', 'requested', 'pk')\
@@ -343,3 +426,21 @@ class Command(BaseCommand):
                 logging.info('pdk_compile_reports: Splitting batch request %d.', request.pk)
 
             request.process()
+
+        if options['workers'] > 1:
+            # Forked children must not share the parent's database sockets.
+
+            for connection in connections.all():
+                connection.close()
+
+            pool = multiprocessing.Pool(processes=options['workers']) # pylint: disable=consider-using-with
+
+            try:
+                compiled = pool.map(compile_claimed_reports, range(0, options['workers']))
+            finally:
+                pool.close()
+                pool.join()
+
+            logging.info('pdk_compile_reports: Compiled %d report jobs with %d workers.', sum(compiled), options['workers'])
+        else:
+            compile_claimed_reports(generator_workers=options['generator_workers'])
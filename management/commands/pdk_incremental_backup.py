@@ -5,19 +5,23 @@ from __future__ import print_function
 from builtins import str # pylint: disable=redefined-builtin
 
 import base64
+import collections
 import datetime
 import importlib
 import os
 import sys
+import time
 import traceback
 
 from io import BytesIO
+from multiprocessing.pool import ThreadPool
 
 import boto3
 import dropbox
 import pytz
 
 from azure.storage.blob import BlobServiceClient
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
 from nacl.secret import SecretBox
 
@@ -31,6 +35,188 @@ try:
 except ImportError:
     from urlparse import urlparse
 
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+try:
+    UPLOAD_CHUNK_SIZE = settings.PDK_BACKUP_UPLOAD_CHUNK_SIZE
+except AttributeError:
+    pass
+
+def backup_uploader(destination, final_folder): # pylint: disable=too-many-locals
+    # Returns a function that stores one encrypted backup file at the destination, or None if
+    # the destination scheme is not supported. Clients are created once and shared by the
+    # upload threads.
+
+    destination_url = urlparse(destination)
+
+    if destination_url.scheme == 'file':
+        dest_path = destination_url.path
+
+        if final_folder is not None:
+            dest_path = os.path.join(dest_path, final_folder)
+
+        if os.path.exists(dest_path) is False:
+            print('Creating folder for archive storage: ' + dest_path)
+            sys.stdout.flush()
+            os.makedirs(dest_path)
+
+        def upload_file(filename, payload):
+            encrypted_path = os.path.join(dest_path, filename)
+
+            print('Writing to filesystem: ' + encrypted_path)
+            sys.stdout.flush()
+
+            with open(encrypted_path, 'wb') as encrypted_file:
+                encrypted_file.write(payload)
+
+        return upload_file
+
+    if destination_url.scheme == 'dropbox':
+        client = dropbox.Dropbox(destination_url.netloc)
+
+        def upload_dropbox(filename, payload):
+            dropbox_path = os.path.join(destination_url.path, final_folder + '/' + filename)
+
+            print('Uploading to Dropbox: ' + dropbox_path)
+            sys.stdout.flush()
+
+            if len(payload) <= UPLOAD_CHUNK_SIZE:
+                client.files_upload(payload, dropbox_path)
+
+                return
+
+            session = client.files_upload_session_start(payload[:UPLOAD_CHUNK_SIZE])
+
+            cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=UPLOAD_CHUNK_SIZE)
+
+            while (len(payload) - cursor.offset) > UPLOAD_CHUNK_SIZE:
+                client.files_upload_session_append_v2(payload[cursor.offset:(cursor.offset + UPLOAD_CHUNK_SIZE)], cursor)
+
+                cursor.offset += UPLOAD_CHUNK_SIZE
+
+            client.files_upload_session_finish(payload[cursor.offset:], cursor, dropbox.files.CommitInfo(path=dropbox_path))
+
+        return upload_dropbox
+
+    if destination_url.scheme == 's3':
+        aws_config = Config(
+            region_name=settings.PDK_BACKUP_AWS_REGION,
+            retries={'max_attempts': 10, 'mode': 'standard'}
+        )
+
+        os.environ['AWS_ACCESS_KEY_ID'] = settings.PDK_BACKUP_AWS_ACCESS_KEY_ID
+        os.environ['AWS_SECRET_ACCESS_KEY'] = settings.PDK_BACKUP_AWS_SECRET_ACCESS_KEY
+
+        endpoint_url = None
+
+        try:
+            endpoint_url = settings.PDK_BACKUP_AWS_ENDPOINT_URL
+        except AttributeError:
+            pass
+
+        client = boto3.client('s3', config=aws_config, endpoint_url=endpoint_url)
+
+        transfer_config = TransferConfig(multipart_threshold=UPLOAD_CHUNK_SIZE, multipart_chunksize=UPLOAD_CHUNK_SIZE, use_threads=False)
+
+        s3_bucket = destination_url.netloc
+
+        def upload_s3(filename, payload):
+            final_filename = final_folder + '/' + filename
+
+            print('Uploading to S3: ' + final_filename)
+            sys.stdout.flush()
+
+            client.upload_fileobj(BytesIO(payload), s3_bucket, final_filename, Config=transfer_config)
+
+        return upload_s3
+
+    if destination_url.scheme == 'azure-blob':
+        blob_service_client = BlobServiceClient.from_connection_string(settings.PDK_AZURE_CONNECTION_STRING)
+
+        def upload_azure(filename, payload):
+            final_filename = final_folder + '/' + filename
+
+            blob_client = blob_service_client.get_blob_client(container=settings.PDK_AZURE_BLOB_CONTAINER, blob=final_filename)
+
+            print('Uploading to Azure Blob Service: ' + final_filename)
+            sys.stdout.flush()
+
+            blob_client.upload_blob(payload)
+
+        return upload_azure
+
+    return None
+
+def upload_backup_file(uploader, filename, payload):
+    try:
+        uploader(filename, payload)
+
+        return True
+    except: # pylint: disable=bare-except
+        traceback.print_exc()
+
+    return False
+
+def encrypt_backup_file(box, path):
+    with open(path, 'rb') as backup_file:
+        return box.encrypt(backup_file.read())
+
+def wait_for_uploads(pending, limit=0):
+    # Waits for the oldest queued uploads until at most limit remain. Returns False if any of
+    # them failed.
+
+    uploaded = True
+
+    while len(pending) > limit:
+        if pending.popleft().get() is False:
+            uploaded = False
+
+    return uploaded
+
+def transmit_backup_files(to_transmit, uploaders, key, upload_threads):
+    # Encrypts each staged file once and hands the encrypted payload to every destination
+    # through a bounded thread pool. The next file is encrypted while earlier uploads are still
+    # running, and at most upload_threads * 2 uploads are queued at any time.
+
+    box = SecretBox(key)
+
+    pool = ThreadPool(processes=upload_threads)
+
+    pending = collections.deque()
+
+    transmitted = True
+
+    transmit_start = time.time()
+    transmit_bytes = 0
+
+    try:
+        for path in to_transmit:
+            encrypted_str = encrypt_backup_file(box, path)
+
+            for uploader in uploaders:
+                if wait_for_uploads(pending, (upload_threads * 2) - 1) is False:
+                    transmitted = False
+
+                pending.append(pool.apply_async(upload_backup_file, (uploader, os.path.basename(path) + '.encrypted', encrypted_str,)))
+
+                transmit_bytes += len(encrypted_str)
+
+            encrypted_str = None
+
+        if wait_for_uploads(pending) is False:
+            transmitted = False
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - transmit_start
+
+    if transmit_bytes > 0 and elapsed > 0:
+        print('Transmitted ' + str(len(to_transmit)) + ' files to ' + str(len(uploaders)) + ' destinations (' + str(round(transmit_bytes / (1024.0 * 1024.0 * elapsed), 2)) + ' MB/sec).')
+        sys.stdout.flush()
+
+    return transmitted
+
 class Command(BaseCommand):
     help = 'Generates incremental backups of data content and transmits to storage.'
 
@@ -62,6 +248,12 @@ class Command(BaseCommand):
                             action='store_true',
                             help='Filter sensitive data from the backup data points written')
 
+        parser.add_argument('--upload-threads',
+                            type=int,
+                            dest='upload_threads',
+                            default=4,
+                            help='Number of concurrent uploads to backup destinations')
+
     def folder_for_options(self, options): # pylint: disable=no-self-use
         folder_path_format = '%(start_date)s__%(end_date)s'
 
@@ -142,133 +334,44 @@ class Command(BaseCommand):
 
             sys.exit(1)
 
-        for app in settings.INSTALLED_APPS: # pylint: disable=too-many-nested-blocks
+        upload_threads = max(1, options['upload_threads'])
+
+        for app in settings.INSTALLED_APPS:
             try:
                 pdk_api = importlib.import_module(app + '.pdk_api')
 
                 to_transmit, to_clear = pdk_api.incremental_backup(parameters)
 
-                for destination in destinations:
-                    destination_url = urlparse(destination)
-
-                    if destination_url.scheme == 'file':
-                        dest_path = destination_url.path
-
-                        final_folder = self.folder_for_options(options)
-
-                        if final_folder is not None:
-                            dest_path = os.path.join(dest_path, final_folder)
-
-                        if os.path.exists(dest_path) is False:
-                            print('Creating folder for archive storage: ' + dest_path)
-                            sys.stdout.flush()
-                            os.makedirs(dest_path)
-
-                        for path in to_transmit:
-                            box = SecretBox(key)
-
-                            with open(path, 'rb') as backup_file:
-                                encrypted_str = box.encrypt(backup_file.read())
+                final_folder = self.folder_for_options(options)
 
-                                filename = os.path.basename(path) + '.encrypted'
+                uploaders = []
 
-                                encrypted_path = os.path.join(dest_path, filename)
+                transmitted = True
 
-                                print('Writing to filesystem: ' + encrypted_path)
-                                sys.stdout.flush()
-
-                                with open(encrypted_path, 'wb') as encrypted_file:
-                                    encrypted_file.write(encrypted_str)
-                    elif destination_url.scheme == 'dropbox':
-                        access_token = destination_url.netloc
-
-                        client = dropbox.Dropbox(access_token)
-
-                        for path in to_transmit:
-                            box = SecretBox(key)
-
-                            with open(path, 'rb') as backup_file:
-                                backup_io = BytesIO()
-                                backup_io.write(backup_file.read())
-                                backup_io.seek(0)
-
-                                filename = os.path.basename(path) + '.encrypted'
-
-                                final_folder = self.folder_for_options(options)
-
-                                dropbox_path = os.path.join(destination_url.path, final_folder + '/' + filename)
-
-                                print('Uploading to Dropbox: ' + dropbox_path)
-                                sys.stdout.flush()
-
-                                client.files_upload(box.encrypt(backup_io.read()), dropbox_path)
-                    elif destination_url.scheme == 's3':
-                        try:
-                            aws_config = Config(
-                                region_name=settings.PDK_BACKUP_AWS_REGION,
-                                retries={'max_attempts': 10, 'mode': 'standard'}
-                            )
-
-                            os.environ['AWS_ACCESS_KEY_ID'] = settings.PDK_BACKUP_AWS_ACCESS_KEY_ID
-                            os.environ['AWS_SECRET_ACCESS_KEY'] = settings.PDK_BACKUP_AWS_SECRET_ACCESS_KEY
-
-                            client = boto3.client('s3', config=aws_config)
-
-                            s3_bucket = destination_url.netloc
-
-                            for path in to_transmit:
-                                box = SecretBox(key)
-
-                                with open(path, 'rb') as backup_file:
-                                    backup_io = BytesIO()
-                                    backup_io.write(backup_file.read())
-                                    backup_io.seek(0)
-
-                                    filename = os.path.basename(path) + '.encrypted'
-
-                                    final_folder = self.folder_for_options(options)
-
-                                    final_filename = final_folder + '/' + filename
-
-                                    print('Uploading to S3: ' + final_filename)
-                                    sys.stdout.flush()
-
-                                    client.put_object(Body=box.encrypt(backup_io.read()), Bucket=s3_bucket, Key=final_filename)
-                        except: # pylint: disable=bare-except
-                            traceback.print_exc()
-                    elif destination_url.scheme == 'azure-blob':
-                        blob_service_client = BlobServiceClient.from_connection_string(settings.PDK_AZURE_CONNECTION_STRING)
-
-                        try:
-                            for path in to_transmit:
-                                box = SecretBox(key)
-
-                                with open(path, 'rb') as backup_file:
-                                    backup_io = BytesIO()
-                                    backup_io.write(backup_file.read())
-                                    backup_io.seek(0)
-
-                                    filename = os.path.basename(path) + '.encrypted'
-
-                                    final_folder = self.folder_for_options(options)
-
-                                    final_filename = final_folder + '/' + filename
+                for destination in destinations:
+                    try:
+                        uploader = backup_uploader(destination, final_folder)
 
-                                    blob_client = blob_service_client.get_blob_client(container=settings.PDK_AZURE_BLOB_CONTAINER, blob=final_filename)
+                        if uploader is not None:
+                            uploaders.append(uploader)
+                        else:
+                            print('Unknown destination: ' + destination)
+                    except: # pylint: disable=bare-except
+                        traceback.print_exc()
 
-                                    print('Uploading to Azure Blob Service: ' + final_filename)
-                                    sys.stdout.flush()
+                        transmitted = False
 
-                                    blob_client.upload_blob(backup_io)
-                        except: # pylint: disable=bare-except
-                            traceback.print_exc()
-                    else:
-                        print('Unknown destination: ' + destination)
+                if transmit_backup_files(to_transmit, uploaders, key, upload_threads) is False:
+                    transmitted = False
 
                 for path in to_transmit:
                     os.remove(path)
 
-                pdk_api.clear_points(to_clear)
+                if transmitted:
+                    pdk_api.clear_points(to_clear)
+                elif to_clear:
+                    print('Not clearing archived data points: one or more uploads failed.')
+                    sys.stdout.flush()
 
             except ImportError:
                 pass
@@ -5,6 +5,7 @@ from __future__ import print_function
 import base64
 import bz2
 import importlib
+import multiprocessing
 import os
 
 from nacl.exceptions import CryptoError
@@ -12,9 +13,70 @@ from nacl.secret import SecretBox
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
 
 from passive_data_kit.decorators import handle_lock
 
+from .pdk_process_bundles import merge_bundle_statistics, update_bundle_statistics
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+def backup_chunks(encrypted_file, key):
+    # Yields the decompressed content of a backup file in chunks. Backups are encrypted as a
+    # single SecretBox message, so one file's compressed content is decrypted at once, but
+    # decompression and parsing proceed incrementally from there.
+
+    with open(encrypted_file, 'rb') as backup_file:
+        content = backup_file.read()
+
+    try:
+        content = SecretBox(key).decrypt(content)
+    except CryptoError:
+        print('Unable to decrypt "' + os.path.basename(encrypted_file) + '", attempting decompression of original (maybe unencrypted) content...')
+
+        content = None
+
+    decompressor = bz2.BZ2Decompressor()
+
+    if content is not None:
+        for index in range(0, len(content), READ_CHUNK_SIZE):
+            decompressed = decompressor.decompress(content[index:(index + READ_CHUNK_SIZE)])
+
+            if decompressed:
+                yield decompressed
+    else:
+        with open(encrypted_file, 'rb') as backup_file:
+            for chunk in iter(lambda: backup_file.read(READ_CHUNK_SIZE), b''):
+                decompressed = decompressor.decompress(chunk)
+
+                if decompressed:
+                    yield decompressed
+
+def load_backup_file(arguments):
+    encrypted_file, key, direct = arguments
+
+    filename = os.path.basename(encrypted_file)
+
+    statistics = None
+
+    for app in settings.INSTALLED_APPS:
+        try:
+            pdk_api = importlib.import_module(app + '.pdk_api')
+
+            # Only this package's hook accepts chunked content and direct restores. Other apps
+            # still receive the whole decompressed file.
+
+            if pdk_api.__name__ == 'passive_data_kit.pdk_api':
+                statistics = merge_bundle_statistics(statistics, pdk_api.load_backup(filename, backup_chunks(encrypted_file, key), direct=direct))
+            else:
+                pdk_api.load_backup(filename, b''.join(backup_chunks(encrypted_file, key)))
+        except ImportError:
+            pass
+        except AttributeError:
+            pass
+
+    return filename, statistics
+
 class Command(BaseCommand):
     help = 'Loads content from incremental backups of data content.'
 
@@ -24,40 +86,52 @@ class Command(BaseCommand):
                             type=str,
                             help='Backup file to import into local database')
 
+        parser.add_argument('--direct',
+                            dest='direct',
+                            action='store_true',
+                            help='Write data points directly instead of re-queuing them as data bundles')
+
+        parser.add_argument('--workers',
+                            type=int,
+                            dest='workers',
+                            default=1,
+                            help='Number of backup files to load in parallel')
+
 
     @handle_lock
     def handle(self, *args, **options):
         key = base64.b64decode(settings.PDK_BACKUP_KEY)
 
-        warned = False
-
-        for app in settings.INSTALLED_APPS:
-            try:
-                pdk_api = importlib.import_module(app + '.pdk_api')
+        for encrypted_file in options['file']:
+            if os.path.exists(encrypted_file) is False:
+                raise RuntimeError(os.path.basename(encrypted_file) + ' does not exist.')
 
-                for encrypted_file in options['file']:
-                    filename = os.path.basename(encrypted_file)
+        arguments = [(encrypted_file, key, options['direct'],) for encrypted_file in options['file']]
 
-                    if os.path.exists(encrypted_file):
-                        box = SecretBox(key)
+        statistics = None
 
-                        with open(encrypted_file, 'rb') as backup_file:
-                            content = backup_file.read()
+        if options['workers'] > 1:
+            # Forked children must not share the parent's database sockets.
 
-                            try:
-                                content = box.decrypt(content)
-                            except CryptoError:
-                                if warned is False:
-                                    print('Unable to decrypt "' + filename + '", attempting decompression of original (maybe unencrypted) content...')
-                                    warned = True
+            for connection in connections.all():
+                connection.close()
 
-                            decompressed = bz2.decompress(content)
+            pool = multiprocessing.Pool(processes=options['workers']) # pylint: disable=consider-using-with
 
-                            pdk_api.load_backup(filename, decompressed)
-                    else:
-                        raise RuntimeError(filename + ' does not exist.')
-
-            except ImportError:
-                pass
-            except AttributeError:
-                pass
+            try:
+                for filename, file_statistics in pool.imap_unordered(load_backup_file, arguments):
+                    print('Loaded ' + filename + '.')
+
+                    statistics = merge_bundle_statistics(statistics, file_statistics)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for argument in arguments:
+                statistics = merge_bundle_statistics(statistics, load_backup_file(argument)[1])
+
+        # Direct restores report their statistics here, so the server metadata is updated once
+        # rather than by each worker in turn.
+
+        if statistics is not None and statistics['new_point_count'] > 0:
+            update_bundle_statistics(statistics)
@@ -0,0 +1,50 @@
+# pylint: disable=no-member, line-too-long
+
+from __future__ import print_function
+
+from builtins import str # pylint: disable=redefined-builtin
+
+from django.core.management.base import BaseCommand
+
+from ...decorators import handle_lock
+from ...models import DataPoint, DataGeneratorDefinition, DataSourceReference, LatestDataPoint
+
+class Command(BaseCommand):
+    help = 'Populates the latest data point index for every source and generator from existing data points.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source',
+                            type=str,
+                            dest='source',
+                            default=None,
+                            help='Only index the latest points for this source')
+
+    @handle_lock
+    def handle(self, *args, **options):
+        frequency_definition = DataGeneratorDefinition.definition_for_identifier('pdk-data-frequency')
+
+        references = DataSourceReference.objects.all()
+
+        if options['source'] is not None:
+            references = references.filter(source=options['source'])
+
+        for reference in references.order_by('source'):
+            latest_entries = []
+
+            newest = None
+
+            points = DataPoint.objects.filter(source_reference=reference).exclude(generator_definition=None)
+
+            for point in points.order_by('generator_definition', '-created').distinct('generator_definition').only('pk', 'created', 'source_reference', 'generator_definition'):
+                latest_entries.append((reference.pk, point.generator_definition_id, point,))
+
+                if newest is None or newest.created < point.created:
+                    newest = point
+
+            if newest is not None:
+                latest_entries.append((reference.pk, frequency_definition.pk, newest,))
+
+            LatestDataPoint.objects.update_latest_points(latest_entries)
+
+            if options['verbosity'] > 1:
+                print(reference.source + ': ' + str(len(latest_entries)) + ' latest point(s)')
@@ -9,6 +9,11 @@ import datetime
 import gzip
 import json
 import logging
+import math
+import multiprocessing
+import os
+import random
+import time
 import traceback
 
 from io import BytesIO
@@ -21,478 +26,649 @@ from nacl.public import PublicKey, PrivateKey, Box
 from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry
 from django.core.management.base import BaseCommand
-from django.db import transaction, DataError
+from django.db import connections, transaction, DataError, OperationalError
+from django.db.models import Q
 from django.db.transaction import TransactionManagementError
 from django.utils import timezone
 
 from ...decorators import handle_lock, log_scheduled_event
 from ...models import DataServerMetadatum, DataPoint, DataBundle, DataSource, \
-                      install_supports_jsonfield, TOTAL_DATA_POINT_COUNT_DATUM, \
-                      SOURCES_DATUM, SOURCE_GENERATORS_DATUM
+                      DataGeneratorDefinition, DataPointDailySummary, LatestDataPoint, install_supports_jsonfield, \
+                      TOTAL_DATA_POINT_COUNT_DATUM, SOURCES_DATUM, SOURCE_GENERATORS_DATUM
 
-class Command(BaseCommand):
-    help = 'Convert unprocessed DataBundle instances into DataPoint instances.'
+DEADLOCK_RETRIES = 3
 
-    def add_arguments(self, parser):
-        parser.add_argument('--delete',
-                            action='store_true',
-                            dest='delete',
-                            default=False,
-                            help='Delete data bundles after processing')
+def is_deadlock(error):
+    return getattr(getattr(error, '__cause__', None), 'pgcode', None) == '40P01' or 'deadlock detected' in str(error)
 
-        parser.add_argument('--count',
-                            type=int,
-                            dest='bundle_count',
-                            default=50,
-                            help='Number of bundles to process in a single run')
+def decode_bundle_properties(bundle, keys):
+    # Returns the bundle's point payloads (decrypted and decompressed) and the decompressed size,
+    # or None for encrypted bundles missing their nonce or content. keys caches the server and
+    # client keys across bundles.
 
-        parser.add_argument('--skip-stats',
-                            action='store_true',
-                            dest='skip_stats',
-                            default=False,
-                            help='Skips statistic updates for improved speeds')
+    properties = bundle.properties
+    size = 0
 
-    @handle_lock
-    @log_scheduled_event
-    def handle(self, *args, **options): # pylint: disable=too-many-locals, too-many-branches, too-many-statements
-        to_delete = []
+    if install_supports_jsonfield() is False:
+        properties = json.loads(properties)
 
-        supports_json = install_supports_jsonfield()
+    if bundle.encrypted:
+        if 'nonce' in properties and 'encrypted' in properties:
+            payload = base64.b64decode(properties['encrypted'])
+            nonce = base64.b64decode(properties['nonce'])
 
-        default_tz = timezone.get_default_timezone()
+            if ('private' in keys) is False:
+                keys['private'] = PrivateKey(base64.b64decode(settings.PDK_SERVER_KEY).strip()) # pylint: disable=line-too-long
+                keys['public'] = PublicKey(base64.b64decode(settings.PDK_CLIENT_KEY).strip()) # pylint: disable=line-too-long
 
-        seen_sources = []
-        seen_generators = []
-        source_identifiers = {}
+            box = Box(keys['private'], keys['public'])
 
-        latest_points = {}
+            decrypted_message = box.decrypt(payload, nonce)
 
-        new_point_count = 0
-        processed_bundle_count = 0
-        process_limit = 1000
-        remote_bundle_size = 100
-        remote_timeout = 5
+            decrypted = six.text_type(decrypted_message, encoding='utf8')
 
-        try:
-            process_limit = settings.PDK_BUNDLE_PROCESS_LIMIT
-        except AttributeError:
-            pass
+            if bundle.compression != 'none':
+                compressed = base64.b64decode(decrypted)
 
-        try:
-            remote_bundle_size = settings.PDK_REMOTE_BUNDLE_SIZE
-        except AttributeError:
-            pass
+                if bundle.compression == 'gzip':
+                    fio = BytesIO(compressed)  # io.BytesIO for Python 3
+                    gzip_file_obj = gzip.GzipFile(fileobj=fio)
+                    payload = gzip_file_obj.read()
+                    gzip_file_obj.close()
 
-        try:
-            remote_timeout = settings.PDK_REMOTE_BUNDLE_TIMEOUT
-        except AttributeError:
-            pass
+                    decrypted = payload
+
+            return json.loads(decrypted), size
+
+        if 'encrypted' in properties:
+            print('Missing "nonce" in encrypted bundle. Cannot decrypt bundle ' + str(bundle.pk) + '. Skipping...')
+
+            return None
+
+        if 'nonce' in properties:
+            print('Missing "encrypted" in encrypted bundle. Cannot decrypt bundle ' + str(bundle.pk) + '. Skipping...')
+
+            return None
 
-        sources = {}
+    elif bundle.compression != 'none':
+        compressed = base64.b64decode(properties['payload'])
 
-        private_key = None
-        public_key = None
+        if bundle.compression == 'gzip':
+            fio = BytesIO(compressed)  # io.BytesIO for Python 3
+            gzip_file_obj = gzip.GzipFile(fileobj=fio)
+            payload = gzip_file_obj.read()
+            gzip_file_obj.close()
 
-        xmit_points = {}
+            size = len(payload)
 
-        start_processing = timezone.now()
+            properties = json.loads(payload)
 
-        bundle_size = 0
+    return properties, size
 
-        for bundle in DataBundle.objects.filter(processed=False, errored=None)[:options['bundle_count']]: # pylint: disable=too-many-nested-blocks
-            if new_point_count < process_limit:
-                processed_bundle_count += 1
+def bundle_data_point(bundle, bundle_point, now):
+    default_tz = timezone.get_default_timezone()
 
-                original_properties = bundle.properties
+    supports_json = install_supports_jsonfield()
 
-                bundle_files = bundle.data_files.all()
+    point = DataPoint(recorded=now)
+    bundle_point['passive-data-metadata']['encrypted_transmission'] = bundle.encrypted
 
-                has_bundles = (bundle_files.count() > 0)
+    point.source = bundle_point['passive-data-metadata']['source']
+
+    if point.source is None:
+        point.source = '-'
+
+    point.generator = bundle_point['passive-data-metadata']['generator']
+
+    if 'generator-id' in bundle_point['passive-data-metadata']:
+        point.generator_identifier = bundle_point['passive-data-metadata']['generator-id']
+
+    if 'latitude' in bundle_point['passive-data-metadata'] and 'longitude' in bundle_point['passive-data-metadata']:
+        point.generated_at = GEOSGeometry('POINT(' + str(bundle_point['passive-data-metadata']['longitude']) + ' ' + str(bundle_point['passive-data-metadata']['latitude']) + ')')
+    elif 'latitude' in bundle_point and 'longitude' in bundle_point:
+        point.generated_at = GEOSGeometry('POINT(' + str(bundle_point['longitude']) + ' ' + str(bundle_point['latitude']) + ')')
+
+    point.created = datetime.datetime.fromtimestamp(bundle_point['passive-data-metadata']['timestamp'], tz=default_tz)
+
+    if supports_json:
+        point.properties = json.loads(json.dumps(bundle_point, indent=2).encode('utf-16', 'surrogatepass').decode('utf-16'))
+    else:
+        point.properties = json.dumps(bundle_point, indent=2)
+
+    point.fetch_secondary_identifier(skip_save=True, properties=bundle_point)
+    point.fetch_user_agent(skip_save=True, properties=bundle_point)
+    point.fetch_generator_definition(skip_save=True)
+    point.fetch_source_reference(skip_save=True)
+
+    return point
+
+def ingest_bundle_points(bundle, properties, server_urls, bundle_files): # pylint: disable=too-many-branches
+    # Records the bundle's local points (run inside the bundle's transaction). Returns the new
+    # points, the payloads to forward by server URL and the number of points handled.
+
+    now = timezone.now()
+
+    to_record = []
+    xmit_points = {}
+    new_point_count = 0
+
+    for bundle_point in properties:
+        # logging.debug('POINT: %s', json.dumps(bundle_point, indent=2))
+
+        if bundle_point is not None:
+            point_json = json.dumps(bundle_point)
+
+            while r'\u0000' in point_json:
+                print('Detected 0x00 byte in ' + str(bundle.pk) + '. Stripping and ingesting...')
+
+                point_json = point_json.replace(r'\u0000', '')
+
+            bundle_point = json.loads(point_json)
+
+        try:
+            if bundle_point is not None and 'passive-data-metadata' in bundle_point and 'source' in bundle_point['passive-data-metadata'] and 'generator' in bundle_point['passive-data-metadata']:
+                server_url = DataSource.objects.ingest_source(bundle_point['passive-data-metadata'], server_urls)
 
                 try:
-                    with transaction.atomic():
-                        if supports_json is False:
-                            bundle.properties = json.loads(bundle.properties)
+                    settings.PDK_INSPECT_DATA_POINT_AT_INGEST(bundle_point)
+                except AttributeError:
+                    pass # Optional method not defined
 
-                        if bundle.encrypted:
-                            if 'nonce' in bundle.properties and 'encrypted' in bundle.properties:
-                                payload = base64.b64decode(bundle.properties['encrypted'])
-                                nonce = base64.b64decode(bundle.properties['nonce'])
+                if server_url == '':
+                    to_record.append(bundle_data_point(bundle, bundle_point, now))
+                else:
+                    if (server_url in xmit_points) is False:
+                        xmit_points[server_url] = []
 
-                                if private_key is None:
-                                    private_key = PrivateKey(base64.b64decode(settings.PDK_SERVER_KEY).strip()) # pylint: disable=line-too-long
+                    xmit_points[server_url].append(bundle_point)
 
-                                if public_key is None:
-                                    public_key = PublicKey(base64.b64decode(settings.PDK_CLIENT_KEY).strip()) # pylint: disable=line-too-long
+                new_point_count += 1
+        except DataError:
+            traceback.print_exc()
+            print('Error ingesting bundle: ' + str(bundle.pk) + ':')
+            print(str(properties))
 
-                                box = Box(private_key, public_key)
+    points = []
 
-                                decrypted_message = box.decrypt(payload, nonce)
+    if len(to_record) > 0: # pylint: disable=len-as-condition
+        points = DataPoint.objects.bulk_create(to_record)
 
-                                decrypted = six.text_type(decrypted_message, encoding='utf8')
+        DataPointDailySummary.objects.record_points(points)
 
-                                if bundle.compression != 'none':
-                                    compressed = base64.b64decode(decrypted)
+        if bundle_files.exists():
+            for point in points:
+                point.fetch_bundle_files(bundle_files)
 
-                                    if bundle.compression == 'gzip':
-                                        fio = BytesIO(compressed)  # io.BytesIO for Python 3
-                                        gzip_file_obj = gzip.GzipFile(fileobj=fio)
-                                        payload = gzip_file_obj.read()
-                                        gzip_file_obj.close()
+    return points, xmit_points, new_point_count
 
-                                        decrypted = payload
+def transmit_remote_points(xmit_points, remote_timeout, minimum_size=0):
+    # Forwards the queued payloads of every server with more than minimum_size of them. Runs
+    # outside any transaction. Returns True if a transmission failed.
 
-                                bundle.properties = json.loads(decrypted)
-                            elif 'encrypted' in bundle.properties:
-                                print('Missing "nonce" in encrypted bundle. Cannot decrypt bundle ' + str(bundle.pk) + '. Skipping...')
-                                break
-                            elif 'nonce' in bundle.properties:
-                                print('Missing "encrypted" in encrypted bundle. Cannot decrypt bundle ' + str(bundle.pk) + '. Skipping...')
-                                break
-                        elif bundle.compression != 'none':
-                            compressed = base64.b64decode(bundle.properties['payload'])
+    failed = False
 
-                            if bundle.compression == 'gzip':
-                                fio = BytesIO(compressed)  # io.BytesIO for Python 3
-                                gzip_file_obj = gzip.GzipFile(fileobj=fio)
-                                payload = gzip_file_obj.read()
-                                gzip_file_obj.close()
+    for server_url, points in xmit_points.items():
+        if len(points) > minimum_size:
+            payload = {
+                'payload': json.dumps(points, indent=2)
+            }
 
-                                bundle_size += len(payload)
+            try:
+                bundle_post = requests.post(server_url, data=payload, timeout=remote_timeout)
 
-                                bundle.properties = json.loads(payload)
+                if bundle_post.status_code < 200 and bundle_post.status_code >= 300:
+                    failed = True
 
-                                # print(' Compress: %d -- %s' % (bundle.pk, timezone.now()))
+                # print(server_url + ': ' + str(len(points)))
 
-                        now = timezone.now()
+                xmit_points[server_url] = []
+            except requests.exceptions.Timeout:
+                print('Unable to transmit data to ' + server_url + ' (timeout=' + str(remote_timeout) + ').')
 
-                        to_record = []
+                failed = True
 
-                        for bundle_point in bundle.properties: # pylint: disable=too-many-nested-blocks
-                            # logging.debug('POINT: %s', json.dumps(bundle_point, indent=2))
+    return failed
 
-                            if bundle_point is not None:
-                                point_json = json.dumps(bundle_point)
+def ingest_bundle(bundle, keys, server_urls):
+    # Ingests one bundle in its own short transaction, retrying deadlocks with other workers.
+    # Returns the ingest_bundle_points result and the decompressed size, or None if the bundle
+    # could not be decoded.
 
-                                while r'\u0000' in point_json:
-                                    print('Detected 0x00 byte in ' + str(bundle.pk) + '. Stripping and ingesting...')
+    original_properties = bundle.properties
 
-                                    point_json = point_json.replace(r'\u0000', '')
+    bundle_files = bundle.data_files.all()
 
-                                # while r'\ud83c' in point_json:
-                                #    print('Detected 0xd83c byte in ' + str(bundle.pk) + '. Stripping and ingesting...')
+    for attempt in range(0, DEADLOCK_RETRIES):
+        attempt_server_urls = dict(server_urls)
 
-                                #    point_json = point_json.replace(r'\ud83c', '')
+        try:
+            with transaction.atomic():
+                decoded = decode_bundle_properties(bundle, keys)
 
-                                bundle_point = json.loads(point_json)
+                if decoded is None:
+                    return None
 
-                            try:
-                                if bundle_point is not None and 'passive-data-metadata' in bundle_point and 'source' in bundle_point['passive-data-metadata'] and 'generator' in bundle_point['passive-data-metadata']:
-                                    source = bundle_point['passive-data-metadata']['source']
+                properties, size = decoded
 
-                                    if source == '':
-                                        source = 'missing-source'
+                result = ingest_bundle_points(bundle, properties, attempt_server_urls, bundle_files)
 
-                                    try:
-                                        source = settings.PDK_RENAME_SOURCE(source)
+                bundle.processed = True
+                bundle.properties = original_properties
+                bundle.save()
 
-                                        bundle_point['passive-data-metadata']['source'] = source
-                                    except AttributeError:
-                                        pass # Optional method not defined
+            server_urls.update(attempt_server_urls)
 
-                                    try:
-                                        settings.PDK_INSPECT_DATA_POINT_AT_INGEST(bundle_point)
-                                    except AttributeError:
-                                        pass # Optional method not defined
+            return result, size
+        except OperationalError as error:
+            bundle.properties = original_properties
 
-                                    server_url = None
+            if is_deadlock(error) is False or attempt == (DEADLOCK_RETRIES - 1):
+                raise
 
-                                    if source in sources:
-                                        server_url = sources[source]
-                                    else:
-                                        source_obj = DataSource.objects.filter(identifier=source).first()
+            print('Deadlock ingesting bundle ' + str(bundle.pk) + ', retrying...')
 
-                                        if source_obj is not None:
-                                            if source_obj.server is not None:
-                                                server_url = source_obj.server.upload_url
-                                        else:
-                                            if source is not None:
-                                                source_obj = DataSource(name=source, identifier=source)
-                                                source_obj.save()
+            time.sleep(random.random() * (attempt + 1)) # nosec
 
-                                                source_obj.join_default_group()
+    return None
 
-                                        if server_url is None:
-                                            server_url = ''
+def process_bundles(bundles, delete=False, process_limit=None): # pylint: disable=too-many-locals, too-many-branches, too-many-statements
+    to_delete = []
 
-                                        sources[source] = server_url
+    seen_sources = []
+    seen_generators = []
+    source_identifiers = {}
 
-                                    if server_url == '':
-                                        point = DataPoint(recorded=now)
-                                        bundle_point['passive-data-metadata']['encrypted_transmission'] = bundle.encrypted
+    latest_points = {}
 
-                                        point.source = bundle_point['passive-data-metadata']['source']
+    new_point_count = 0
+    processed_bundle_count = 0
+    remote_bundle_size = 100
+    remote_timeout = 5
 
-                                        if point.source is None:
-                                            point.source = '-'
+    if process_limit is None:
+        process_limit = 1000
 
-                                        point.generator = bundle_point['passive-data-metadata']['generator']
+        try:
+            process_limit = settings.PDK_BUNDLE_PROCESS_LIMIT
+        except AttributeError:
+            pass
 
-                                        if 'generator-id' in bundle_point['passive-data-metadata']:
-                                            point.generator_identifier = bundle_point['passive-data-metadata']['generator-id']
+    try:
+        remote_bundle_size = settings.PDK_REMOTE_BUNDLE_SIZE
+    except AttributeError:
+        pass
 
-                                        if 'latitude' in bundle_point['passive-data-metadata'] and 'longitude' in bundle_point['passive-data-metadata']:
-                                            point.generated_at = GEOSGeometry('POINT(' + str(bundle_point['passive-data-metadata']['longitude']) + ' ' + str(bundle_point['passive-data-metadata']['latitude']) + ')')
-                                        elif 'latitude' in bundle_point and 'longitude' in bundle_point:
-                                            point.generated_at = GEOSGeometry('POINT(' + str(bundle_point['longitude']) + ' ' + str(bundle_point['latitude']) + ')')
+    try:
+        remote_timeout = settings.PDK_REMOTE_BUNDLE_TIMEOUT
+    except AttributeError:
+        pass
 
-                                        point.created = datetime.datetime.fromtimestamp(bundle_point['passive-data-metadata']['timestamp'], tz=default_tz)
+    sources = {}
 
-                                        if supports_json:
-                                            point.properties = json.loads(json.dumps(bundle_point, indent=2).encode('utf-16', 'surrogatepass').decode('utf-16'))
-                                        else:
-                                            point.properties = json.dumps(bundle_point, indent=2)
+    keys = {}
 
-                                        point.fetch_secondary_identifier(skip_save=True, properties=bundle_point)
-                                        point.fetch_user_agent(skip_save=True, properties=bundle_point)
-                                        point.fetch_generator_definition(skip_save=True)
-                                        point.fetch_source_reference(skip_save=True)
+    xmit_points = {}
 
-                                        to_record.append(point)
+    start_processing = timezone.now()
 
-#                                        point.save()
-#
-#                                        if has_bundles:
-#                                            point.fetch_bundle_files(bundle_files)
-#
-#                                        if (point.source in seen_sources) is False:
-#                                            seen_sources.append(point.source)
-#
-#                                        if (point.source in source_identifiers) is False:
-#                                            source_identifiers[point.source] = []
-#
-#                                        latest_key = point.source + '--' + point.generator_identifier
-#
-#                                        if (latest_key in latest_points) is False or latest_points[latest_key].created < point.created:
-#                                            latest_points[latest_key] = point
-#
-#                                        if (point.generator_identifier in seen_generators) is False:
-#                                            seen_generators.append(point.generator_identifier)
-#
-#                                        if (point.generator_identifier in source_identifiers[point.source]) is False:
-#                                            source_identifiers[point.source].append(point.generator_identifier)
-                                    else:
-                                        if (server_url in xmit_points) is False:
-                                            xmit_points[server_url] = []
+    bundle_size = 0
 
-                                        xmit_points[server_url].append(bundle_point)
+    for bundle in bundles:
+        if new_point_count >= process_limit:
+            break
 
-                                    new_point_count += 1
-                            except DataError:
-                                traceback.print_exc()
-                                print('Error ingesting bundle: ' + str(bundle.pk) + ':')
-                                print(str(bundle.properties))
+        processed_bundle_count += 1
 
-                        if len(to_record) > 0: # pylint: disable=len-as-condition
-                            points = DataPoint.objects.bulk_create(to_record)
+        try:
+            ingested = ingest_bundle(bundle, keys, sources)
+        except (TransactionManagementError, TypeError) as error:
+            print('[' + type(error).__name__ + '] Abandoning and marking errored ' + str(bundle.pk) + '.')
 
-                            for point in points:
-                                if has_bundles:
-                                    point.fetch_bundle_files(bundle_files)
+            DataBundle.objects.filter(pk=bundle.pk).update(errored=timezone.now())
 
-                                if (point.source in seen_sources) is False:
-                                    seen_sources.append(point.source)
+            continue
+        except OperationalError:
+            traceback.print_exc()
+            print('Repeated deadlocks ingesting ' + str(bundle.pk) + '. Leaving it for a later run.')
 
-                                if (point.source in source_identifiers) is False:
-                                    source_identifiers[point.source] = []
+            continue
 
-                                latest_key = point.source + '--' + point.generator_identifier
+        if ingested is None:
+            break
 
-                                if (latest_key in latest_points) is False or latest_points[latest_key].created < point.created:
-                                    latest_points[latest_key] = point
+        (points, bundle_xmit_points, bundle_point_count), size = ingested
 
-                                if (point.generator_identifier in seen_generators) is False:
-                                    seen_generators.append(point.generator_identifier)
+        new_point_count += bundle_point_count
+        bundle_size += size
 
-                                if (point.generator_identifier in source_identifiers[point.source]) is False:
-                                    source_identifiers[point.source].append(point.generator_identifier)
+        for point in points:
+            if (point.source in seen_sources) is False:
+                seen_sources.append(point.source)
 
-                        if len(xmit_points) == 0: # pylint: disable=len-as-condition
-                            bundle.processed = True
-                        else:
-                            failed = False
+            if (point.source in source_identifiers) is False:
+                source_identifiers[point.source] = []
 
-                            for server_url, points in xmit_points.items():
-                                if len(points) > remote_bundle_size:
-                                    payload = {
-                                        'payload': json.dumps(points, indent=2)
-                                    }
+            latest_key = point.source + '--' + point.generator_identifier
 
-                                    try:
-                                        bundle_post = requests.post(server_url, data=payload, timeout=remote_timeout)
+            if (latest_key in latest_points) is False or latest_points[latest_key].created < point.created:
+                latest_points[latest_key] = point
 
-                                        if bundle_post.status_code < 200 and bundle_post.status_code >= 300:
-                                            failed = True
+            if (point.generator_identifier in seen_generators) is False:
+                seen_generators.append(point.generator_identifier)
 
-                                        # print(server_url + ': ' + str(len(points)))
+            if (point.generator_identifier in source_identifiers[point.source]) is False:
+                source_identifiers[point.source].append(point.generator_identifier)
 
-                                        xmit_points[server_url] = []
-                                    except requests.exceptions.Timeout:
-                                        print('Unable to transmit data to ' + server_url + ' (timeout=' + str(remote_timeout) + ').')
+        for server_url, server_points in bundle_xmit_points.items():
+            if (server_url in xmit_points) is False:
+                xmit_points[server_url] = []
 
-                                        failed = True
+            xmit_points[server_url].extend(server_points)
 
-                            if failed is False:
-                                bundle.processed = True
-                            else:
-                                print('Error encountered uploading contents of ' + str(bundle.pk) + '.')
+        # Forwarded outside the bundle's transaction, so no locks are held over the network.
 
-                        bundle.properties = original_properties
+        if transmit_remote_points(xmit_points, remote_timeout, minimum_size=remote_bundle_size):
+            print('Error encountered uploading contents of ' + str(bundle.pk) + '.')
 
-                        bundle.save()
+            DataBundle.objects.filter(pk=bundle.pk).update(processed=False)
+        elif delete:
+            to_delete.append(bundle)
 
-                        if options['delete']:
-                            to_delete.append(bundle)
+    end_processing = timezone.now()
 
-                except TransactionManagementError:
-                    print('[TransactionManagementError] Abandoning and marking errored ' + str(bundle.pk) + '.')
+    elapsed = (end_processing - start_processing).total_seconds()
 
-                    bundle = DataBundle.objects.get(pk=bundle.pk)
+    if processed_bundle_count > 0:
+        logging.debug('PROCESSED: %d -- %.3f -- %.3f (%s / %s)', processed_bundle_count, elapsed, (elapsed / processed_bundle_count), new_point_count, bundle_size)
+    else:
+        logging.debug('PROCESSED: %d -- %.3f -- %.3f (%s / %s)', processed_bundle_count, elapsed, 0, new_point_count, bundle_size)
 
-                    bundle.errored = timezone.now()
-                    bundle.save()
+    transmit_remote_points(xmit_points, remote_timeout)
 
-                except TypeError:
-                    print('[TypeError] Abandoning and marking errored ' + str(bundle.pk) + '.')
+    for bundle in to_delete:
+        bundle.delete()
 
-                    bundle = DataBundle.objects.get(pk=bundle.pk)
+    return {
+        'processed_bundle_count': processed_bundle_count,
+        'new_point_count': new_point_count,
+        'bundle_size': bundle_size,
+        'elapsed': elapsed,
+        'seen_sources': seen_sources,
+        'seen_generators': seen_generators,
+        'source_identifiers': source_identifiers,
+        'latest_points': latest_points,
+    }
 
-                    bundle.errored = timezone.now()
-                    bundle.save()
 
-        end_processing = timezone.now()
+def merge_bundle_statistics(statistics, other):
+    if statistics is None:
+        return other
 
-        elapsed = (end_processing - start_processing).total_seconds()
+    if other is None:
+        return statistics
 
-        if processed_bundle_count > 0:
-            logging.debug('PROCESSED: %d -- %.3f -- %.3f (%s / %s)', processed_bundle_count, elapsed, (elapsed / processed_bundle_count), new_point_count, bundle_size)
-        else:
-            logging.debug('PROCESSED: %d -- %.3f -- %.3f (%s / %s)', processed_bundle_count, elapsed, 0, new_point_count, bundle_size)
+    statistics['processed_bundle_count'] += other['processed_bundle_count']
+    statistics['new_point_count'] += other['new_point_count']
+    statistics['bundle_size'] += other['bundle_size']
+    statistics['elapsed'] += other['elapsed']
 
-        for server_url, points in xmit_points.items():
-            if points:
-                payload = {
-                    'payload': json.dumps(points, indent=2)
-                }
+    for seen_source in other['seen_sources']:
+        if (seen_source in statistics['seen_sources']) is False:
+            statistics['seen_sources'].append(seen_source)
 
-                try:
-                    bundle_post = requests.post(server_url, data=payload, timeout=remote_timeout)
+    for seen_generator in other['seen_generators']:
+        if (seen_generator in statistics['seen_generators']) is False:
+            statistics['seen_generators'].append(seen_generator)
 
-                    if bundle_post.status_code < 200 and bundle_post.status_code >= 300:
-                        failed = True
+    for source, identifiers in other['source_identifiers'].items():
+        if (source in statistics['source_identifiers']) is False:
+            statistics['source_identifiers'][source] = []
 
-                    # print(server_url + ': ' + str(len(points)))
+        for identifier in identifiers:
+            if (identifier in statistics['source_identifiers'][source]) is False:
+                statistics['source_identifiers'][source].append(identifier)
 
-                    xmit_points[server_url] = []
-                except requests.exceptions.Timeout:
-                    print('Unable to transmit data to ' + server_url + ' (timeout=' + str(remote_timeout) + ').')
+    for latest_key, point in other['latest_points'].items():
+        if (latest_key in statistics['latest_points']) is False or statistics['latest_points'][latest_key].created < point.created:
+            statistics['latest_points'][latest_key] = point
 
-        for bundle in to_delete:
-            bundle.delete()
+    return statistics
 
-        if options['skip_stats'] is False:
-            data_point_count = DataServerMetadatum.objects.filter(key=TOTAL_DATA_POINT_COUNT_DATUM).first()
 
-            if data_point_count is None:
-                count = DataPoint.objects.all().count()
+def update_bundle_statistics(statistics): # pylint: disable=too-many-locals, too-many-branches
+    # Gathers every metadata change from the run in memory and writes them with a handful of
+    # bulk queries instead of a lookup and save per key.
 
-                data_point_count = DataServerMetadatum(key=TOTAL_DATA_POINT_COUNT_DATUM)
+    source_keys = {}
 
-                data_point_count.value = str(count)
-                data_point_count.save()
-            else:
-                count = int(data_point_count.value)
+    for source in statistics['source_identifiers']:
+        source_keys[source] = SOURCE_GENERATORS_DATUM + ': ' + source
 
-                count += new_point_count
+    keys = [TOTAL_DATA_POINT_COUNT_DATUM, SOURCES_DATUM, SOURCE_GENERATORS_DATUM]
+    keys.extend(source_keys.values())
 
-                data_point_count.value = str(count)
-                data_point_count.save()
+    current = DataServerMetadatum.objects.fetch_values(keys)
 
-            data_point_count = DataServerMetadatum.objects.filter(key=TOTAL_DATA_POINT_COUNT_DATUM).first()
+    updates = {}
 
-            sources = DataServerMetadatum.objects.filter(key=SOURCES_DATUM).first()
+    if TOTAL_DATA_POINT_COUNT_DATUM in current:
+        updates[TOTAL_DATA_POINT_COUNT_DATUM] = str(int(current[TOTAL_DATA_POINT_COUNT_DATUM]) + statistics['new_point_count'])
+    else:
+        DataPoint.objects.all().count() # Creates the cached count.
 
-            if sources is not None:
-                updated = False
+    if SOURCES_DATUM in current:
+        source_list = json.loads(current[SOURCES_DATUM])
 
-                source_list = json.loads(sources.value)
+        new_sources = [seen_source for seen_source in statistics['seen_sources'] if (seen_source in source_list) is False]
 
-                for seen_source in seen_sources:
-                    if (seen_source in source_list) is False:
-                        source_list.append(seen_source)
+        if new_sources:
+            updates[SOURCES_DATUM] = json.dumps(source_list + new_sources, indent=2)
+    else:
+        DataPoint.objects.sources() # Creates the cached source list.
 
-                        updated = True
+    for source, identifiers in statistics['source_identifiers'].items():
+        datum_key = source_keys[source]
 
-                if updated:
-                    sources.value = json.dumps(source_list, indent=2)
-                    sources.save()
-            else:
-                DataPoint.objects.sources()
+        source_ids = []
 
-            for source, identifiers in list(source_identifiers.items()):
-                datum_key = SOURCE_GENERATORS_DATUM + ': ' + source
-                source_id_datum = DataServerMetadatum.objects.filter(key=datum_key).first()
+        if datum_key in current:
+            source_ids = json.loads(current[datum_key])
 
-                source_ids = []
+        new_ids = [identifier for identifier in identifiers if (identifier in source_ids) is False]
 
-                if source_id_datum is not None:
-                    source_ids = json.loads(source_id_datum.value)
-                else:
-                    source_id_datum = DataServerMetadatum(key=datum_key)
+        if new_ids:
+            updates[datum_key] = json.dumps(source_ids + new_ids, indent=2)
+
+    generator_ids = []
+
+    if SOURCE_GENERATORS_DATUM in current:
+        generator_ids = json.loads(current[SOURCE_GENERATORS_DATUM])
+
+    new_ids = [identifier for identifier in statistics['seen_generators'] if (identifier in generator_ids) is False]
+
+    if new_ids:
+        updates[SOURCE_GENERATORS_DATUM] = json.dumps(generator_ids + new_ids, indent=2)
+
+    DataServerMetadatum.objects.store_values(updates)
 
-                updated = False
+    if statistics['latest_points']:
+        frequency_definition = DataGeneratorDefinition.definition_for_identifier('pdk-data-frequency')
 
-                for identifier in identifiers:
-                    if (identifier in source_ids) is False:
-                        source_ids.append(identifier)
+        latest_entries = []
 
-                        updated = True
+        for point in statistics['latest_points'].values():
+            latest_entries.append((point.source_reference_id, point.generator_definition_id, point,))
+            latest_entries.append((point.source_reference_id, frequency_definition.pk, point,))
 
-                if updated:
-                    source_id_datum.value = json.dumps(source_ids, indent=2)
-                    source_id_datum.save()
+        LatestDataPoint.objects.update_latest_points(latest_entries)
 
-            datum_key = SOURCE_GENERATORS_DATUM
-            generators_datum = DataServerMetadatum.objects.filter(key=datum_key).first()
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("%d unprocessed payloads remaining.", DataBundle.objects.filter(processed=False, errored=None).count())
 
-            generator_ids = []
 
-            if generators_datum is not None:
-                generator_ids = json.loads(generators_datum.value)
-            else:
-                generators_datum = DataServerMetadatum(key=datum_key)
+def claim_bundles(batch_size, after_pk=0):
+    # Claims a batch by stamping DataBundle.claimed in a short transaction, so no locks are held
+    # while the bundles are processed. Rows are picked with SELECT ... FOR UPDATE SKIP LOCKED,
+    # and claims older than PDK_BUNDLE_CLAIM_SECONDS (left by workers that died) are taken over.
 
-            updated = False
+    claim_seconds = 60 * 60
 
-            for identifier in seen_generators:
-                if (identifier in generator_ids) is False:
-                    generator_ids.append(identifier)
+    try:
+        claim_seconds = settings.PDK_BUNDLE_CLAIM_SECONDS
+    except AttributeError:
+        pass
 
-                    updated = True
+    now = timezone.now()
 
-            if updated:
-                generators_datum.value = json.dumps(generator_ids, indent=2)
-                generators_datum.save()
+    with transaction.atomic():
+        unclaimed = Q(claimed=None) | Q(claimed__lt=(now - datetime.timedelta(seconds=claim_seconds)))
 
-            for identifier, point in list(latest_points.items()):
-                DataPoint.objects.set_latest_point(point.source, point.generator_identifier, point)
-                DataPoint.objects.set_latest_point(point.source, 'pdk-data-frequency', point)
+        bundle_pks = list(DataBundle.objects.select_for_update(skip_locked=True).filter(unclaimed, processed=False, errored=None, pk__gt=after_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
 
-            logging.debug("%d unprocessed payloads remaining.", DataBundle.objects.filter(processed=False, errored=None).count())
+        DataBundle.objects.filter(pk__in=bundle_pks).update(claimed=now)
 
+    return list(DataBundle.objects.filter(pk__in=bundle_pks).order_by('pk'))
+
+def claim_bundles_worker(worker_options):
+    # Claims batches until the runtime passes or the worker's share of
+    # PDK_BUNDLE_PROCESS_LIMIT is used. Each bundle is ingested in its own transaction.
+
+    worker_start = time.time()
+
+    statistics = None
+    last_pk = 0
+    new_point_count = 0
+
+    while (time.time() - worker_start) < worker_options['runtime'] and new_point_count < worker_options['process_limit']:
+        bundles = claim_bundles(worker_options['batch_size'], after_pk=last_pk)
+
+        if len(bundles) == 0: # pylint: disable=len-as-condition
+            break
+
+        try:
+            batch_statistics = process_bundles(bundles, delete=worker_options['delete'], process_limit=(worker_options['process_limit'] - new_point_count))
+        finally:
+            DataBundle.objects.filter(pk__in=[bundle.pk for bundle in bundles], processed=False).update(claimed=None)
+
+        statistics = merge_bundle_statistics(statistics, batch_statistics)
+
+        new_point_count += batch_statistics['new_point_count']
+
+        # process_bundles stops early at the point limit, so resume after the last bundle it
+        # actually processed. Bundles after it were released above.
+
+        if batch_statistics['processed_bundle_count'] == 0:
+            break
+
+        last_pk = bundles[batch_statistics['processed_bundle_count'] - 1].pk
+
+    for connection in connections.all():
+        connection.close()
+
+    if statistics is None:
+        statistics = process_bundles([])
+
+    statistics['worker'] = os.getpid()
+    statistics['worker_elapsed'] = time.time() - worker_start
+
+    return statistics
+
+
+class Command(BaseCommand):
+    help = 'Convert unprocessed DataBundle instances into DataPoint instances.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete',
+                            action='store_true',
+                            dest='delete',
+                            default=False,
+                            help='Delete data bundles after processing')
+
+        parser.add_argument('--count',
+                            type=int,
+                            dest='bundle_count',
+                            default=50,
+                            help='Number of bundles to process in a single run')
+
+        parser.add_argument('--skip-stats',
+                            action='store_true',
+                            dest='skip_stats',
+                            default=False,
+                            help='Skips statistic updates for improved speeds')
+
+        parser.add_argument('--workers',
+                            type=int,
+                            dest='workers',
+                            default=1,
+                            help='Number of parallel worker processes claiming bundles from the database')
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=25,
+                            help='Number of bundles each worker claims per transaction (with --workers)')
+
+        parser.add_argument('--runtime',
+                            type=int,
+                            dest='runtime',
+                            default=240,
+                            help='Seconds each worker keeps claiming new batches (with --workers)')
+
+    @handle_lock
+    @log_scheduled_event
+    def handle(self, *args, **options):
+        if options['workers'] > 1:
+            statistics = self.process_parallel(options)
+        else:
+            statistics = process_bundles(DataBundle.objects.filter(processed=False, errored=None)[:options['bundle_count']], delete=options['delete'])
+
+        if options['skip_stats'] is False:
+            update_bundle_statistics(statistics)
         else:
             DataServerMetadatum.objects.filter(key=TOTAL_DATA_POINT_COUNT_DATUM).delete()
 
-        # elapsed = timezone.now() - start_time
+    def process_parallel(self, options): # pylint: disable=no-self-use
+        process_limit = 1000
+
+        try:
+            process_limit = settings.PDK_BUNDLE_PROCESS_LIMIT
+        except AttributeError:
+            pass
+
+        # PDK_BUNDLE_PROCESS_LIMIT applies to the whole run, so each worker takes a share.
+
+        worker_options = {
+            'batch_size': options['batch_size'],
+            'runtime': options['runtime'],
+            'delete': options['delete'],
+            'process_limit': int(math.ceil(float(process_limit) / options['workers'])),
+        }
+
+        # Forked children must not share the parent's database sockets.
+
+        for connection in connections.all():
+            connection.close()
+
+        pool = multiprocessing.Pool(processes=options['workers']) # pylint: disable=consider-using-with
+
+        try:
+            results = pool.map(claim_bundles_worker, [worker_options] * options['workers'])
+        finally:
+            pool.close()
+            pool.join()
+
+        statistics = None
+
+        for result in results:
+            elapsed = result['worker_elapsed']
+
+            points_per_second = 0.0
+
+            if elapsed > 0:
+                points_per_second = result['new_point_count'] / elapsed
+
+            logging.info('WORKER %s: %d bundles, %d points in %.3f seconds (%.1f points/sec)', result['worker'], result['processed_bundle_count'], result['new_point_count'], elapsed, points_per_second)
+
+            statistics = merge_bundle_statistics(statistics, result)
 
-        # print('Elapsed: ' + str(elapsed) + ' -- ' + str(processed_bundle_count) + ' bundles')
+        return statistics
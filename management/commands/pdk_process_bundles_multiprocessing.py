@@ -29,7 +29,7 @@ from django.db.transaction import TransactionManagementError
 from django.utils import timezone
 
 from ...decorators import handle_lock, log_scheduled_event
-from ...models import DataServerMetadatum, DataPoint, DataBundle, DataSource, \
+from ...models import DataServerMetadatum, DataPoint, DataBundle, DataSource, DataPointDailySummary, LatestDataPoint, \
                       install_supports_jsonfield, TOTAL_DATA_POINT_COUNT_DATUM, \
                       SOURCES_DATUM, SOURCE_GENERATORS_DATUM
 
@@ -37,6 +37,9 @@ def save_points(to_record, has_bundles, bundle_files, bundle):
     try:
         points = DataPoint.objects.bulk_create(to_record)
 
+        DataPointDailySummary.objects.record_points(points)
+        LatestDataPoint.objects.record_points(points)
+
         for point in points:
             if has_bundles:
                 point.fetch_bundle_files(bundle_files)
@@ -231,45 +234,13 @@ class Command(BaseCommand):
 
                         try:
                             if bundle_point is not None and 'passive-data-metadata' in bundle_point and 'source' in bundle_point['passive-data-metadata'] and 'generator' in bundle_point['passive-data-metadata']:
-                                source = bundle_point['passive-data-metadata']['source']
-
-                                if source == '':
-                                    source = 'missing-source'
-
-                                try:
-                                    source = settings.PDK_RENAME_SOURCE(source)
-
-                                    bundle_point['passive-data-metadata']['source'] = source
-                                except AttributeError:
-                                    pass # Optional method not defined
+                                server_url = DataSource.objects.ingest_source(bundle_point['passive-data-metadata'], sources)
 
                                 try:
                                     settings.PDK_INSPECT_DATA_POINT_AT_INGEST(bundle_point)
                                 except AttributeError:
                                     pass # Optional method not defined
 
-                                server_url = None
-
-                                if source in sources:
-                                    server_url = sources[source]
-                                else:
-                                    source_obj = DataSource.objects.filter(identifier=source).first()
-
-                                    if source_obj is not None:
-                                        if source_obj.server is not None:
-                                            server_url = source_obj.server.upload_url
-                                    else:
-                                        if source is not None:
-                                            source_obj = DataSource(name=source, identifier=source)
-                                            source_obj.save()
-
-                                            source_obj.join_default_group()
-
-                                    if server_url is None:
-                                        server_url = ''
-
-                                    sources[source] = server_url
-
                                 if server_url == '':
                                     point = DataPoint(recorded=now)
                                     bundle_point['passive-data-metadata']['encrypted_transmission'] = bundle.encrypted
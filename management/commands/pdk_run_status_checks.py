@@ -1,16 +1,106 @@
+# pylint: disable=no-member,line-too-long
+
+import importlib
+import json
+import multiprocessing
+import time
+import traceback
+
 from django.core.management import call_command, get_commands
 from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.utils import timezone
 
 from ...decorators import handle_lock, log_scheduled_event
+from ...models import DataServerMetadatum, DataSourceAlert, STATUS_CHECK_PERFORMANCE_DATUM
+
+def run_status_check(command_name):
+    # Runs one status check and reports its wall time, query count and the alerts it opened
+    # or closed. Query counts require Django 2.0 or later.
+
+    check_identifier = None
+
+    try:
+        module = importlib.import_module(get_commands()[command_name] + '.management.commands.' + command_name)
+
+        check_identifier = getattr(module, 'GENERATOR', getattr(module, 'DATA_CHECK', None))
+    except ImportError:
+        pass
+
+    query_count = [0]
+
+    def count_query(execute, sql, params, many, context):
+        query_count[0] += 1
+
+        return execute(sql, params, many, context)
+
+    start = timezone.now()
+    start_time = time.time()
+
+    succeeded = True
+
+    try:
+        if hasattr(connection, 'execute_wrapper'):
+            with connection.execute_wrapper(count_query):
+                call_command(command_name)
+        else:
+            query_count[0] = None # Django 1.11
+
+            call_command(command_name)
+    except: # pylint: disable=bare-except
+        traceback.print_exc()
+
+        succeeded = False
+
+    performance = {
+        'check': command_name,
+        'finished': timezone.now().isoformat(),
+        'elapsed': time.time() - start_time,
+        'queries': query_count[0],
+        'alerts_opened': None,
+        'alerts_closed': None,
+        'succeeded': succeeded,
+    }
+
+    if check_identifier is not None:
+        alerts = DataSourceAlert.objects.filter(generator_identifier=check_identifier)
+
+        performance['alerts_opened'] = alerts.filter(created__gte=start).count()
+        performance['alerts_closed'] = alerts.filter(active=False, updated__gte=start).count()
+
+    return performance
 
 class Command(BaseCommand):
     help = 'Runs data sanity checks to generate any alerts for potential data issues.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',
+                            type=int,
+                            dest='workers',
+                            default=4,
+                            help='Number of status checks to run concurrently')
+
     @handle_lock
     @log_scheduled_event
     def handle(self, *args, **options):
-        command_names = list(get_commands().keys())
+        command_names = sorted(command_name for command_name in get_commands().keys() if command_name.startswith('pdk_status_check_'))
 
-        for command_name in command_names:
-            if command_name.startswith('pdk_status_check_'):
-                call_command(command_name)
+        if options['workers'] > 1 and len(command_names) > 1:
+            # Forked children must not share the parent's database sockets.
+
+            for open_connection in connections.all():
+                open_connection.close()
+
+            pool = multiprocessing.Pool(processes=min(options['workers'], len(command_names))) # pylint: disable=consider-using-with
+
+            try:
+                results = pool.map(run_status_check, command_names)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [run_status_check(command_name) for command_name in command_names]
+
+        DataServerMetadatum.objects.store_values({
+            STATUS_CHECK_PERFORMANCE_DATUM: json.dumps(results, indent=2)
+        })
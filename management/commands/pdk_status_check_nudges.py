@@ -11,7 +11,7 @@ from django.utils import timezone
 
 from ...decorators import handle_lock
 
-from ...models import DataPoint, DataSource, DataSourceAlert, DataSourceReference, DataGeneratorDefinition
+from ...models import DataPoint, DataSource, DataSourceAlert
 
 GENERATOR = 'pdk-remote-nudge'
 CRITICAL_LEVEL = 12 * 60 * 60
@@ -21,7 +21,7 @@ class Command(BaseCommand):
     help = 'Determines if mobile devices are receiving silent push notifications.'
 
     @handle_lock
-    def handle(self, *args, **options): # pylint: disable=too-many-branches, too-many-statements, too-many-locals
+    def handle(self, *args, **options):
         try:
             if (GENERATOR in settings.PDK_ENABLED_CHECKS) is False:
                 DataSourceAlert.objects.filter(generator_identifier=GENERATOR, active=True).update(active=False)
@@ -33,63 +33,37 @@ class Command(BaseCommand):
 
         here_tz = pytz.timezone(settings.TIME_ZONE)
 
-        for source in DataSource.objects.all(): # pylint: disable=too-many-nested-blocks
-            now = timezone.now()
+        now = timezone.now()
 
-            source_reference = DataSourceReference.reference_for_source(source.identifier)
-            generator_definition = DataGeneratorDefinition.definition_for_identifier('pdk-app-event')
+        secondary_query = Q(secondary_identifier='app_recv_remote_notification') | Q(secondary_identifier='pdk-received-firebase-message')
 
+        latest_events = DataPoint.objects.latest_points_by_source(['pdk-app-event'], query=secondary_query)
+
+        alerts = {}
+        suppressed = []
+
+        for source in DataSource.objects.all().select_related('group', 'server'):
             if source.should_suppress_alerts():
-                DataSourceAlert.objects.filter(data_source=source, generator_identifier=GENERATOR, active=True).update(active=False)
+                suppressed.append(source)
+
+                continue
+
+            last_event = latest_events.get(source.identifier, None)
+
+            alerts[source] = None
+
+            if last_event is not None:
+                delta = now - last_event.created
+
+                when = last_event.created.astimezone(here_tz)
+
+                message = 'Device not received push notifications since ' + when.strftime('%H:%M on %b %d, %Y') + '.'
+
+                if delta.total_seconds() > CRITICAL_LEVEL:
+                    alerts[source] = ('Push Notifications Delayed', 'critical', {'message': message})
+                elif delta.total_seconds() > WARNING_LEVEL:
+                    alerts[source] = ('Push Notifications Delayed', 'warning', {'message': message})
             else:
-                secondary_query = Q(secondary_identifier='app_recv_remote_notification') | Q(secondary_identifier='pdk-received-firebase-message')
-
-                last_event = DataPoint.objects.filter(source_reference=source_reference, generator_definition=generator_definition).filter(secondary_query).order_by('-created').first()
-                last_alert = DataSourceAlert.objects.filter(data_source=source, generator_identifier=GENERATOR, active=True).order_by('-created').first()
-
-                alert_name = None
-                alert_details = {}
-                alert_level = 'info'
-
-                if last_event is not None:
-                    delta = now - last_event.created
-
-                    when = last_event.created.astimezone(here_tz)
-
-                    if delta.total_seconds() > CRITICAL_LEVEL:
-                        alert_name = 'Push Notifications Delayed'
-                        alert_details['message'] = 'Device not received push notifications since ' + when.strftime('%H:%M on %b %d, %Y') + '.'
-                        alert_level = 'critical'
-                    elif delta.total_seconds() > WARNING_LEVEL:
-                        alert_name = 'Push Notifications Delayed'
-                        alert_details['message'] = 'Device not received push notifications since ' + when.strftime('%H:%M on %b %d, %Y') + '.'
-                        alert_level = 'warning'
-                else:
-                    alert_name = 'Push Notifications Never Received'
-                    alert_details['message'] = 'Device has never received push notifications.'
-
-                if alert_name is not None:
-                    if last_alert is None or last_alert.alert_name != alert_name or last_alert.alert_level != alert_level:
-                        if last_alert is not None:
-                            last_alert.active = False
-                            last_alert.updated = timezone.now()
-                            last_alert.save()
-
-                        new_alert = DataSourceAlert(alert_name=alert_name, data_source=source, generator_identifier=GENERATOR)
-                        new_alert.alert_level = alert_level
-                        new_alert.update_alert_details(alert_details)
-                        new_alert.created = timezone.now()
-                        new_alert.updated = timezone.now()
-                        new_alert.active = True
-
-                        new_alert.save()
-                    else:
-                        last_alert.updated = timezone.now()
-                        last_alert.update_alert_details(alert_details)
-
-                        last_alert.save()
-                elif last_alert is not None:
-                    last_alert.updated = timezone.now()
-                    last_alert.active = False
-
-                    last_alert.save()
+                alerts[source] = ('Push Notifications Never Received', 'info', {'message': 'Device has never received push notifications.'})
+
+        DataSourceAlert.objects.update_alerts(GENERATOR, alerts, suppressed)
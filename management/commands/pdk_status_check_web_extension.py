@@ -6,12 +6,11 @@ from builtins import str # pylint: disable=redefined-builtin
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db.models import Q
 from django.utils import timezone
 
 from ...decorators import handle_lock
 
-from ...models import DataPoint, DataSource, DataSourceAlert, DataSourceReference, DataGeneratorDefinition
+from ...models import DataPoint, DataSource, DataSourceAlert, DataSourceReference
 
 GENERATOR = 'pdk-web-extension'
 
@@ -35,7 +34,7 @@ class Command(BaseCommand):
     help = 'Determines if users have successfully installed and used the web extension.'
 
     @handle_lock
-    def handle(self, *args, **options): # pylint: disable=too-many-branches, too-many-statements, too-many-locals
+    def handle(self, *args, **options):
         try:
             if (GENERATOR in settings.PDK_ENABLED_CHECKS) is False:
                 DataSourceAlert.objects.filter(generator_identifier=GENERATOR, active=True).update(active=False)
@@ -45,89 +44,40 @@ class Command(BaseCommand):
             print('Did not find PDK_ENABLED_CHECKS in Django settings. Please define with a list of generators with status checks to enable.')
             print('Example: PDK_ENABLED_CHECKS = (\'' + GENERATOR + '\',)')
 
-        event_query = None
+        referenced_sources = set(DataSourceReference.objects.values_list('source', flat=True))
 
-        for event in GENERATOR_EVENTS:
-            definition = DataGeneratorDefinition.objects.filter(generator_identifier=event).first()
+        latest_events = DataPoint.objects.latest_points_by_source(GENERATOR_EVENTS)
+        latest_uploads = DataPoint.objects.latest_points_by_source(['pdk-web-upload-visit'])
 
-            if definition is not None:
-                if event_query is None:
-                    event_query = Q(generator_definition=definition)
-                else:
-                    event_query = event_query | Q(generator_definition=definition) # pylint: disable=unsupported-binary-operation
+        alerts = {}
+        suppressed = []
+
+        for source in DataSource.objects.all().select_related('group', 'server'):
+            if (source.identifier in referenced_sources) is False:
+                continue
+
+            if source.should_suppress_alerts():
+                suppressed.append(source)
+
+                continue
 
-        for source in DataSource.objects.all(): # pylint: disable=too-many-nested-blocks
-            source_reference = DataSourceReference.objects.filter(source=source.identifier).first()
+            alerts[source] = None
 
-            if source_reference is not None:
-                if source.should_suppress_alerts():
-                    DataSourceAlert.objects.filter(data_source=source, generator_identifier=GENERATOR, active=True).update(active=False)
+            if (source.identifier in latest_events) is False:
+                alerts[source] = ('Browser extension not installed', 'critical', {'message': 'There is no evidence that the browser extension was successfully installed.'})
+            else:
+                last_upload = latest_uploads.get(source.identifier, None)
+
+                if last_upload is None:
+                    alerts[source] = ('No Web Visits Uploaded', 'critical', {'message': 'The user has not yet uploaded any web visits from the extension.'})
                 else:
-                    last_web_event = None
-
-                    for event in GENERATOR_EVENTS:
-                        definition = DataGeneratorDefinition.objects.filter(generator_identifier=event).first()
-                        web_event = DataPoint.objects.filter(source_reference=source_reference, generator_definition=definition).order_by('-created').first()
-
-                        if web_event is not None:
-                            if last_web_event is None:
-                                last_web_event = web_event
-                            elif web_event.created > last_web_event.created:
-                                last_web_event = web_event
-
-                    last_alert = DataSourceAlert.objects.filter(data_source=source, generator_identifier=GENERATOR, active=True).order_by('-created').first()
-
-                    alert_name = None
-                    alert_details = {}
-                    alert_level = 'info'
-
-                    if last_web_event is None:
-                        alert_name = 'Browser extension not installed'
-                        alert_details['message'] = 'There is no evidence that the browser extension was successfully installed.'
-                        alert_level = 'critical'
-                    else:
-                        definition = DataGeneratorDefinition.objects.filter(generator_identifier='pdk-web-upload-visit').first()
-
-                        last_upload = DataPoint.objects.filter(source_reference=source_reference, generator_definition=definition).order_by('-created').first()
-
-                        if last_upload is None:
-                            alert_name = 'No Web Visits Uploaded'
-                            alert_details['message'] = 'The user has not yet uploaded any web visits from the extension.'
-                            alert_level = 'critical'
-                        else:
-                            days_since = (timezone.now() - last_upload.created).days
-
-                            if days_since > CRITICAL_DAYS:
-                                alert_name = 'No Recent Web Visits Uploaded'
-                                alert_details['message'] = 'No web visits have been uploaded in the past ' + str(days_since) + ' days.'
-                                alert_level = 'critical'
-                            elif days_since > WARNING_DAYS:
-                                alert_name = 'No Recent Web Visits Uploaded'
-                                alert_details['message'] = 'No web visits have been uploaded in the past ' + str(days_since) + ' days.'
-                                alert_level = 'warning'
-
-                    if alert_name is not None:
-                        if last_alert is None or last_alert.alert_name != alert_name or last_alert.alert_level != alert_level:
-                            if last_alert is not None:
-                                last_alert.active = False
-                                last_alert.updated = timezone.now()
-                                last_alert.save()
-
-                            new_alert = DataSourceAlert(alert_name=alert_name, data_source=source, generator_identifier=GENERATOR)
-                            new_alert.alert_level = alert_level
-                            new_alert.update_alert_details(alert_details)
-                            new_alert.created = timezone.now()
-                            new_alert.updated = timezone.now()
-                            new_alert.active = True
-
-                            new_alert.save()
-                        else:
-                            last_alert.updated = timezone.now()
-                            last_alert.update_alert_details(alert_details)
-
-                            last_alert.save()
-                    elif last_alert is not None:
-                        last_alert.updated = timezone.now()
-                        last_alert.active = False
-
-                        last_alert.save()
+                    days_since = (timezone.now() - last_upload.created).days
+
+                    message = 'No web visits have been uploaded in the past ' + str(days_since) + ' days.'
+
+                    if days_since > CRITICAL_DAYS:
+                        alerts[source] = ('No Recent Web Visits Uploaded', 'critical', {'message': message})
+                    elif days_since > WARNING_DAYS:
+                        alerts[source] = ('No Recent Web Visits Uploaded', 'warning', {'message': message})
+
+        DataSourceAlert.objects.update_alerts(GENERATOR, alerts, suppressed)
@@ -1,10 +1,38 @@
 # pylint: disable=no-member, line-too-long
 
+import logging
+import time
+
 from django.core.management.base import BaseCommand
+from django.db.models import F
 
 from ...decorators import handle_lock, log_scheduled_event
 from ...models import DataSource, DataServer
 
+def update_local_sources(batch_size, time_budget):
+    # Refreshes local sources stalest first, a batch at a time, until every source is current
+    # or the time budget is spent.
+
+    start = time.time()
+
+    source_pks = list(DataSource.objects.filter(server=None, suppress_alerts=False)\
+                                        .order_by(F('performance_metadata_updated').asc(nulls_first=True), 'pk')\
+                                        .values_list('pk', flat=True))
+
+    updated = 0
+
+    for index in range(0, len(source_pks), batch_size):
+        if (time.time() - start) > time_budget:
+            break
+
+        sources = list(DataSource.objects.filter(pk__in=source_pks[index:(index + batch_size)]).select_related('server'))
+
+        updated += DataSource.objects.update_performance_metadata(sources)
+
+    logging.info('pdk_update_performance_metadata: Updated %d of %d sources in %.3f seconds.', updated, len(source_pks), time.time() - start)
+
+    return updated
+
 class Command(BaseCommand):
     help = 'Updates each user performance metadata measurements on a round-robin basis'
 
@@ -15,6 +43,24 @@ class Command(BaseCommand):
                             default='any',
                             help='Specific source to update')
 
+        parser.add_argument('--batch',
+                            action='store_true',
+                            dest='batch',
+                            default=False,
+                            help='Update all local sources in batches instead of one source per run')
+
+        parser.add_argument('--batch-size',
+                            type=int,
+                            dest='batch_size',
+                            default=500,
+                            help='Number of local sources updated together (with --batch)')
+
+        parser.add_argument('--time-budget',
+                            type=int,
+                            dest='time_budget',
+                            default=240,
+                            help='Seconds after which no new batch is started (with --batch)')
+
     @handle_lock
     @log_scheduled_event
     def handle(self, *args, **options):
@@ -26,6 +72,11 @@ class Command(BaseCommand):
         servers.append(None)
 
         for server in servers:
+            if server is None and options['batch'] and options['source'] == 'any':
+                update_local_sources(options['batch_size'], options['time_budget'])
+
+                continue
+
             source = None
 
             if options['source'] != 'any':
@@ -0,0 +1,29 @@
+# pylint: skip-file
+# Generated by Django 4.2.23 on 2026-10-18 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passive_data_kit', '0100_alter_appconfiguration_configuration_json_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestDataPoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField()),
+                ('updated', models.DateTimeField()),
+                ('data_point', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='passive_data_kit.datapoint')),
+                ('generator_definition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_points', to='passive_data_kit.datageneratordefinition')),
+                ('source_reference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='latest_points', to='passive_data_kit.datasourcereference')),
+            ],
+            options={
+                'unique_together': {('source_reference', 'generator_definition')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# pylint: skip-file
+# Generated by Django 4.2.23 on 2026-10-18 14:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passive_data_kit', '0101_latestdatapoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataPointDailySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('point_count', models.BigIntegerField(default=0)),
+                ('first_created', models.DateTimeField()),
+                ('last_created', models.DateTimeField()),
+                ('last_recorded', models.DateTimeField()),
+                ('generator_definition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to='passive_data_kit.datageneratordefinition')),
+                ('source_reference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to='passive_data_kit.datasourcereference')),
+            ],
+            options={
+                'verbose_name_plural': 'data point daily summaries',
+                'unique_together': {('source_reference', 'generator_definition', 'day')},
+            },
+        ),
+    ]
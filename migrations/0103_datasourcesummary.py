@@ -0,0 +1,30 @@
+# pylint: skip-file
+# Generated by Django 4.2.23 on 2026-10-18 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passive_data_kit', '0102_datapointdailysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSourceSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_agent', models.CharField(blank=True, max_length=1024, null=True)),
+                ('latest_point_created', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('point_count', models.BigIntegerField(blank=True, db_index=True, null=True)),
+                ('point_frequency', models.FloatField(blank=True, null=True)),
+                ('updated', models.DateTimeField()),
+                ('source', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='passive_data_kit.datasource')),
+            ],
+            options={
+                'verbose_name_plural': 'data source summaries',
+            },
+        ),
+    ]
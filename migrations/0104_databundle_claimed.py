@@ -0,0 +1,19 @@
+# pylint: skip-file
+# Generated by Django 4.2.23 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passive_data_kit', '0103_datasourcesummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='databundle',
+            name='claimed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
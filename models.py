@@ -9,8 +9,11 @@ from builtins import object # pylint: disable=redefined-builtin
 
 import calendar
 import datetime
+import hashlib
 import json
+import logging
 import random
+import re
 import string
 import sys
 
@@ -21,6 +24,7 @@ from future import standard_library
 from past.utils import old_div
 
 import arrow
+import pytz
 import requests
 
 from six import python_2_unicode_compatible
@@ -30,8 +34,9 @@ import django
 from django.conf import settings
 from django.core.checks import Warning, register # pylint: disable=redefined-builtin
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
-from django.db import connection
-from django.db.models import Q, QuerySet
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Count, Max, Min, Q, QuerySet, Sum
+from django.db.models.expressions import RawSQL
 from django.db.models.signals import post_delete, pre_save, post_save
 from django.dispatch.dispatcher import receiver
 from django.urls import reverse
@@ -60,6 +65,7 @@ SOURCE_GENERATORS_DATUM = 'Data Point Source Generator Identifiers'
 LATEST_POINT_DATUM = 'Latest Data Point'
 MISSING_POINT_DATUM = 'Missing Data Point'
 GENERATORS_DATUM = 'Data Point Generators'
+STATUS_CHECK_PERFORMANCE_DATUM = 'Status Check Performance'
 
 ALERT_LEVEL_CHOICES = (
     ('info', 'Informative'),
@@ -81,8 +87,19 @@ try:
 except AttributeError:
     pass
 
+DAILY_SUMMARY_RECONCILE_HOURS = 24
+
+try:
+    DAILY_SUMMARY_RECONCILE_HOURS = settings.PDK_DAILY_SUMMARY_RECONCILE_HOURS
+except AttributeError:
+    pass
+
 CACHED_GENERATOR_DEFINITIONS = {}
 CACHED_SOURCE_REFERENCES = {}
+CACHED_APP_CONFIGURATIONS = {}
+
+APP_CONFIGURATION_CACHE_SECONDS = 60
+APP_CONFIGURATION_CACHE_MAX_ENTRIES = 10000
 
 COMPRESSION_CHOICES = (
     ('none', 'None'),
@@ -136,6 +153,140 @@ def check_prettyjson_installed(app_configs, **kwargs): # pylint: disable=unused-
 
     return errors
 
+def app_configuration_body(configuration):
+    # Returns the response body served for a configuration and its ETag.
+
+    body = json.dumps(configuration, indent=2)
+
+    return body, '"' + hashlib.md5(body.encode('utf-8')).hexdigest() + '"'
+
+class AppConfigurationManager(models.Manager):
+    def compiled_configurations(self):
+        # The compiled patterns of the valid and enabled configurations in evaluation order,
+        # plus the bodies serialized so far (see configuration_body). Kept for this process
+        # until a configuration is saved or deleted here, or until
+        # PDK_APP_CONFIGURATION_CACHE_SECONDS pass (so changes saved by other processes are
+        # picked up too).
+
+        now = timezone.now()
+
+        cache_seconds = APP_CONFIGURATION_CACHE_SECONDS
+
+        try:
+            cache_seconds = settings.PDK_APP_CONFIGURATION_CACHE_SECONDS
+        except AttributeError:
+            pass
+
+        compiled = CACHED_APP_CONFIGURATIONS.get('compiled', None)
+
+        if compiled is not None and (now - compiled['built']).total_seconds() < cache_seconds:
+            return compiled
+
+        compiled = {
+            'built': now,
+            'bodies': {},
+            'matchers': [],
+            'sources': {},
+            'resolved': {},
+            'resolved_count': 0,
+        }
+
+        for config in self.filter(is_valid=True, is_enabled=True).order_by('evaluate_order', 'pk').only('pk', 'id_pattern', 'context_pattern'):
+            try:
+                context_regex = None if config.context_pattern == '.*' else re.compile(config.context_pattern)
+            except re.error:
+                logging.warning('AppConfiguration %s: skipping invalid context pattern.', config.pk)
+
+                continue
+
+            id_regex = None
+            id_searchable = True
+
+            try:
+                if config.id_pattern != '.*':
+                    id_regex = re.compile(config.id_pattern)
+            except re.error: # Still matched exactly against identifiers.
+                logging.warning('AppConfiguration %s: invalid id pattern, matching exactly only.', config.pk)
+
+                id_searchable = False
+
+            compiled['matchers'].append((config.pk, config.id_pattern, id_regex, id_searchable, context_regex))
+
+        CACHED_APP_CONFIGURATIONS['compiled'] = compiled
+
+        return compiled
+
+    def clear_cache(self, identifier=None):
+        compiled = CACHED_APP_CONFIGURATIONS.get('compiled', None)
+
+        if identifier is None or compiled is None:
+            CACHED_APP_CONFIGURATIONS.pop('compiled', None)
+        else:
+            compiled['sources'].pop(identifier, None)
+            compiled['resolved_count'] -= len(compiled['resolved'].pop(identifier, {}))
+
+    def configuration_body(self, compiled, config_pk):
+        # Serializes a configuration the first time it is served. A configuration that cannot be
+        # loaded or serialized is logged and served as an empty configuration, so it only
+        # affects the clients it is assigned to.
+
+        if (config_pk in compiled['bodies']) is False:
+            try:
+                compiled['bodies'][config_pk] = app_configuration_body(self.get(pk=config_pk).configuration())
+            except (ObjectDoesNotExist, TypeError, ValueError):
+                logging.warning('AppConfiguration %s: unable to serialize configuration.', config_pk, exc_info=True)
+
+                compiled['bodies'][config_pk] = app_configuration_body({})
+
+        return compiled['bodies'][config_pk]
+
+    def resolve_configuration(self, identifier, context):
+        # Returns the (body, ETag) served to a client: the configuration assigned to its
+        # DataSource, else the first configuration whose id_pattern equals the identifier and
+        # whose context_pattern matches, else the first whose patterns both match.
+
+        compiled = self.compiled_configurations()
+
+        resolved = compiled['resolved'].get(identifier, {}).get(context, None)
+
+        if resolved is not None:
+            return resolved
+
+        if (identifier in compiled['sources']) is False:
+            compiled['sources'][identifier] = DataSource.objects.filter(identifier=identifier).values_list('configuration_id', flat=True).first()
+
+        config_pk = compiled['sources'][identifier]
+
+        if config_pk is None:
+            for matcher_pk, id_pattern, id_regex, id_searchable, context_regex in compiled['matchers']:
+                if id_pattern == identifier and (context_regex is None or context_regex.search(context) is not None):
+                    config_pk = matcher_pk
+
+                    break
+
+        if config_pk is None:
+            for matcher_pk, id_pattern, id_regex, id_searchable, context_regex in compiled['matchers']:
+                if id_searchable and (id_regex is None or id_regex.search(identifier) is not None):
+                    if context_regex is None or context_regex.search(context) is not None:
+                        config_pk = matcher_pk
+
+                        break
+
+        if config_pk is None:
+            resolved = app_configuration_body({})
+        else:
+            resolved = self.configuration_body(compiled, config_pk)
+
+        if compiled['resolved_count'] >= APP_CONFIGURATION_CACHE_MAX_ENTRIES:
+            compiled['resolved'] = {}
+            compiled['sources'] = {}
+            compiled['resolved_count'] = 0
+
+        compiled['resolved'].setdefault(identifier, {})[context] = resolved
+        compiled['resolved_count'] += 1
+
+        return resolved
+
 @python_2_unicode_compatible
 class AppConfiguration(models.Model):
     class Meta(object): # pylint: disable=old-style-class, no-init, too-few-public-methods, bad-option-value
@@ -146,6 +297,8 @@ class AppConfiguration(models.Model):
 
         ordering = ['name']
 
+    objects = AppConfigurationManager()
+
     name = models.CharField(max_length=1024)
     id_pattern = models.CharField(max_length=1024, db_index=True)
     context_pattern = models.CharField(max_length=1024, default='.*', db_index=True)
@@ -169,6 +322,11 @@ class AppConfiguration(models.Model):
     def __str__(self):
         return str(self.name)
 
+@receiver(post_save, sender=AppConfiguration)
+@receiver(post_delete, sender=AppConfiguration)
+def app_configuration_changed(sender, instance, *args, **kwargs): # pylint: disable=unused-argument
+    AppConfiguration.objects.clear_cache()
+
 @python_2_unicode_compatible
 class DataGeneratorDefinition(models.Model):
     generator_identifier = models.CharField(max_length=1024)
@@ -273,6 +431,92 @@ class DataPointQuerySet(QuerySet):
 
         return int(data_point_count.value)
 
+    def histogram(self, field, start, end, interval):
+        # Counts points in interval-second buckets over [start, end) with a single GROUP BY.
+        # Returns (bucket start timestamp, count) tuples, including empty buckets.
+
+        start_timestamp = calendar.timegm(start.utctimetuple())
+        end_timestamp = calendar.timegm(end.utctimetuple())
+
+        column = '"%s"."%s"' % (self.model._meta.db_table, self.model._meta.get_field(field).column) # pylint: disable=protected-access
+
+        bucket = RawSQL('FLOOR((EXTRACT(EPOCH FROM ' + column + ') - %s) / %s)', (start_timestamp, interval,)) # nosec
+
+        query = self.filter(**{(field + '__gte'): start, (field + '__lt'): end}).order_by()
+        query = query.annotate(pdk_bucket=bucket).values('pdk_bucket').annotate(pdk_count=Count('pk'))
+
+        bucket_counts = {}
+
+        for row in query:
+            bucket_counts[int(row['pdk_bucket'])] = row['pdk_count']
+
+        histogram = []
+
+        bucket_index = 0
+        bucket_start = start_timestamp
+
+        while bucket_start < end_timestamp:
+            histogram.append((bucket_start, bucket_counts.get(bucket_index, 0),))
+
+            bucket_index += 1
+            bucket_start += interval
+
+        return histogram
+
+    def timestamp_counts(self, start, end, interval=600, field='created'):
+        timestamp_counts = {}
+
+        keys = []
+
+        for bucket_start, bucket_count in self.histogram(field, start, end, interval):
+            timestamp = str(bucket_start)
+
+            keys.append(timestamp)
+
+            timestamp_counts[timestamp] = bucket_count
+
+        timestamp_counts['keys'] = keys
+
+        return timestamp_counts
+
+    def keyset_iterator(self, batch_size=5000, field='created', descending=False, after=None):
+        # Walks the query in (field, pk) order, one page at a time. Each page resumes after
+        # the last row seen instead of using OFFSET, so later pages cost the same as the
+        # first, and rows are streamed from a server-side cursor to keep memory bounded.
+        # Passing the (field value, pk) of a previously seen row as after resumes from it.
+
+        if descending:
+            query = self.order_by('-' + field, '-pk')
+            comparison = '__lt'
+        else:
+            query = self.order_by(field, 'pk')
+            comparison = '__gt'
+
+        last_value = None
+        last_pk = None
+
+        if after is not None:
+            last_value, last_pk = after
+
+        while True:
+            page = query
+
+            if last_pk is not None:
+                page = page.filter(Q(**{(field + comparison): last_value}) | Q(**{field: last_value, ('pk' + comparison): last_pk}))
+
+            fetched = 0
+
+            for point in page[:batch_size].iterator():
+                fetched += 1
+
+                last_value = getattr(point, field)
+                last_pk = point.pk
+
+                yield point
+
+            if fetched < batch_size:
+                return
+
 
 class DataPointManager(models.Manager):
     def get_queryset(self):
@@ -288,6 +532,12 @@ class DataPointManager(models.Manager):
         return sources
 
     def generator_identifiers_for_source(self, source, since=None): # pylint: disable=invalid-name, no-self-use
+        if since is None:
+            identifiers = list(LatestDataPoint.objects.filter(source_reference__source=source).exclude(generator_definition__generator_identifier='pdk-data-frequency').values_list('generator_definition__generator_identifier', flat=True))
+
+            if identifiers:
+                return identifiers
+
         identifiers = []
 
         source_reference = DataSourceReference.reference_for_source(source)
@@ -329,21 +579,34 @@ class DataPointManager(models.Manager):
         return identifiers
 
     def latest_point(self, source, identifier): # pylint: disable=no-self-use
+        point = LatestDataPoint.objects.latest_point(source, identifier)
+
+        if point is not None:
+            return point
+
+        source_reference = DataSourceReference.objects.filter(source=source).first()
+
+        if source_reference is None:
+            return None
+
+        generator_definition = DataGeneratorDefinition.objects.filter(generator_identifier=identifier).first()
+
+        if generator_definition is None:
+            if identifier != 'pdk-data-frequency':
+                return None
+
+            generator_definition = DataGeneratorDefinition.definition_for_identifier(identifier)
+
+        # Not indexed yet - fall back to the legacy metadata pointer or a scan, and index the result.
+
         key = LATEST_POINT_DATUM + ': ' + source + '/' + identifier
 
         latest_point_datum = DataServerMetadatum.objects.filter(key=key).first()
 
-        point = None
-
         if latest_point_datum is not None:
             point = DataPoint.objects.filter(pk=int(latest_point_datum.value)).first()
 
         if point is None:
-            source_reference = DataSourceReference.objects.filter(source=source).first()
-
-            if source_reference is None:
-                return None
-
             if identifier == 'pdk-data-frequency':
                 data_source = DataSource.objects.filter(identifier=source).first()
 
@@ -354,38 +617,90 @@ class DataPointManager(models.Manager):
                     if DataPoint.objects.filter(source_reference=source_reference).count() > 0:
                         point = DataPoint.objects.filter(source_reference=source_reference).order_by('-pk').first()
             else:
-                generator_definition = DataGeneratorDefinition.objects.filter(generator_identifier=identifier).first()
-
-                if generator_definition is None:
-                    return None
-
                 if DataPoint.objects.filter(source_reference=source_reference, generator_definition=generator_definition).count() > 0:
                     point = DataPoint.objects.filter(source_reference=source_reference, generator_definition=generator_definition).order_by('-pk').first()
 
-            if point is not None:
-                latest_point_datum = DataServerMetadatum.objects.filter(key=key).first()
+        if point is not None and point.generator_identifier != 'pdk-virtual-point':
+            LatestDataPoint.objects.update_latest_points([(source_reference.pk, generator_definition.pk, point)])
+
+        return point
 
-                if latest_point_datum is None:
-                    latest_point_datum = DataServerMetadatum(key=key)
+    def set_latest_point(self, source, identifier, new_point): # pylint: disable=no-self-use
+        source_reference = DataSourceReference.reference_for_source(source)
+        generator_definition = DataGeneratorDefinition.definition_for_identifier(identifier)
 
-                latest_point_datum.value = str(point.pk)
-                latest_point_datum.save()
+        LatestDataPoint.objects.update_latest_points([(source_reference.pk, generator_definition.pk, new_point)])
 
-        return point
+    def latest_points_by_source(self, identifiers, query=None):
+        # Returns {source identifier: newest point} across the given generators, read from the
+        # LatestDataPoint index rather than scanning the points table. When query narrows the
+        # points further, sources whose indexed point does not match fall back to a newest
+        # matching point lookup.
+
+        latest_points = {}
+
+        for identifier in identifiers:
+            for source, point in LatestDataPoint.objects.latest_points(identifier).items():
+                if (source in latest_points) is False or latest_points[source].created < point.created:
+                    latest_points[source] = point
+
+        if query is None:
+            return latest_points
+
+        matching_pks = set(self.filter(pk__in=[point.pk for point in latest_points.values()]).filter(query).values_list('pk', flat=True))
+
+        for source, point in list(latest_points.items()):
+            if (point.pk in matching_pks) is False:
+                point = self.filter(source_reference_id=point.source_reference_id, generator_definition__generator_identifier__in=list(identifiers)).filter(query).order_by('-created').first()
+
+                if point is None:
+                    del latest_points[source]
+                else:
+                    latest_points[source] = point
+
+        return latest_points
+
+    def purge_points(self, point_pks, batch_size=10000): # pylint: disable=no-self-use
+        # Deletes points by primary key with one DELETE per batch, bypassing Django's per-object
+        # cascade collection. Rows that reference the points (DataFile, LatestDataPoint) are
+        # removed explicitly first, and the affected sources' daily summaries are rebuilt
+        # afterwards. Returns the number of points removed.
+
+        point_pks = list(point_pks)
+
+        deleted = 0
 
-    def set_latest_point(self, source, identifier, new_point):
-        latest_point = self.latest_point(source, identifier)
+        source_reference_ids = set()
 
-        if latest_point is None or latest_point.created < new_point.created:
-            key = LATEST_POINT_DATUM + ': ' + source + '/' + identifier
+        point_table = connection.ops.quote_name(DataPoint._meta.db_table) # pylint: disable=protected-access
+        file_table = connection.ops.quote_name(DataFile._meta.db_table) # pylint: disable=protected-access
+        latest_table = connection.ops.quote_name(LatestDataPoint._meta.db_table) # pylint: disable=protected-access
 
-            latest_point_datum = DataServerMetadatum.objects.filter(key=key).first()
+        for index in range(0, len(point_pks), batch_size):
+            batch = point_pks[index:(index + batch_size)]
 
-            if latest_point_datum is None:
-                latest_point_datum = DataServerMetadatum(key=key)
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('DELETE FROM ' + file_table + ' WHERE data_point_id = ANY(%s)', (batch,)) # nosec
+                    cursor.execute('DELETE FROM ' + latest_table + ' WHERE data_point_id = ANY(%s)', (batch,)) # nosec
+                    cursor.execute('DELETE FROM ' + point_table + ' WHERE id = ANY(%s) RETURNING source_reference_id', (batch,)) # nosec
 
-            latest_point_datum.value = str(new_point.pk)
-            latest_point_datum.save()
+                    deleted += cursor.rowcount
+
+                    for row in cursor.fetchall():
+                        if row[0] is not None:
+                            source_reference_ids.add(row[0])
+
+        if deleted > 0:
+            data_point_count = DataServerMetadatum.objects.filter(key=TOTAL_DATA_POINT_COUNT_DATUM).first()
+
+            if data_point_count is not None:
+                data_point_count.value = str(max(0, int(data_point_count.value) - deleted))
+                data_point_count.save()
+
+            DataPointDailySummary.objects.rebuild_summaries(source_reference_ids)
+
+        return deleted
 
     def create_data_point(self, identifier, source, payload, user_agent='Passive Data Kit Server', created=None, skip_save=False, skip_extract_secondary_identifier=False): # pylint: disable=no-self-use, too-many-arguments, invalid-name, too-many-positional-arguments
         now = timezone.now()
@@ -612,10 +927,71 @@ def data_point_post_save(sender, instance, *args, **kwargs): # pylint: disable=u
     except AttributeError:
         pass
 
+    # Points saved one at a time (rather than bulk created by ingest) are indexed and summarized
+    # here, so every write path keeps the latest point index and daily summaries current. Each
+    # is a single upsert; PDK_ADD_DATA_POINT_AS_BUNDLE moves single-point uploads onto ingest's
+    # batched path instead.
+
+    if kwargs.get('created', False) and kwargs.get('raw', False) is False and instance.generator_identifier != 'pdk-virtual-point':
+        if instance.source is not None and (instance.source_reference_id is None or instance.generator_definition_id is None):
+            instance.fetch_generator_definition(skip_save=True)
+            instance.fetch_source_reference(skip_save=True)
+
+            DataPoint.objects.filter(pk=instance.pk).update(generator_definition=instance.generator_definition, source_reference=instance.source_reference)
+
+        LatestDataPoint.objects.record_points([instance])
+        DataPointDailySummary.objects.record_points([instance])
+
+class DataServerMetadatumManager(models.Manager):
+    def fetch_values(self, keys):
+        values = {}
+
+        for datum in self.filter(key__in=list(keys)).order_by('pk'):
+            if (datum.key in values) is False:
+                values[datum.key] = datum.value
+
+        return values
+
+    def store_values(self, values):
+        if not values:
+            return
+
+        now = timezone.now()
+
+        to_update = []
+        updated_keys = set()
+
+        for datum in self.filter(key__in=list(values.keys())).order_by('pk'):
+            if (datum.key in updated_keys) is False:
+                datum.value = values[datum.key]
+                datum.last_updated = now
+
+                to_update.append(datum)
+                updated_keys.add(datum.key)
+
+        to_create = []
+
+        for key, value in values.items():
+            if (key in updated_keys) is False:
+                to_create.append(DataServerMetadatum(key=key, value=value, last_updated=now))
+
+        if to_create:
+            self.bulk_create(to_create)
+
+        if to_update:
+            if hasattr(self, 'bulk_update'):
+                self.bulk_update(to_update, ['value', 'last_updated'])
+            else:
+                for datum in to_update: # Django 1.11
+                    datum.save(update_fields=['value', 'last_updated'])
+
+
 class DataServerMetadatum(models.Model):
     class Meta(object): # pylint: disable=old-style-class, no-init, too-few-public-methods, bad-option-value
         verbose_name_plural = "data server metadata"
 
+    objects = DataServerMetadatumManager()
+
     key = models.CharField(max_length=1024, db_index=True)
     value = models.TextField(max_length=1048576)
     last_updated = models.DateTimeField(null=True, blank=True)
@@ -628,6 +1004,328 @@ def data_server_metadatum_pre_save(sender, instance, *args, **kwargs): # pylint:
     instance.last_updated = timezone.now()
 
 
+class LatestDataPointManager(models.Manager):
+    def latest_point(self, source, identifier):
+        latest = self.filter(source_reference__source=source, generator_definition__generator_identifier=identifier).select_related('data_point').first()
+
+        if latest is not None:
+            return latest.data_point
+
+        return None
+
+    def latest_points(self, identifier):
+        # Returns {source identifier: indexed latest point} for one generator.
+
+        latest_points = {}
+
+        for latest in self.filter(generator_definition__generator_identifier=identifier).select_related('source_reference', 'data_point'):
+            latest_points[latest.source_reference.source] = latest.data_point
+
+        return latest_points
+
+    def record_points(self, points):
+        # Indexes newly stored points under their own generator and the source-wide
+        # 'pdk-data-frequency' entry.
+
+        if ('pdk-data-frequency' in CACHED_GENERATOR_DEFINITIONS) is False:
+            CACHED_GENERATOR_DEFINITIONS['pdk-data-frequency'] = DataGeneratorDefinition.definition_for_identifier('pdk-data-frequency')
+
+        frequency_definition = CACHED_GENERATOR_DEFINITIONS['pdk-data-frequency']
+
+        entries = []
+
+        for point in points:
+            entries.append((point.source_reference_id, point.generator_definition_id, point,))
+            entries.append((point.source_reference_id, frequency_definition.pk, point,))
+
+        self.update_latest_points(entries)
+
+    def update_latest_points(self, entries):
+        # entries: iterable of (source_reference_id, generator_definition_id, point) tuples.
+        # Written with one INSERT ... ON CONFLICT that only replaces older entries, so a point
+        # saved on its own costs a single statement and concurrent writers cannot move an
+        # entry back to an older point. Rows are written in key order to keep lock acquisition
+        # consistent across workers.
+
+        candidates = {}
+
+        for source_reference_id, generator_definition_id, point in entries:
+            if source_reference_id is None or generator_definition_id is None or point.pk is None:
+                continue
+
+            key = (source_reference_id, generator_definition_id,)
+
+            if (key in candidates) is False or candidates[key].created < point.created:
+                candidates[key] = point
+
+        if not candidates:
+            return
+
+        now = timezone.now()
+
+        table = connection.ops.quote_name(self.model._meta.db_table) # pylint: disable=protected-access
+
+        rows = []
+        params = []
+
+        for key in sorted(candidates.keys()):
+            rows.append('(%s, %s, %s, %s, %s)')
+
+            params.extend(key)
+            params.extend([candidates[key].pk, candidates[key].created, now])
+
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO ' + table + ' (source_reference_id, generator_definition_id, data_point_id, created, updated) VALUES ' + ', '.join(rows) + \
+                           ' ON CONFLICT (source_reference_id, generator_definition_id) DO UPDATE SET' + \
+                           ' data_point_id = EXCLUDED.data_point_id, created = EXCLUDED.created, updated = EXCLUDED.updated' + \
+                           ' WHERE ' + table + '.created < EXCLUDED.created', params) # nosec
+
+
+class LatestDataPoint(models.Model):
+    class Meta(object): # pylint: disable=old-style-class, no-init, too-few-public-methods, bad-option-value
+        unique_together = [
+            ['source_reference', 'generator_definition'],
+        ]
+
+    objects = LatestDataPointManager()
+
+    source_reference = models.ForeignKey(DataSourceReference, related_name='latest_points', on_delete=models.CASCADE)
+    generator_definition = models.ForeignKey(DataGeneratorDefinition, related_name='latest_points', on_delete=models.CASCADE)
+
+    data_point = models.ForeignKey(DataPoint, related_name='+', on_delete=models.CASCADE)
+
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+
+
+def utc_day(when):
+    when_utc = when.utctimetuple()
+
+    return datetime.date(when_utc.tm_year, when_utc.tm_mon, when_utc.tm_mday)
+
+class DataPointDailySummaryManager(models.Manager):
+    def record_points(self, points):
+        # Folds newly stored points into their (source, generator, UTC day) summaries with one
+        # INSERT ... ON CONFLICT, so concurrent ingest workers add to the same rows safely. Rows
+        # are written in key order to keep lock acquisition consistent across workers.
+
+        deltas = {}
+
+        for point in points:
+            if point.pk is None or point.source_reference_id is None or point.generator_definition_id is None:
+                continue
+
+            key = (point.source_reference_id, point.generator_definition_id, utc_day(point.created),)
+
+            delta = deltas.get(key, None)
+
+            if delta is None:
+                deltas[key] = [1, point.created, point.created, point.recorded]
+            else:
+                delta[0] += 1
+                delta[1] = min(delta[1], point.created)
+                delta[2] = max(delta[2], point.created)
+                delta[3] = max(delta[3], point.recorded)
+
+        if not deltas:
+            return
+
+        table = connection.ops.quote_name(self.model._meta.db_table) # pylint: disable=protected-access
+
+        rows = []
+        params = []
+
+        for key in sorted(deltas.keys()):
+            rows.append('(%s, %s, %s, %s, %s, %s, %s)')
+
+            params.extend(key)
+            params.extend(deltas[key])
+
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO ' + table + ' (source_reference_id, generator_definition_id, day, point_count, first_created, last_created, last_recorded) VALUES ' + ', '.join(rows) + \
+                           ' ON CONFLICT (source_reference_id, generator_definition_id, day) DO UPDATE SET' + \
+                           ' point_count = ' + table + '.point_count + EXCLUDED.point_count,' + \
+                           ' first_created = LEAST(' + table + '.first_created, EXCLUDED.first_created),' + \
+                           ' last_created = GREATEST(' + table + '.last_created, EXCLUDED.last_created),' + \
+                           ' last_recorded = GREATEST(' + table + '.last_recorded, EXCLUDED.last_recorded)', params) # nosec
+
+    def rebuild_summaries(self, source_reference_ids, since=None):
+        # Recomputes the summaries of the given sources from their points with one grouped
+        # query. Used for sources that predate the summaries and after points are deleted.
+        # Only days inside the metadata window are rebuilt unless since is given.
+
+        source_reference_ids = list(source_reference_ids)
+
+        if not source_reference_ids:
+            return
+
+        if since is None:
+            since = timezone.now() - datetime.timedelta(days=METADATA_WINDOW_DAYS)
+
+        since_day = utc_day(since)
+        since_start = datetime.datetime(since_day.year, since_day.month, since_day.day, tzinfo=pytz.utc)
+
+        table = connection.ops.quote_name(self.model._meta.db_table) # pylint: disable=protected-access
+        point_table = connection.ops.quote_name(DataPoint._meta.db_table) # pylint: disable=protected-access
+
+        with transaction.atomic():
+            self.filter(source_reference_id__in=source_reference_ids, day__gte=since_day).delete()
+
+            with connection.cursor() as cursor:
+                cursor.execute('INSERT INTO ' + table + ' (source_reference_id, generator_definition_id, day, point_count, first_created, last_created, last_recorded)' + \
+                               ' SELECT source_reference_id, generator_definition_id, (created AT TIME ZONE \'UTC\')::date, COUNT(*), MIN(created), MAX(created), MAX(recorded)' + \
+                               ' FROM ' + point_table + ' WHERE source_reference_id = ANY(%s) AND generator_definition_id IS NOT NULL AND created >= %s GROUP BY 1, 2, 3' + \
+                               ' ON CONFLICT (source_reference_id, generator_definition_id, day) DO UPDATE SET' + \
+                               ' point_count = EXCLUDED.point_count, first_created = EXCLUDED.first_created,' + \
+                               ' last_created = EXCLUDED.last_created, last_recorded = EXCLUDED.last_recorded', (source_reference_ids, since_start,)) # nosec
+
+
+class DataPointDailySummary(models.Model):
+    class Meta(object): # pylint: disable=old-style-class, no-init, too-few-public-methods, bad-option-value
+        verbose_name_plural = 'data point daily summaries'
+
+        unique_together = [
+            ['source_reference', 'generator_definition', 'day'],
+        ]
+
+    objects = DataPointDailySummaryManager()
+
+    source_reference = models.ForeignKey(DataSourceReference, related_name='daily_summaries', on_delete=models.CASCADE)
+    generator_definition = models.ForeignKey(DataGeneratorDefinition, related_name='daily_summaries', on_delete=models.CASCADE)
+
+    day = models.DateField()
+
+    point_count = models.BigIntegerField(default=0)
+
+    first_created = models.DateTimeField()
+    last_created = models.DateTimeField()
+    last_recorded = models.DateTimeField()
+
+
+WINDOW_SUMMARY_ANNOTATIONS = {
+    'points_count': Sum('point_count'),
+    'first_created': Min('first_created'),
+    'last_created': Max('last_created'),
+    'last_recorded': Max('last_recorded'),
+}
+
+WINDOW_POINT_ANNOTATIONS = {
+    'points_count': Count('pk'),
+    'first_created': Min('created'),
+    'last_created': Max('created'),
+    'last_recorded': Max('recorded'),
+}
+
+def daily_summaries_stale(metadata, now):
+    # Summaries are maintained incrementally, but ORM, admin and cascading deletes bypass that
+    # bookkeeping. They are rebuilt from the points every PDK_DAILY_SUMMARY_RECONCILE_HOURS.
+
+    rebuilt = metadata.get('daily_summaries_rebuilt', None)
+
+    if rebuilt is None:
+        return True
+
+    return rebuilt < calendar.timegm(now.utctimetuple()) - (DAILY_SUMMARY_RECONCILE_HOURS * 60 * 60)
+
+def window_summaries(reference_ids, window_start):
+    # Returns {source reference pk: [per generator window totals]}. Whole days come from the daily
+    # summaries; the first, partial day of the window is counted from the points themselves so
+    # points created before window_start are not included.
+
+    next_day = utc_day(window_start) + datetime.timedelta(days=1)
+    next_day_start = datetime.datetime(next_day.year, next_day.month, next_day.day, tzinfo=pytz.utc)
+
+    totals = {}
+
+    days = DataPointDailySummary.objects.filter(source_reference_id__in=reference_ids, day__gte=next_day)\
+                                        .values('source_reference_id', 'generator_definition__generator_identifier')\
+                                        .annotate(**WINDOW_SUMMARY_ANNOTATIONS)\
+                                        .order_by()
+
+    first_day = DataPoint.objects.filter(source_reference_id__in=reference_ids, generator_definition__isnull=False, created__gte=window_start, created__lt=next_day_start)\
+                                 .values('source_reference_id', 'generator_definition__generator_identifier')\
+                                 .annotate(**WINDOW_POINT_ANNOTATIONS)\
+                                 .order_by()
+
+    for rows in (days, first_day):
+        for row in rows:
+            key = (row['source_reference_id'], row['generator_definition__generator_identifier'],)
+
+            total = totals.get(key, None)
+
+            if total is None:
+                totals[key] = dict(row)
+            else:
+                total['points_count'] += row['points_count']
+                total['first_created'] = min(total['first_created'], row['first_created'])
+                total['last_created'] = max(total['last_created'], row['last_created'])
+                total['last_recorded'] = max(total['last_recorded'], row['last_recorded'])
+
+    summaries = {}
+
+    for key in sorted(totals.keys()):
+        if (key[0] in summaries) is False:
+            summaries[key[0]] = []
+
+        summaries[key[0]].append(totals[key])
+
+    return summaries
+
+def window_statistics(source_identifier, summaries, latest_created, labels=None):
+    # Turns one source's window summaries (grouped by generator) into its point_count,
+    # point_frequency and generator_statistics metadata. labels caches generator labels
+    # across sources.
+
+    if labels is None:
+        labels = {}
+
+    point_count = 0
+    point_frequency = 0
+
+    earliest_created = None
+
+    generators = []
+
+    for summary in summaries:
+        identifier = summary['generator_definition__generator_identifier']
+
+        point_count += summary['points_count']
+
+        if earliest_created is None or summary['first_created'] < earliest_created:
+            earliest_created = summary['first_created']
+
+        if (identifier in labels) is False:
+            labels[identifier] = generator_label(identifier)
+
+        generator = {}
+
+        generator['identifier'] = identifier
+        generator['source'] = source_identifier
+        generator['label'] = labels[identifier]
+
+        generator['points_count'] = summary['points_count']
+        generator['last_recorded'] = calendar.timegm(summary['last_recorded'].timetuple())
+        generator['first_created'] = calendar.timegm(summary['first_created'].timetuple())
+        generator['last_created'] = calendar.timegm(summary['last_created'].timetuple())
+
+        duration = (summary['last_created'] - summary['first_created']).total_seconds()
+
+        if generator['points_count'] > 1 and duration > 0:
+            generator['frequency'] = float(generator['points_count']) / duration
+        else:
+            generator['frequency'] = 0
+
+        generators.append(generator)
+
+    if point_count > 1 and latest_created is not None:
+        seconds = (latest_created - earliest_created).total_seconds()
+
+        if seconds > 0:
+            point_frequency = old_div(point_count, seconds)
+
+    return point_count, point_frequency, generators
+
+
 class DataBundle(models.Model):
     recorded = models.DateTimeField()
 
@@ -642,6 +1340,8 @@ class DataBundle(models.Model):
     encrypted = models.BooleanField(default=False)
     compression = models.CharField(max_length=128, choices=COMPRESSION_CHOICES, default='none')
 
+    claimed = models.DateTimeField(null=True, blank=True)
+
 
 class DataFile(models.Model):
     data_point = models.ForeignKey(DataPoint, related_name='data_files', null=True, blank=True, on_delete=models.CASCADE)
@@ -686,6 +1386,128 @@ class DataSourceManager(models.Manager): # pylint: disable=too-few-public-method
 
         return source_list
 
+    def ingest_source(self, metadata, server_urls): # pylint: disable=no-self-use
+        # Applies ingest's source rules to a point's passive-data-metadata: blank sources, the
+        # optional PDK_RENAME_SOURCE hook and creating (and grouping) unseen sources. Returns the
+        # upload URL of the server that owns the source, or '' for local sources. server_urls
+        # caches the result by source across calls.
+
+        source = metadata['source']
+
+        if source == '':
+            source = 'missing-source'
+
+        try:
+            source = settings.PDK_RENAME_SOURCE(source)
+
+            metadata['source'] = source
+        except AttributeError:
+            pass # Optional method not defined
+
+        if source in server_urls:
+            return server_urls[source]
+
+        server_url = None
+
+        source_obj = DataSource.objects.filter(identifier=source).first()
+
+        if source_obj is not None:
+            if source_obj.server is not None:
+                server_url = source_obj.server.upload_url
+        else:
+            if source is not None:
+                source_obj = DataSource(name=source, identifier=source)
+                source_obj.save()
+
+                source_obj.join_default_group()
+
+        if server_url is None:
+            server_url = ''
+
+        server_urls[source] = server_url
+
+        return server_url
+
+    def update_performance_metadata(self, sources): # pylint: disable=too-many-locals, too-many-branches
+        # Refreshes the latest point and window metadata of many local sources at once: one
+        # grouped query over the daily summaries and a bulk update. Latest points follow the
+        # single-source rules. Returns the number of sources updated.
+
+        sources = [source for source in sources if source.server is None]
+
+        if not sources:
+            return 0
+
+        now = timezone.now()
+
+        window_start = now - datetime.timedelta(days=METADATA_WINDOW_DAYS)
+        window_day = utc_day(window_start)
+
+        references = {}
+
+        for reference in DataSourceReference.objects.filter(source__in=[source.identifier for source in sources]).order_by('pk'):
+            if (reference.source in references) is False:
+                references[reference.source] = reference
+
+        metadata = {}
+        stale = []
+
+        for source in sources:
+            if (source.identifier in references) is False:
+                references[source.identifier] = source.fetch_source_reference()
+
+            metadata[source.pk] = source.fetch_performance_metadata()
+
+            metadata[source.pk].pop('daily_summaries', None)
+
+            if daily_summaries_stale(metadata[source.pk], now):
+                stale.append(references[source.identifier].pk)
+
+                metadata[source.pk]['daily_summaries_rebuilt'] = calendar.timegm(now.utctimetuple())
+
+        reference_ids = [reference.pk for reference in references.values()]
+
+        DataPointDailySummary.objects.rebuild_summaries(stale, since=window_start)
+
+        DataPointDailySummary.objects.filter(source_reference_id__in=reference_ids, day__lt=window_day).delete()
+
+        summaries = window_summaries(reference_ids, window_start)
+
+        labels = {}
+
+        for source in sources:
+            reference = references[source.identifier]
+            source_metadata = metadata[source.pk]
+
+            # Same latest point rules as the single-source refresh (server-generated points are
+            # skipped), resuming from the point found by the previous refresh.
+
+            latest_point = source.refresh_latest_point_metadata(reference, source_metadata)
+
+            latest_created = None
+
+            if latest_point is not None:
+                latest_created = latest_point.created
+
+            source_metadata['point_count'], source_metadata['point_frequency'], source_metadata['generator_statistics'] = window_statistics(source.identifier, summaries.get(reference.pk, []), latest_created, labels)
+
+            if install_supports_jsonfield():
+                source.performance_metadata = source_metadata
+            else:
+                source.performance_metadata = json.dumps(source_metadata, indent=2)
+
+            source.performance_metadata_updated = now
+
+        if hasattr(self, 'bulk_update'):
+            self.bulk_update(sources, ['performance_metadata', 'performance_metadata_updated'])
+        else:
+            for source in sources: # Django 1.11
+                source.save(update_fields=['performance_metadata', 'performance_metadata_updated'])
+
+        DataSourceSummary.objects.store_summaries(sources)
+
+        return len(sources)
+
 
 @python_2_unicode_compatible
 class DataSource(models.Model):
@@ -780,167 +1602,126 @@ class DataSource(models.Model):
 
         return source_reference
 
-    def update_performance_metadata(self): # pylint: disable=too-many-branches, too-many-statements, too-many-locals
-        if self.server is None:
-            source_reference = self.fetch_source_reference()
-
-            metadata = self.fetch_performance_metadata()
+    def refresh_latest_point_metadata(self, source_reference, metadata): # pylint: disable=too-many-branches
+        # Moves the latest_point and latest_point_recorded entries of a local source's metadata
+        # forward to its newest points that were not generated by the server, and returns the
+        # latest point.
 
-            now = timezone.now()
+        day_ago = timezone.now() - datetime.timedelta(days=1)
 
-            window_start = now - datetime.timedelta(days=METADATA_WINDOW_DAYS)
+        DataPoint.objects.filter(source_reference=source_reference, server_generated=False, user_agent__icontains='Passive Data Kit Server', created__gte=day_ago).update(server_generated=True)
 
-            day_ago = timezone.now() - datetime.timedelta(days=1)
+        # Update latest_point
 
-            DataPoint.objects.filter(source_reference=source_reference, server_generated=False, user_agent__icontains='Passive Data Kit Server', created__gte=day_ago).update(server_generated=True)
+        latest_point = self.latest_point()
 
-            # Update latest_point
+        query = Q(source_reference=source_reference)
 
-            latest_point = self.latest_point()
+        if latest_point is not None:
+            query = query & Q(created__gt=latest_point.created)
+        else:
+            latest_point = DataPoint.objects.filter(source_reference=source_reference).order_by('-created').first()
 
-            query = Q(source_reference=source_reference)
+        point = None
 
-            if latest_point is not None:
-                query = query & Q(created__gt=latest_point.created)
-            else:
-                latest_point = DataPoint.objects.filter(source_reference=source_reference).order_by('-created').first()
+        for late_point in DataPoint.objects.filter(query).keyset_iterator(batch_size=500, descending=True):
+            if late_point.server_generated is False:
+                user_agent = late_point.fetch_user_agent()
 
-            latest_count = DataPoint.objects.filter(query).count()
+                if ('Passive Data Kit Server' in user_agent) is False:
+                    point = late_point
 
-            latest_index = 0
+                    break
 
-            point = None
+        while point is not None:
+            user_agent = point.fetch_user_agent()
 
-            while latest_index < latest_count:
-                for late_point in DataPoint.objects.filter(query).order_by('-created')[latest_index:(latest_index + 500)]:
-                    if late_point.server_generated is False:
-                        user_agent = late_point.fetch_user_agent()
+            if ('Passive Data Kit Server' in user_agent) is False:
+                metadata['latest_point'] = point.pk
 
-                        if ('Passive Data Kit Server' in user_agent) is False:
-                            point = late_point
+                latest_point = point
 
-                            break
+                point = None
+            else:
+                point = DataPoint.objects.filter(source_reference=source_reference, server_generated=False, created__lt=point.created).order_by('-created').first()
 
                 if point is not None:
-                    break
-
-                latest_index += 500
-
-            while point is not None:
-                user_agent = point.fetch_user_agent()
-
-                if ('Passive Data Kit Server' in user_agent) is False:
                     metadata['latest_point'] = point.pk
 
-                    latest_point = point
-
-                    point = None
-                else:
-                    point = DataPoint.objects.filter(source_reference=source_reference, server_generated=False, created__lt=point.created).order_by('-created').first()
+        if latest_point is not None:
+            metadata['user_agent'] = latest_point.fetch_user_agent()
+            metadata['latest_point_created'] = calendar.timegm(latest_point.created.timetuple())
 
-                    if point is not None:
-                        metadata['latest_point'] = point.pk
+        latest_point_recorded = self.latest_point_recorded()
 
-            if latest_point is not None:
-                metadata['user_agent'] = latest_point.fetch_user_agent()
-                metadata['latest_point_created'] = calendar.timegm(latest_point.created.timetuple())
+        query = Q(source_reference=source_reference)
 
-            latest_point_recorded = self.latest_point_recorded()
+        if latest_point_recorded is not None:
+            query = query & Q(recorded__gt=latest_point_recorded.recorded)
 
-            query = Q(source_reference=source_reference)
+        point = None
 
-            if latest_point_recorded is not None:
-                query = query & Q(recorded__gt=latest_point_recorded.recorded)
+        for user_point in DataPoint.objects.filter(query).keyset_iterator(batch_size=500, field='recorded', descending=True):
+            if user_point.server_generated is False:
+                user_agent = user_point.fetch_user_agent()
 
-            point = None
+                if ('Passive Data Kit Server' in user_agent) is False:
+                    point = user_point
 
-            user_count = DataPoint.objects.filter(query).count()
+                    break
 
-            user_index = 0
+        while point is not None:
+            user_agent = point.fetch_user_agent()
 
-            while user_index < user_count:
-                for user_point in DataPoint.objects.filter(query).order_by('-recorded')[user_index:(user_index + 500)]:
-                    if user_point.server_generated is False:
-                        user_agent = user_point.fetch_user_agent()
+            if ('Passive Data Kit Server' in user_agent) is False:
+                metadata['latest_point_recorded'] = point.pk
 
-                        if ('Passive Data Kit Server' in user_agent) is False:
-                            point = user_point
+                latest_point_recorded = point
 
-                            break
+                point = None
+            else:
+                point = DataPoint.objects.filter(source_reference=source_reference, server_generated=False, recorded__lt=point.recorded).order_by('-recorded').first()
 
                 if point is not None:
-                    break
-
-                user_index += 500
-
-            while point is not None:
-                user_agent = point.fetch_user_agent()
-
-                if ('Passive Data Kit Server' in user_agent) is False:
                     metadata['latest_point_recorded'] = point.pk
 
-                    latest_point_recorded = point
-
-                    point = None
-                else:
-                    point = DataPoint.objects.filter(source_reference=source_reference, server_generated=False, recorded__lt=point.recorded).order_by('-recorded').first()
-
-                    if point is not None:
-                        metadata['latest_point_recorded'] = point.pk
-
-            if latest_point_recorded is not None:
-                metadata['latest_point_recorded_time'] = calendar.timegm(latest_point_recorded.recorded.timetuple())
+        if latest_point_recorded is not None:
+            metadata['latest_point_recorded_time'] = calendar.timegm(latest_point_recorded.recorded.timetuple())
 
-            # Update point_count
+        return latest_point
 
-            metadata['point_count'] = DataPoint.objects.filter(source_reference=source_reference, created__gte=window_start).count()
-
-            # Update point_frequency
-
-            metadata['point_frequency'] = 0
-
-            if metadata['point_count'] > 1:
-                earliest_point = DataPoint.objects.filter(source_reference=source_reference, created__gte=window_start).order_by('created').first()
-
-                seconds = (latest_point.created - earliest_point.created).total_seconds()
-
-                if seconds > 0:
-                    metadata['point_frequency'] = old_div(metadata['point_count'], seconds)
+    def update_performance_metadata(self): # pylint: disable=too-many-branches, too-many-statements, too-many-locals
+        if self.server is None:
+            source_reference = self.fetch_source_reference()
 
-            generators = []
+            metadata = self.fetch_performance_metadata()
 
-            identifiers = DataPoint.objects.generator_identifiers_for_source(self.identifier, since=window_start)
+            now = timezone.now()
 
-            for identifier in identifiers:
-                definition = DataGeneratorDefinition.definition_for_identifier(identifier)
+            window_start = now - datetime.timedelta(days=METADATA_WINDOW_DAYS)
 
-                generator = {}
+            latest_point = self.refresh_latest_point_metadata(source_reference, metadata)
 
-                generator['identifier'] = identifier
-                generator['source'] = self.identifier
-                generator['label'] = generator_label(identifier)
+            # Update point_count, point_frequency and generator_statistics from the daily summaries
+            # maintained at ingest, rather than counting and scanning the points themselves.
 
-                generator['points_count'] = DataPoint.objects.filter(source_reference=source_reference, created__gte=window_start, generator_definition=definition).count()
+            metadata.pop('daily_summaries', None)
 
-                last_recorded = DataPoint.objects.filter(source_reference=source_reference, generator_definition=definition, created__gte=window_start).order_by('-recorded').first()
+            if daily_summaries_stale(metadata, now):
+                DataPointDailySummary.objects.rebuild_summaries([source_reference.pk], since=window_start)
 
-                if last_recorded is not None:
-                    first_point = DataPoint.objects.filter(source_reference=source_reference, generator_definition=definition, created__gte=window_start).order_by('created').first()
+                metadata['daily_summaries_rebuilt'] = calendar.timegm(now.utctimetuple())
 
-                    last_point = DataPoint.objects.filter(source_reference=source_reference, generator_definition=definition, created__gte=window_start).order_by('-created').first()
+            DataPointDailySummary.objects.filter(source_reference=source_reference, day__lt=utc_day(window_start)).delete()
 
-                    generator['last_recorded'] = calendar.timegm(last_recorded.recorded.timetuple())
-                    generator['first_created'] = calendar.timegm(first_point.created.timetuple())
-                    generator['last_created'] = calendar.timegm(last_point.created.timetuple())
+            summaries = window_summaries([source_reference.pk], window_start).get(source_reference.pk, [])
 
-                    duration = (last_point.created - first_point.created).total_seconds()
+            latest_created = None
 
-                    if generator['points_count'] > 1 and duration > 0:
-                        generator['frequency'] = float(generator['points_count']) / duration
-                    else:
-                        generator['frequency'] = 0
+            if latest_point is not None:
+                latest_created = latest_point.created
 
-                    generators.append(generator)
+            metadata['point_count'], metadata['point_frequency'], generators = window_statistics(self.identifier, summaries, latest_created)
 
             metadata['generator_statistics'] = generators
 
@@ -953,6 +1734,8 @@ class DataSource(models.Model):
 
             self.save()
 
+            DataSourceSummary.objects.store_summaries([self])
+
         elif self.server.source_metadata_url is not None:
             payload = {
                 'identifier': self.identifier,
@@ -985,6 +1768,8 @@ class DataSource(models.Model):
 
             self.save()
 
+            DataSourceSummary.objects.store_summaries([self])
+
     def refresh_performance_metadata(self):
         self.performance_metadata_updated = None
 
@@ -997,22 +1782,25 @@ class DataSource(models.Model):
             if 'latest_point' in metadata:
                 return DataPoint.objects.filter(pk=metadata['latest_point']).first()
 
-            source_reference = DataSourceReference.reference_for_source(self.identifier)
+            point = LatestDataPoint.objects.latest_point(self.identifier, 'pdk-data-frequency')
 
-            if DataPoint.objects.filter(source_reference=source_reference).count() > 0: # Added for no-data condition scans of whole table for non-existent data...
-                point = DataPoint.objects.filter(source_reference=source_reference).order_by('-created').first()
+            if point is None:
+                source_reference = DataSourceReference.reference_for_source(self.identifier)
 
-                if point is not None:
-                    metadata['latest_point'] = point.pk
+                if DataPoint.objects.filter(source_reference=source_reference).count() > 0: # Added for no-data condition scans of whole table for non-existent data...
+                    point = DataPoint.objects.filter(source_reference=source_reference).order_by('-created').first()
 
-                    if install_supports_jsonfield():
-                        self.performance_metadata = metadata
-                    else:
-                        self.performance_metadata = json.dumps(metadata, indent=2)
+            if point is not None:
+                metadata['latest_point'] = point.pk
 
-                    self.save()
+                if install_supports_jsonfield():
+                    self.performance_metadata = metadata
+                else:
+                    self.performance_metadata = json.dumps(metadata, indent=2)
 
-                    return point
+                self.save()
+
+                return point
         elif 'latest_point' in metadata and 'latest_point_created' in metadata:
             virtual_point = DataPoint(generator_identifier='pdk-virtual-point')
             virtual_point.pk = metadata['latest_point'] # pylint: disable=invalid-name
@@ -1164,7 +1952,177 @@ class DataSource(models.Model):
             pass
 
 
+@receiver(post_save, sender=DataSource)
+@receiver(post_delete, sender=DataSource)
+def data_source_changed(sender, instance, *args, **kwargs): # pylint: disable=unused-argument
+    AppConfiguration.objects.clear_cache(identifier=instance.identifier)
+
+
+class DataSourceSummaryManager(models.Manager):
+    def store_summaries(self, sources):
+        # Copies the dashboard fields of each source's performance metadata into its summary row,
+        # so source listings can show every source without parsing (or loading) the metadata.
+
+        sources = list(sources)
+
+        if not sources:
+            return []
+
+        now = timezone.now()
+
+        summaries = {}
+
+        for summary in self.filter(source__in=sources):
+            summaries[summary.source_id] = summary
+
+        to_create = []
+        to_update = []
+
+        for source in sources:
+            metadata = source.fetch_performance_metadata()
+
+            summary = summaries.get(source.pk, None)
+
+            if summary is None:
+                summary = DataSourceSummary(source=source)
+
+                to_create.append(summary)
+            else:
+                to_update.append(summary)
+
+            summary.copy_metadata(metadata, now)
+
+        self.write_summaries(to_create, to_update)
+
+        return to_create + to_update
+
+    def write_summaries(self, to_create, to_update):
+        if to_create:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(to_create)
+            except IntegrityError: # Another process created some of these rows concurrently.
+                for summary in to_create:
+                    existing = self.filter(source_id=summary.source_id).first()
+
+                    if existing is not None:
+                        summary.pk = existing.pk
+
+                    summary.save()
+
+        if to_update:
+            if hasattr(self, 'bulk_update'):
+                self.bulk_update(to_update, SUMMARY_FIELDS)
+            else:
+                for summary in to_update: # Django 1.11
+                    summary.save(update_fields=SUMMARY_FIELDS)
+
+
+SUMMARY_FIELDS = ['user_agent', 'latest_point_created', 'point_count', 'point_frequency', 'updated']
+
+class DataSourceSummary(models.Model):
+    class Meta(object): # pylint: disable=old-style-class, no-init, too-few-public-methods, bad-option-value
+        verbose_name_plural = 'data source summaries'
+
+    objects = DataSourceSummaryManager()
+
+    source = models.OneToOneField(DataSource, related_name='summary', on_delete=models.CASCADE)
+
+    user_agent = models.CharField(max_length=1024, null=True, blank=True)
+    latest_point_created = models.DateTimeField(null=True, blank=True, db_index=True)
+    point_count = models.BigIntegerField(null=True, blank=True, db_index=True)
+    point_frequency = models.FloatField(null=True, blank=True)
+
+    updated = models.DateTimeField()
+
+    def copy_metadata(self, metadata, now):
+        self.user_agent = metadata.get('user_agent', None)
+
+        if self.user_agent is not None:
+            self.user_agent = self.user_agent[:1024]
+
+        self.latest_point_created = None
+
+        if metadata.get('latest_point_created', None) is not None:
+            self.latest_point_created = arrow.get(metadata['latest_point_created']).datetime
+
+        self.point_count = metadata.get('point_count', None)
+        self.point_frequency = metadata.get('point_frequency', None)
+        self.updated = now
+
+
+class DataSourceAlertManager(models.Manager):
+    def active_alerts(self, generator_identifier):
+        # Returns {data source pk: newest active alert} for one generator.
+
+        last_alerts = {}
+
+        for alert in self.filter(generator_identifier=generator_identifier, active=True).order_by('data_source', '-created'):
+            if (alert.data_source_id in last_alerts) is False:
+                last_alerts[alert.data_source_id] = alert
+
+        return last_alerts
+
+    def store_alerts(self, to_create, to_update):
+        with transaction.atomic():
+            if to_create:
+                self.bulk_create(to_create)
+
+            if to_update:
+                if hasattr(self, 'bulk_update'):
+                    self.bulk_update(to_update, ['active', 'updated', 'alert_details'])
+                else:
+                    for alert in to_update: # Django 1.11
+                        alert.save(update_fields=['active', 'updated', 'alert_details'])
+
+    def update_alerts(self, generator_identifier, alerts, suppressed=None):
+        # Applies one status check run across many sources with bulk writes. alerts maps each
+        # DataSource to an (alert_name, alert_level, alert_details) tuple, or None when the
+        # source is healthy. Alerts for suppressed sources are closed.
+
+        now = timezone.now()
+
+        if suppressed:
+            self.filter(data_source__in=list(suppressed), generator_identifier=generator_identifier, active=True).update(active=False, updated=now)
+
+        last_alerts = self.active_alerts(generator_identifier)
+
+        to_create = []
+        to_update = []
+
+        for source, outcome in alerts.items():
+            last_alert = last_alerts.get(source.pk, None)
+
+            if last_alert is not None and outcome is not None and last_alert.alert_name == outcome[0] and last_alert.alert_level == outcome[1]:
+                last_alert.updated = now
+                last_alert.update_alert_details(outcome[2])
+
+                to_update.append(last_alert)
+
+                continue
+
+            if last_alert is not None:
+                last_alert.active = False
+                last_alert.updated = now
+
+                to_update.append(last_alert)
+
+            if outcome is not None:
+                new_alert = DataSourceAlert(alert_name=outcome[0], data_source=source, generator_identifier=generator_identifier)
+                new_alert.alert_level = outcome[1]
+                new_alert.update_alert_details(outcome[2])
+                new_alert.created = now
+                new_alert.updated = now
+                new_alert.active = True
+
+                to_create.append(new_alert)
+
+        self.store_alerts(to_create, to_update)
+
+
 class DataSourceAlert(models.Model):
+    objects = DataSourceAlertManager()
+
     alert_name = models.CharField(max_length=1024)
     alert_level = models.CharField(max_length=64, choices=ALERT_LEVEL_CHOICES, default='info', db_index=True)
 
@@ -1229,7 +2187,7 @@ class DataPointVisualization(models.Model):
 
 
 class ReportJobManager(models.Manager): # pylint: disable=too-few-public-methods
-    def create_jobs(self, user, sources, generators, export_raw=False, data_start=None, data_end=None, date_type='created'): # pylint: disable=too-many-locals, too-many-branches, too-many-statements, no-self-use, too-many-arguments, too-many-positional-arguments
+    def create_jobs(self, user, sources, generators, export_raw=False, data_start=None, data_end=None, date_type='created', export_format='tsv'): # pylint: disable=too-many-locals, too-many-branches, too-many-statements, no-self-use, too-many-arguments, too-many-positional-arguments
         batch_request = ReportJobBatchRequest(requester=user, requested=timezone.now())
 
         params = {}
@@ -1240,6 +2198,7 @@ class ReportJobManager(models.Manager): # pylint: disable=too-few-public-methods
         params['data_start'] = data_start
         params['data_end'] = data_end
         params['date_type'] = date_type
+        params['export_format'] = export_format
 
         if install_supports_jsonfield():
             batch_request.parameters = params
@@ -1401,6 +2360,9 @@ class ReportJobBatchRequest(models.Model):
                 job_params['data_end'] = params['data_end']
                 job_params['date_type'] = params['date_type']
 
+                if 'export_format' in params:
+                    job_params['export_format'] = params['export_format']
+
                 if 'prefix' in params:
                     job_params['prefix'] = params['prefix']
 
@@ -1490,6 +2452,9 @@ class ReportJobBatchRequest(models.Model):
                     job_params['data_start'] = params['data_start']
                     job_params['data_end'] = params['data_end']
 
+                    if 'export_format' in params:
+                        job_params['export_format'] = params['export_format']
+
                     if 'prefix' in params:
                         job_params['prefix'] = params['prefix']
 
@@ -1520,6 +2485,9 @@ class ReportJobBatchRequest(models.Model):
                 job_params['data_start'] = params['data_start']
                 job_params['data_end'] = params['data_end']
 
+                if 'export_format' in params:
+                    job_params['export_format'] = params['export_format']
+
                 if 'prefix' in params:
                     job_params['prefix'] = params['prefix']
 
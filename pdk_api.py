@@ -12,6 +12,7 @@ import datetime
 import gc
 import importlib
 import io
+import itertools
 import json
 import os
 import re
@@ -36,10 +37,10 @@ from django.conf import settings
 from django.core import management
 from django.db.models import Q
 from django.template.loader import render_to_string
-from django.utils import timezone
 from django.utils.text import slugify
 
-from .models import DataPoint, DataBundle, DataGeneratorDefinition, DataSourceReference, install_supports_jsonfield
+from .backup_restore import load_backup_content
+from .models import DataPoint, DataGeneratorDefinition, DataSourceReference
 
 def filter_structure(pattern, structure, prefix=''):
     if isinstance(structure, dict):
@@ -210,35 +211,27 @@ def compile_report(generator, sources, data_start=None, data_end=None, date_type
                 else:
                     points = points.filter(created__lte=data_end)
 
-            points = points.order_by('source', 'created')
+            for point in points.keyset_iterator():
+                row = []
 
-            index = 0
-            count = points.count()
+                row.append(point.source)
+                row.append(point.generator)
+                row.append(point.generator_identifier)
+                row.append(calendar.timegm(point.created.utctimetuple()))
+                row.append(point.created.isoformat())
 
-            while index < count:
-                for point in points[index:(index + 5000)]:
-                    row = []
-
-                    row.append(point.source)
-                    row.append(point.generator)
-                    row.append(point.generator_identifier)
-                    row.append(calendar.timegm(point.created.utctimetuple()))
-                    row.append(point.created.isoformat())
-
-                    if point.generated_at is not None:
-                        row.append(point.generated_at.y)
-                        row.append(point.generated_at.x)
-                    else:
-                        row.append('')
-                        row.append('')
-
-                    row.append(calendar.timegm(point.recorded.utctimetuple()))
-                    row.append(point.recorded.isoformat())
-                    row.append(json.dumps(point.fetch_properties()))
+                if point.generated_at is not None:
+                    row.append(point.generated_at.y)
+                    row.append(point.generated_at.x)
+                else:
+                    row.append('')
+                    row.append('')
 
-                    writer.writerow([s.encode('utf-8') for s in row])
+                row.append(calendar.timegm(point.recorded.utctimetuple()))
+                row.append(point.recorded.isoformat())
+                row.append(json.dumps(point.fetch_properties()))
 
-                index += 5000
+                writer.writerow([s.encode('utf-8') for s in row])
 
     return filename
 
@@ -716,50 +709,18 @@ def annotate_source_definition(source, definition):
 
     return definition
 
-def load_backup(filename, content):
+def load_backup(filename, content, direct=False):
+    # content is either the decompressed file contents or an iterable of decompressed byte
+    # chunks. With direct=True, data points are written to DataPoint instead of being
+    # re-queued as DataBundle objects, and the restore statistics are returned for the caller
+    # to apply with update_bundle_statistics.
+
     prefix = 'pdk_backup_' + settings.ALLOWED_HOSTS[0]
 
     if filename.startswith(prefix) is False:
-        return
-
-    if 'json-dumpdata' in filename:
-        filename = filename.replace('.json-dumpdata.bz2.encrypted', '.json')
-
-        path = os.path.join(tempfile.gettempdir(), filename)
-
-        with io.open(path, 'wb') as fixture_file:
-            fixture_file.write(content)
-
-        management.call_command('loaddata', path)
-
-        os.remove(path)
-    elif 'pdk-bundle' in filename:
-        backup_content = json.loads(content)
-
-        bundle_index = 0
-
-        while backup_content:
-            bundle_content = []
-
-            if (bundle_index % 50) == 0:
-                print('[passive_data_kit.pdk_api.load_backup] ' + str(len(backup_content)) + ' items remaining to write...')
-
-            while backup_content and len(bundle_content) < 100:
-                bundle_content.append(backup_content.pop(0))
-
-            if bundle_content:
-                bundle = DataBundle(recorded=timezone.now())
-
-                if install_supports_jsonfield():
-                    bundle.properties = bundle_content
-                else:
-                    bundle.properties = json.dumps(bundle_content, indent=2)
-
-                bundle.save()
+        return None
 
-                bundle_index += 1
-    else:
-        print('[passive_data_kit.pdk_api.load_backup] Unknown file type: ' + filename)
+    return load_backup_content(filename, content, direct=direct)
 
 def incremental_backup(parameters): # pylint: disable=too-many-locals, too-many-statements, too-many-branches
     to_transmit = []
@@ -867,53 +828,78 @@ def incremental_backup(parameters): # pylint: disable=too-many-locals, too-many-
     print('[passive_data_kit] Fetching count of data points...')
     sys.stdout.flush()
 
-    point_pks = DataPoint.objects.filter(query).values_list('pk', flat=True)
+    points = DataPoint.objects.filter(query).only('pk', 'generator_identifier', 'recorded', 'properties')
 
-    points_count = len(point_pks)
+    points_count = points.count()
     points_index = 0
 
+    backup_start = time.time()
+
+    # Points are read in large keyset-ordered batches and each bundle is compressed as it is
+    # written, so neither the full point list nor a whole uncompressed bundle is held in memory.
+
+    point_iterator = points.keyset_iterator(batch_size=max(bundle_size, 5000), field='recorded')
+
     while points_index < points_count:
         filename = prefix + '_data_points_' + str(points_index) + '_' + str(points_count) + '.pdk-bundle.bz2'
 
         print('[passive_data_kit] Backing up data points ' + str(points_index) + ' of ' + str(points_count) + '...')
         sys.stdout.flush()
 
-        bundle = []
+        path = os.path.join(backup_staging, filename)
+
+        compressor = bz2.BZ2Compressor()
 
-        for point_pk in point_pks[points_index:(points_index + bundle_size)]:
-            point = DataPoint.objects.get(pk=point_pk)
+        bundle_count = 0
 
-            bundle.append(filter_sensitive_fields(point, point.fetch_properties(), parameters))
+        with io.open(path, 'wb') as compressed_file:
+            compressed_file.write(compressor.compress(b'['))
 
-            if clear_archived:
-                to_clear.append('pdk:' + str(point.pk))
+            for point in itertools.islice(point_iterator, bundle_size):
+                point_json = json.dumps(filter_sensitive_fields(point, point.fetch_properties(), parameters))
 
-        points_index += bundle_size
+                if bundle_count > 0:
+                    point_json = ', ' + point_json
 
-        compressed_str = bz2.compress(json.dumps(bundle).encode('utf-8'))
+                compressed_file.write(compressor.compress(point_json.encode('utf-8')))
 
-        path = os.path.join(backup_staging, filename)
+                bundle_count += 1
 
-        with io.open(path, 'wb') as compressed_file:
-            compressed_file.write(compressed_str)
+                if clear_archived:
+                    to_clear.append('pdk:' + str(point.pk))
+
+            compressed_file.write(compressor.compress(b']'))
+            compressed_file.write(compressor.flush())
+
+        if bundle_count == 0:
+            os.remove(path)
+
+            break
 
         to_transmit.append(path)
 
+        points_index += bundle_count
+
+        elapsed = time.time() - backup_start
+
+        if elapsed > 0:
+            print('[passive_data_kit] Backed up ' + str(points_index) + ' data points (' + str(int(points_index / elapsed)) + ' points/sec)...')
+            sys.stdout.flush()
+
     return to_transmit, to_clear
 
 def clear_points(to_clear):
-    point_count = len(to_clear)
+    point_pks = [int(point_id.replace('pdk:', '')) for point_id in to_clear]
 
-    for i in range(0, point_count):
-        if (i % 1000) == 0:
-            print('[passive_data_kit] Clearing points ' + str(i) + ' of ' + str(point_count) + '...')
-            sys.stdout.flush()
+    print('[passive_data_kit] Clearing ' + str(len(point_pks)) + ' points...')
+    sys.stdout.flush()
 
-        point_id = to_clear[i]
+    # purge_points deletes in batches itself and rebuilds the affected daily summaries once.
 
-        point_pk = int(point_id.replace('pdk:', ''))
+    deleted = DataPoint.objects.purge_points(point_pks, batch_size=10000)
 
-        DataPoint.objects.filter(pk=point_pk).delete()
+    print('[passive_data_kit] Cleared ' + str(deleted) + ' points.')
+    sys.stdout.flush()
 
 def update_data_type_definition(definition, data_type=None, override_existing=False): # pylint: disable=unused-argument, too-many-branches, too-many-statements
     if 'passive-data-metadata' in definition:
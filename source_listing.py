@@ -0,0 +1,159 @@
+# pylint: disable=no-member, line-too-long
+
+from builtins import str # pylint: disable=redefined-builtin
+
+import base64
+import datetime
+import json
+
+import arrow
+
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+
+from .models import DataSource, DataSourceAlert, DataSourceSummary
+from .templatetags.passive_data_kit import ago_string, frequency_labels, home_actions
+
+SOURCE_LISTING_SORT_FIELDS = {
+    'name': 'name',
+    'identifier': 'identifier',
+    'latest_point_created': 'summary__latest_point_created',
+    'performance_metadata_updated': 'performance_metadata_updated',
+    'point_count': 'summary__point_count',
+    'point_frequency': 'summary__point_frequency',
+    'alert_level': 'alert_rank',
+}
+
+SOURCE_LISTING_DATE_FIELDS = ('latest_point_created', 'performance_metadata_updated',)
+
+SOURCE_LISTING_PAGE_SIZE = 100
+SOURCE_LISTING_MAX_PAGE_SIZE = 1000
+
+ALERT_LEVEL_RANKS = ('none', 'info', 'warning', 'critical',)
+
+def encode_listing_cursor(value, last_pk):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+
+    return base64.urlsafe_b64encode(json.dumps([value, last_pk]).encode('utf-8')).decode('utf-8')
+
+def decode_listing_cursor(cursor, sort):
+    value, last_pk = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+
+    if value is not None and sort in SOURCE_LISTING_DATE_FIELDS:
+        value = arrow.get(value).datetime
+
+    return value, int(last_pk)
+
+def source_listing_query(excluded_sources, search=None, group=None, sort='name', descending=False):
+    # Sources are ordered by the sort value (sources without one last), then by primary key, so
+    # each page can start right after the (value, pk) of the previous page's last row.
+
+    active_alerts = DataSourceAlert.objects.filter(data_source=OuterRef('pk'), active=True)\
+                                           .annotate(rank=Case(When(alert_level='critical', then=Value(3)), \
+                                                               When(alert_level='warning', then=Value(2)), \
+                                                               default=Value(1), output_field=IntegerField()))\
+                                           .order_by('-rank')
+
+    query = DataSource.objects.exclude(identifier__in=excluded_sources)\
+                              .annotate(alert_rank=Coalesce(Subquery(active_alerts.values('rank')[:1], output_field=IntegerField()), Value(0)))\
+                              .annotate(sort_value=F(SOURCE_LISTING_SORT_FIELDS[sort]))\
+                              .select_related('server', 'summary')\
+                              .defer('performance_metadata')
+
+    if search:
+        query = query.filter(Q(identifier__icontains=search) | Q(name__icontains=search))
+
+    if group == '0':
+        query = query.filter(group=None)
+    elif group:
+        query = query.filter(group_id=int(group))
+
+    if descending:
+        return query.order_by(F('sort_value').desc(nulls_last=True), '-pk')
+
+    return query.order_by(F('sort_value').asc(nulls_last=True), 'pk')
+
+def source_listing_page(query, cursor, page_size, descending=False):
+    if cursor is not None:
+        value, last_pk = cursor
+
+        if value is None:
+            if descending:
+                query = query.filter(sort_value=None, pk__lt=last_pk)
+            else:
+                query = query.filter(sort_value=None, pk__gt=last_pk)
+        elif descending:
+            query = query.filter(Q(sort_value__lt=value) | Q(sort_value=value, pk__lt=last_pk) | Q(sort_value=None))
+        else:
+            query = query.filter(Q(sort_value__gt=value) | Q(sort_value=value, pk__gt=last_pk) | Q(sort_value=None))
+
+    sources = list(query[:(page_size + 1)])
+
+    next_cursor = None
+
+    if len(sources) > page_size:
+        sources = sources[:page_size]
+
+        next_cursor = encode_listing_cursor(sources[-1].sort_value, sources[-1].pk)
+
+    missing = [source.pk for source in sources if hasattr(source, 'summary') is False]
+
+    if missing:
+        summaries = {}
+
+        for summary in DataSourceSummary.objects.store_summaries(DataSource.objects.filter(pk__in=missing)):
+            summaries[summary.source_id] = summary
+
+        for source in sources:
+            if source.pk in summaries:
+                source.summary = summaries[source.pk]
+
+    return sources, next_cursor
+
+def source_listing_row(source):
+    summary = getattr(source, 'summary', None)
+
+    row = {
+        'pk': source.pk,
+        'identifier': source.identifier,
+        'name': source.name,
+        'details_url': source.details_url(),
+        'group': source.group_id,
+        'server': None,
+        'user_agent': None,
+        'latest_point_created': None,
+        'latest_point_ago': None,
+        'performance_metadata_updated': None,
+        'point_count': None,
+        'point_frequency': None,
+        'alert_level': ALERT_LEVEL_RANKS[source.alert_rank],
+        'actions': [],
+    }
+
+    if source.server is not None:
+        row['server'] = source.server.name
+
+    if source.performance_metadata_updated is not None:
+        row['performance_metadata_updated'] = source.performance_metadata_updated.isoformat()
+
+    if summary is not None:
+        row['user_agent'] = summary.user_agent
+        row['point_count'] = summary.point_count
+        row['point_frequency'] = summary.point_frequency
+
+        if summary.latest_point_created is not None:
+            row['latest_point_created'] = summary.latest_point_created.isoformat()
+            row['latest_point_ago'] = ago_string(summary.latest_point_created)
+
+    row['point_frequency_label'], row['point_frequency_tooltip'] = frequency_labels(row['point_frequency'] if row['point_frequency'] is not None else 0)
+
+    for action in home_actions(source):
+        row['actions'].append({
+            'name': action[0],
+            'url': reverse(action[1], args=[source.identifier]),
+            'icon': action[2],
+        })
+
+    return row
@@ -21,6 +21,7 @@ requirejs(['./common'], function (common) {
 		$('#sources_select_all').change(function() 
 		{
 			$(".source_checkbox").prop("checked", $(this).is(":checked"));
+			$(".group_select_members").prop("checked", $(this).is(":checked"));
 		});
 		
 		$('.group_select_members').change(function(eventObj)
@@ -28,8 +29,107 @@ requirejs(['./common'], function (common) {
 			 const id = $(this).attr('id')
 			 
 			$('.' + id).prop("checked", $(this).is(":checked"));
+
+			if ($(this).is(":checked") == false) {
+				$('#sources_select_all').prop("checked", false);
+			}
 		});
 
+		// Checked groups (and Select All) are expanded to their members by the server, so
+		// unchecking a single source also unchecks its group.
+
+		const sourceOption = function(groupPk, source) {
+			const option = $('<p style="padding-bottom: 0.25em; margin: 0px;"></p>')
+			const checkbox = $('<input type="checkbox" />')
+
+			checkbox.attr('name', 'source_' + source.identifier)
+			checkbox.attr('id', 'source_' + source.identifier)
+			checkbox.addClass('source_checkbox group_' + groupPk)
+			checkbox.prop('checked', $('#group_' + groupPk).is(':checked'))
+
+			checkbox.change(function() {
+				if ($(this).is(':checked') == false) {
+					$('#group_' + groupPk).prop('checked', false)
+					$('#sources_select_all').prop('checked', false)
+				}
+			})
+
+			const label = $('<label style="font-weight: normal; padding-left: 5px;"></label>')
+
+			label.attr('for', 'source_' + source.identifier)
+			label.text(source.name + ' (' + source.identifier + ')')
+
+			option.append(checkbox)
+			option.append(' ')
+			option.append(label)
+
+			return option
+		}
+
+		let listingRequest = 0
+
+		const loadSources = function(groupPk, after) {
+			const listing = $('.export_source_listing[data-group="' + groupPk + '"]')
+			const more = $('.export_source_listing_more[data-group="' + groupPk + '"]')
+
+			const request = listingRequest
+
+			const params = {
+				group: groupPk,
+				search: $('#sources_search').val().trim()
+			}
+
+			if (after !== null) {
+				params['after'] = after
+			}
+
+			$.get('sources.json', params, function(data) {
+				if (request != listingRequest) {
+					return
+				}
+
+				for (let i = 0; i < data.sources.length; i++) {
+					listing.append(sourceOption(groupPk, data.sources[i]))
+				}
+
+				more.off('click')
+
+				if (data.next === null) {
+					more.hide()
+				} else {
+					more.show()
+
+					more.click(function(eventObj) {
+						eventObj.preventDefault()
+
+						loadSources(groupPk, data.next)
+					})
+				}
+			})
+		}
+
+		const loadAllGroups = function() {
+			listingRequest += 1
+
+			$('.export_source_listing').each(function() {
+				$(this).empty()
+
+				loadSources($(this).attr('data-group'), null)
+			})
+		}
+
+		let searchTimeout = null
+
+		$('#sources_search').on('input', function() {
+			if (searchTimeout !== null) {
+				window.clearTimeout(searchTimeout)
+			}
+
+			searchTimeout = window.setTimeout(loadAllGroups, 300)
+		})
+
+		loadAllGroups()
+
 		$('#generators_select_all').change(function() 
 		{
 			$(".generator_checkbox").prop("checked", $(this).is(":checked"));
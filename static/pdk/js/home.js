@@ -121,15 +121,197 @@ requirejs(['./common'], function (common) {
 			});
 		};
 
-		$('table.group_table').on('sort.bs.table', function (e, name, order) {
-			window.setTimeout(setupTableActions, 250);
-		});
+		var textCell = function(value) {
+			var cell = $("<td></td>");
+
+			if (value === null || value === undefined) {
+				cell.text("None");
+			} else {
+				cell.text(value);
+			}
+
+			return cell;
+		};
+
+		var tooltipSpan = function(title, text) {
+			var span = $('<span data-toggle="tooltip" data-placement="top"></span>');
+
+			span.attr("title", title);
+			span.text(text);
+
+			return span;
+		};
+
+		var actionLink = function(title, className, source, icon) {
+			var link = $('<a href="#"></a>');
+
+			link.attr("title", title);
+			link.addClass(className);
+			link.attr("data-source-name", source.name);
+			link.attr("data-source-pk", source.pk);
+			link.append($('<span aria-hidden="true"></span>').addClass("glyphicon " + icon));
+
+			return link;
+		};
+
+		var sourceRow = function(source) {
+			var row = $("<tr></tr>");
+
+			var nameLink = $("<a></a>");
+			nameLink.attr("href", source.details_url);
+			nameLink.text(source.identifier);
+
+			row.append(textCell(source.name));
+			row.append($("<td></td>").append(nameLink));
+			row.append(textCell(source.server === null ? "Local" : source.server));
+			row.append(textCell(source.user_agent));
+
+			if (source.latest_point_created === null) {
+				row.append(textCell(null));
+			} else {
+				row.append($("<td></td>").append(tooltipSpan(source.latest_point_created, source.latest_point_ago)));
+			}
+
+			row.append(textCell(source.performance_metadata_updated === null ? "Never" : source.performance_metadata_updated));
+			row.append(textCell(source.point_count));
+			row.append($("<td></td>").append(tooltipSpan(source.point_frequency_tooltip, source.point_frequency_label)));
+			row.append(textCell(source.alert_level == "none" ? "" : source.alert_level));
+
+			var actions = $("<center></center>");
+
+			actions.append(actionLink("Rename Data Source", "rename_data_source", source, "glyphicon-pencil"));
+			actions.append("&nbsp;&nbsp;");
+			actions.append(actionLink("Move Data Source", "move_data_source", source, "glyphicon-folder-open"));
+			actions.append("&nbsp;&nbsp;");
+			actions.append(actionLink("Remove Data Source", "remove_data_source", source, "glyphicon-remove"));
+			actions.append("&nbsp;&nbsp;");
+
+			if (source.actions.length > 0) {
+				var menu = $('<ul class="dropdown-menu dropdown-menu-right"></ul>');
+
+				for (var i = 0; i < source.actions.length; i++) {
+					var action = source.actions[i];
+
+					var item = $("<a></a>");
+					item.attr("href", action.url);
+					item.append($('<span aria-hidden="true"></span>').addClass(action.icon));
+					item.append(document.createTextNode(" " + action.name));
+
+					menu.append($("<li></li>").append(item));
+				}
+
+				var dropdown = $('<span class="dropdown"></span>');
+				dropdown.append('<a title="Additional Actions" class="dropdown-toggle" href="#" data-toggle="dropdown" aria-haspopup="true" aria-expanded="true"><span class="glyphicon glyphicon-option-vertical" aria-hidden="true"></span></a>');
+				dropdown.append(menu);
 
-		$('table.group_table').on('page-change.bs.table', function (e, number, size) {
-			window.setTimeout(setupTableActions, 250);
+				actions.append(dropdown);
+			}
+
+			row.append($("<td></td>").append(actions));
+
+			return row;
+		};
+
+		// Each group table loads its rows a page at a time from sources.json, passing back the
+		// cursor returned with the previous page.
+
+		var loadSources = function(listing, reset) {
+			var state = listing.data("listing-state");
+
+			if (reset) {
+				state.after = null;
+				state.request += 1;
+
+				listing.find("tbody").empty();
+			}
+
+			var request = state.request;
+
+			var params = {
+				group: listing.attr("data-group"),
+				sort: state.sort,
+				descending: state.descending ? "true" : "false",
+				search: state.search
+			};
+
+			if (state.after !== null) {
+				params.after = state.after;
+			}
+
+			$.get("sources.json", params, function(data) {
+				if (request != state.request) {
+					return;
+				}
+
+				var body = listing.find("tbody");
+
+				for (var i = 0; i < data.sources.length; i++) {
+					body.append(sourceRow(data.sources[i]));
+				}
+
+				state.after = data.next;
+
+				if (data.next === null) {
+					listing.find(".source_listing_more").hide();
+				} else {
+					listing.find(".source_listing_more").show();
+				}
+
+				listing.find('[data-toggle="tooltip"]').tooltip();
+
+				setupTableActions();
+			});
+		};
+
+		$(".source_listing").each(function() {
+			var listing = $(this);
+
+			listing.data("listing-state", {
+				sort: "name",
+				descending: false,
+				search: "",
+				after: null,
+				request: 0
+			});
+
+			listing.find(".source_listing_load_more").click(function(eventObj) {
+				loadSources(listing, false);
+			});
+
+			listing.find(".source_listing_sort").click(function(eventObj) {
+				eventObj.preventDefault();
+
+				var state = listing.data("listing-state");
+				var sort = $(this).attr("data-sort");
+
+				if (state.sort == sort) {
+					state.descending = !state.descending;
+				} else {
+					state.sort = sort;
+					state.descending = false;
+				}
+
+				loadSources(listing, true);
+			});
+
+			var searchTimeout = null;
+
+			listing.find(".source_listing_search").on("input", function() {
+				var field = $(this);
+
+				if (searchTimeout !== null) {
+					window.clearTimeout(searchTimeout);
+				}
+
+				searchTimeout = window.setTimeout(function() {
+					listing.data("listing-state").search = field.val().trim();
+
+					loadSources(listing, true);
+				}, 300);
+			});
+
+			loadSources(listing, true);
 		});
-		
-		setupTableActions();
 
 		if (window.setupHome != undefined) {
 			window.setupHome();
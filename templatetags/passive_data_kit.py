@@ -22,6 +22,84 @@ from ..models import DataSourceAlert, DataServerApiToken
 
 register = template.Library()
 
+CACHED_PDK_APIS = {}
+
+def installed_pdk_apis():
+    # Failed imports are not cached by Python, so looking for pdk_api modules once per
+    # table row searched every installed app again.
+
+    if 'modules' not in CACHED_PDK_APIS:
+        modules = []
+
+        for app in settings.INSTALLED_APPS:
+            try:
+                modules.append(importlib.import_module(app + '.pdk_api'))
+            except ImportError:
+                pass
+
+        CACHED_PDK_APIS['modules'] = modules
+
+    return CACHED_PDK_APIS['modules']
+
+def ago_string(date_obj):
+    now = timezone.now()
+
+    diff = arrow.get(now.isoformat()).datetime - arrow.get(date_obj.isoformat()).datetime
+
+    if diff.days > 0:
+        return str(diff.days) + 'd'
+
+    minutes = old_div(diff.seconds, 60)
+
+    if minutes >= 60:
+        return str(old_div(minutes, 60)) + 'h'
+
+    return str(minutes) + 'm'
+
+def frequency_labels(frequency):
+    # Returns the (value, tooltip) pair displayed for a sampling frequency.
+
+    value = '{:10.3f}'.format(frequency) + ' Hz'
+
+    if frequency < 1.0:
+        value = '{:10.3f}'.format(frequency * 1000) + ' mHz'
+
+    tooltip = '{:10.3f}'.format(frequency) + ' samples per second'
+
+    if frequency < 1.0:
+        frequency *= 60
+
+        if frequency > 1.0:
+            tooltip = '{:10.3f}'.format(frequency) + ' samples per minute'
+        else:
+            frequency *= 60
+
+            if frequency > 1.0:
+                tooltip = '{:10.3f}'.format(frequency) + ' samples per hour'
+            else:
+                frequency *= 24
+
+                if frequency > 1.0:
+                    tooltip = '{:10.3f}'.format(frequency) + ' samples per day'
+                else:
+                    frequency *= 7
+
+                    tooltip = '{:10.3f}'.format(frequency) + ' samples per week'
+
+    return value, tooltip
+
+def home_actions(source):
+    actions = []
+
+    for pdk_api in installed_pdk_apis():
+        try:
+            actions.extend(pdk_api.additional_home_actions(source))
+        except AttributeError:
+            # traceback.print_exc()
+            pass
+
+    return actions
+
 @register.tag(name='sources_table')
 def sources_table(parser, token): # pylint: disable=unused-argument
     try:
@@ -38,6 +116,9 @@ class SourcesTableNode(template.Node):
     def render(self, context):
         query = self.query.resolve(context)
 
+        if hasattr(query, 'all'):
+            query = query.all().select_related('server', 'summary')
+
         context['sources'] = query
 
         return render_to_string('tag_sources_table.html', context.flatten())
@@ -106,35 +187,7 @@ class PointHzNode(template.Node):
         if frequency is None:
             frequency = 0
 
-        value = '{:10.3f}'.format(frequency) + ' Hz'
-
-        if frequency < 1.0:
-            value = '{:10.3f}'.format(frequency * 1000) + ' mHz'
-
-        tooltip = '{:10.3f}'.format(frequency) + ' samples per second'
-
-        if frequency < 1.0:
-            frequency *= 60
-
-            if frequency > 1.0:
-                tooltip = '{:10.3f}'.format(frequency) + ' samples per minute'
-            else:
-                frequency *= 60
-
-                if frequency > 1.0:
-                    tooltip = '{:10.3f}'.format(frequency) + ' samples per hour'
-                else:
-                    frequency *= 24
-
-                    if frequency > 1.0:
-                        tooltip = '{:10.3f}'.format(frequency) + ' samples per day'
-                    else:
-                        frequency *= 7
-
-                        tooltip = '{:10.3f}'.format(frequency) + ' samples per week'
-
-        context['value'] = value
-        context['tooltip'] = tooltip
+        context['value'], context['tooltip'] = frequency_labels(frequency)
 
         return render_to_string('tag_point_hz.html', context.flatten())
 
@@ -154,37 +207,30 @@ class ToHzNode(template.Node):
     def render(self, context):
         frequency = self.frequency.resolve(context)
 
-        value = '{:10.3f}'.format(frequency) + ' Hz'
+        context['value'], context['tooltip'] = frequency_labels(frequency)
 
-        if frequency < 1.0:
-            value = '{:10.3f}'.format(frequency * 1000) + ' mHz'
-
-        tooltip = '{:10.3f}'.format(frequency) + ' samples per second'
-
-        if frequency < 1.0:
-            frequency *= 60
+        return render_to_string('tag_point_hz.html', context.flatten())
 
-            if frequency > 1.0:
-                tooltip = '{:10.3f}'.format(frequency) + ' samples per minute'
-            else:
-                frequency *= 60
+@register.filter('pdk_hz')
+def pdk_hz(frequency):
+    if frequency is None or frequency == '':
+        frequency = 0
 
-                if frequency > 1.0:
-                    tooltip = '{:10.3f}'.format(frequency) + ' samples per hour'
-                else:
-                    frequency *= 24
+    return frequency_labels(frequency)[0]
 
-                    if frequency > 1.0:
-                        tooltip = '{:10.3f}'.format(frequency) + ' samples per day'
-                    else:
-                        frequency *= 7
+@register.filter('pdk_hz_tooltip')
+def pdk_hz_tooltip(frequency):
+    if frequency is None or frequency == '':
+        frequency = 0
 
-                        tooltip = '{:10.3f}'.format(frequency) + ' samples per week'
+    return frequency_labels(frequency)[1]
 
-        context['value'] = value
-        context['tooltip'] = tooltip
+@register.filter('pdk_ago')
+def pdk_ago(date_obj):
+    if date_obj is None or date_obj == '':
+        return 'None'
 
-        return render_to_string('tag_point_hz.html', context.flatten())
+    return ago_string(date_obj)
 
 @register.tag(name='date_ago')
 def date_ago(parser, token): # pylint: disable=unused-argument
@@ -205,23 +251,7 @@ class DateAgoNode(template.Node):
         if date_obj is None:
             return 'None'
 
-        now = timezone.now()
-
-        diff = arrow.get(now.isoformat()).datetime - arrow.get(date_obj.isoformat()).datetime
-
-        ago_str = 'Unknown'
-
-        if diff.days > 0:
-            ago_str = str(diff.days) + 'd'
-        else:
-            minutes = old_div(diff.seconds, 60)
-
-            if minutes >= 60:
-                ago_str = str(old_div(minutes, 60)) + 'h'
-            else:
-                ago_str = str(minutes) + 'm'
-
-        context['ago'] = ago_str
+        context['ago'] = ago_string(date_obj)
         context['date'] = date_obj
 
         return render_to_string('tag_date_ago.html', context.flatten())
@@ -548,25 +578,15 @@ class AdditionalHomeActionsNode(template.Node):
     def render(self, context):
         source = self.source.resolve(context)
 
-        actions = []
-
-        for app in settings.INSTALLED_APPS:
-            try:
-                pdk_api = importlib.import_module(app + '.pdk_api')
-
-                actions.extend(pdk_api.additional_home_actions(source))
-            except ImportError:
-                # traceback.print_exc()
-                pass
-            except AttributeError:
-                # traceback.print_exc()
-                pass
-
-        context['actions'] = actions
+        context['actions'] = home_actions(source)
         context['source'] = source
 
         return render_to_string('tag_additional_home_actions.html', context.flatten())
 
+@register.filter('pdk_home_actions')
+def pdk_home_actions(source):
+    return home_actions(source)
+
 @register.tag(name='pdk_custom_nav_items')
 def pdk_custom_nav_items(parser, token): # pylint: disable=unused-argument
     tag_name = token.split_contents() # pylint: disable=unused-variable
@@ -1,4 +1,46 @@
-from django.test import TestCase
+# pylint: disable=no-member, line-too-long
+
+import base64
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+import zipfile
+
+import boto3
+
+from nacl.secret import SecretBox
+from nacl.utils import random as random_bytes
+
+from django.core import management
+from django.test import TestCase, override_settings
+
+try:
+    from django.urls import reverse
+except ImportError: # Django 1.11
+    from django.core.urlresolvers import reverse
+
+from .columnar_export import columnar_export_available, convert_report
+from .management.commands.pdk_incremental_backup import backup_uploader, transmit_backup_files
+from .models import AppConfiguration, DataSource, install_supports_jsonfield
+
+try:
+    from unittest import mock
+except ImportError: # Python 2
+    mock = None
+
+try:
+    from pyarrow import parquet
+except ImportError:
+    parquet = None
+
+try:
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
 
 class TestBasicsTestCase(TestCase):
     def setUp(self):
@@ -6,3 +48,211 @@ class TestBasicsTestCase(TestCase):
 
     def test_tests_working(self):
         self.assertNotEqual('foo', 'bar')
+
+def failing_uploader(filename, payload): # pylint: disable=unused-argument
+    raise IOError('Upload failed.')
+
+class IncrementalBackupUploadTestCase(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+        self.key = random_bytes(SecretBox.KEY_SIZE)
+
+        self.payload = b'pdk-backup-test-content' * 1024
+
+        self.staged_path = os.path.join(self.folder, 'pdk_backup_test.json.bz2')
+
+        with open(self.staged_path, 'wb') as staged_file:
+            staged_file.write(self.payload)
+
+    def test_file_destination(self):
+        destination = os.path.join(self.folder, 'destination')
+
+        uploader = backup_uploader('file://' + destination, 'test-folder')
+
+        self.assertTrue(transmit_backup_files([self.staged_path], [uploader], self.key, 2))
+
+        with open(os.path.join(destination, 'test-folder', 'pdk_backup_test.json.bz2.encrypted'), 'rb') as encrypted_file:
+            self.assertEqual(self.payload, SecretBox(self.key).decrypt(encrypted_file.read()))
+
+    @unittest.skipIf(ThreadedMotoServer is None, 'moto[server] is not installed.')
+    def test_s3_endpoint_destination(self):
+        port_socket = socket.socket()
+        port_socket.bind(('127.0.0.1', 0))
+        port = port_socket.getsockname()[1]
+        port_socket.close()
+
+        server = ThreadedMotoServer(ip_address='127.0.0.1', port=port)
+        server.start()
+
+        try:
+            endpoint_url = 'http://127.0.0.1:' + str(port)
+
+            client = boto3.client('s3', region_name='us-east-1', endpoint_url=endpoint_url, aws_access_key_id='testing', aws_secret_access_key='testing')
+            client.create_bucket(Bucket='pdk-backup-test')
+
+            with override_settings(PDK_BACKUP_AWS_REGION='us-east-1', PDK_BACKUP_AWS_ACCESS_KEY_ID='testing', PDK_BACKUP_AWS_SECRET_ACCESS_KEY='testing', PDK_BACKUP_AWS_ENDPOINT_URL=endpoint_url):
+                uploader = backup_uploader('s3://pdk-backup-test', 'test-folder')
+
+                self.assertTrue(transmit_backup_files([self.staged_path], [uploader], self.key, 2))
+
+            stored = client.get_object(Bucket='pdk-backup-test', Key='test-folder/pdk_backup_test.json.bz2.encrypted')['Body'].read()
+
+            self.assertEqual(self.payload, SecretBox(self.key).decrypt(stored))
+        finally:
+            server.stop()
+
+    def test_failed_upload_reported(self):
+        destination = os.path.join(self.folder, 'destination')
+
+        uploaders = [backup_uploader('file://' + destination, 'test-folder'), failing_uploader]
+
+        self.assertFalse(transmit_backup_files([self.staged_path], uploaders, self.key, 2))
+
+    @unittest.skipIf(mock is None, 'unittest.mock is not available.')
+    def test_failed_upload_keeps_points(self):
+        backup_key = base64.b64encode(self.key).decode('utf-8')
+
+        with override_settings(PDK_BACKUP_KEY=backup_key, PDK_BACKUP_DESTINATIONS=['file://' + os.path.join(self.folder, 'destination')]):
+            with mock.patch('passive_data_kit.pdk_api.incremental_backup', return_value=([self.staged_path], ['pdk:1'])), \
+                 mock.patch('passive_data_kit.pdk_api.clear_points') as clear_points, \
+                 mock.patch('passive_data_kit.management.commands.pdk_incremental_backup.backup_uploader', return_value=failing_uploader):
+                management.call_command('pdk_incremental_backup', '--clear-archived')
+
+        clear_points.assert_not_called()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+def configuration_json(configuration):
+    if install_supports_jsonfield():
+        return configuration
+
+    return json.dumps(configuration)
+
+class AppConfigurationCacheTestCase(TestCase):
+    def setUp(self):
+        AppConfiguration.objects.clear_cache()
+
+        self.configuration = AppConfiguration.objects.create(name='Default', id_pattern='.*', is_valid=True, configuration_json=configuration_json({'interval': 60}))
+
+    def fetch_configuration(self, identifier, etag=None):
+        if etag is not None:
+            return self.client.get(reverse('pdk_app_config'), {'id': identifier}, HTTP_IF_NONE_MATCH=etag)
+
+        return self.client.get(reverse('pdk_app_config'), {'id': identifier})
+
+    def test_etag_not_modified(self):
+        response = self.fetch_configuration('cache-test')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'interval': 60}, json.loads(response.content))
+
+        etag = response['ETag']
+
+        self.assertEqual(304, self.fetch_configuration('cache-test', etag).status_code)
+        self.assertEqual(304, self.fetch_configuration('cache-test', 'W/' + etag).status_code)
+        self.assertEqual(304, self.fetch_configuration('cache-test', '"other", ' + etag).status_code)
+        self.assertEqual(200, self.fetch_configuration('cache-test', '"other"').status_code)
+
+    def test_save_invalidates(self):
+        etag = self.fetch_configuration('cache-test')['ETag']
+
+        self.configuration.configuration_json = configuration_json({'interval': 120})
+        self.configuration.save()
+
+        response = self.fetch_configuration('cache-test', etag)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'interval': 120}, json.loads(response.content))
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_delete_invalidates(self):
+        self.fetch_configuration('cache-test')
+
+        self.configuration.delete()
+
+        self.assertEqual({}, json.loads(self.fetch_configuration('cache-test').content))
+
+    def test_assignment_invalidates(self):
+        self.fetch_configuration('cache-test')
+
+        assigned = AppConfiguration.objects.create(name='Assigned', id_pattern='unused', is_valid=True, configuration_json=configuration_json({'interval': 5}))
+
+        DataSource.objects.create(name='cache-test', identifier='cache-test', configuration=assigned)
+
+        self.assertEqual({'interval': 5}, json.loads(self.fetch_configuration('cache-test').content))
+
+    @unittest.skipIf(install_supports_jsonfield(), 'JSONField configurations cannot be malformed.')
+    def test_malformed_isolated(self):
+        AppConfiguration.objects.create(name='Malformed', id_pattern='malformed-test', is_valid=True, evaluate_order=0, configuration_json='{')
+
+        self.assertEqual(200, self.fetch_configuration('malformed-test').status_code)
+        self.assertEqual({'interval': 60}, json.loads(self.fetch_configuration('cache-test').content))
+
+    def test_invalid_pattern_exact(self):
+        AppConfiguration.objects.create(name='Invalid', id_pattern='exact-test[', is_valid=True, evaluate_order=0, configuration_json=configuration_json({'interval': 30}))
+
+        self.assertEqual({'interval': 30}, json.loads(self.fetch_configuration('exact-test[').content))
+        self.assertEqual({'interval': 60}, json.loads(self.fetch_configuration('cache-test').content))
+
+    def tearDown(self):
+        AppConfiguration.objects.clear_cache()
+
+@unittest.skipIf(columnar_export_available() is False, 'pyarrow is not installed.')
+class ColumnarExportTestCase(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def write_report(self, filename, content):
+        path = os.path.join(self.folder, filename)
+
+        with io.open(path, 'w', encoding='utf-8') as report_file:
+            report_file.write(content)
+
+        return path
+
+    def test_header_only_report(self):
+        text_path = self.write_report('report.txt', 'Source\tCreated Timestamp\tValue\n')
+
+        converted = convert_report(text_path)
+
+        self.assertTrue(converted.endswith('.parquet'))
+        self.assertTrue(os.path.exists(converted))
+        self.assertFalse(os.path.exists(text_path))
+
+        table = parquet.read_table(converted)
+
+        self.assertEqual(0, table.num_rows)
+        self.assertEqual(['Source', 'Created Timestamp', 'Value'], table.schema.names)
+
+    def test_empty_report(self):
+        converted = convert_report(self.write_report('report.txt', ''))
+
+        self.assertEqual(0, parquet.read_table(converted).num_rows)
+
+    def test_rows_report(self):
+        converted = convert_report(self.write_report('report.txt', 'Source\tCreated Timestamp\tValue\ntest-source\t1700000000\t3\n'))
+
+        rows = parquet.read_table(converted).to_pylist()
+
+        self.assertEqual(1, len(rows))
+        self.assertEqual('test-source', rows[0]['Source'])
+
+    def test_empty_zip_members(self):
+        zip_path = os.path.join(self.folder, 'report.zip')
+
+        with zipfile.ZipFile(zip_path, 'w') as report_zip:
+            report_zip.writestr('header.txt', 'Source\tValue\n')
+            report_zip.writestr('empty.txt', '')
+            report_zip.writestr('notes.md', 'Notes')
+
+        converted = convert_report(zip_path)
+
+        with zipfile.ZipFile(converted, 'r') as converted_zip:
+            self.assertEqual(['header.parquet', 'empty.parquet', 'notes.md'], converted_zip.namelist())
+
+        self.assertFalse(os.path.exists(zip_path))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
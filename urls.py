@@ -32,7 +32,7 @@ try:
     if settings.PDK_DASHBOARD_ENABLED:
         from .views import pdk_home, pdk_unmatched_sources, pdk_source, pdk_source_generator, \
                            pdk_visualization_data, pdk_export, pdk_download_report, \
-                           pdk_system_health, pdk_profile
+                           pdk_system_health, pdk_profile, pdk_sources_json
 
         urlpatterns.append(url(r'^visualization/(?P<source_id>.+)/(?P<generator_id>.+)/(?P<page>\d+).json$', \
                                pdk_visualization_data, name='pdk_visualization_data'))
@@ -46,6 +46,7 @@ try:
         urlpatterns.append(url(r'^issues.json$', pdk_issues_json, name='pdk_issues_json'))
         urlpatterns.append(url(r'^issues$', pdk_issues, name='pdk_issues'))
         urlpatterns.append(url(r'^unmatched-sources.json$', pdk_unmatched_sources, name='pdk_unmatched_sources'))
+        urlpatterns.append(url(r'^sources.json$', pdk_sources_json, name='pdk_sources_json'))
         urlpatterns.append(url(r'^logout$', LogoutView.as_view(), name='pdk_logout'))
         urlpatterns.append(url(r'^$', pdk_home, name='pdk_home'))
 except AttributeError:
@@ -53,9 +54,10 @@ except AttributeError:
 
 try:
     if settings.PDK_API_ENABLED:
-        from .api_views import pdk_request_token, pdk_data_point_query, pdk_data_source_query, pdk_data_source_update
+        from .api_views import pdk_request_token, pdk_data_point_query, pdk_data_source_query, pdk_data_source_update, pdk_data_point_sync
         urlpatterns.append(url(r'^api/request-token.json$', pdk_request_token, name='pdk_request_token'))
         urlpatterns.append(url(r'^api/data-points.json$', pdk_data_point_query, name='pdk_data_point_query'))
+        urlpatterns.append(url(r'^api/data-points/sync.json$', pdk_data_point_sync, name='pdk_data_point_sync'))
         urlpatterns.append(url(r'^api/data-sources.json$', pdk_data_source_query, name='pdk_data_source_query'))
         urlpatterns.append(url(r'^api/data-sources/update.json$', pdk_data_source_update, name='pdk_data_source_update'))
 except AttributeError:
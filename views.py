@@ -7,23 +7,74 @@ import importlib
 import io
 import json
 import os
-import re
 import traceback
 
 from django.conf import settings
+from django.db.models import Count, Q
 from django.db.utils import DataError
 from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, HttpResponseNotFound, \
-                        FileResponse, UnreadablePostError
+                        FileResponse, UnreadablePostError, HttpResponseNotModified
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
 from django.utils.encoding import smart_str
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 
 from django.contrib.admin.views.decorators import staff_member_required
 
 from .models import DataPoint, DataBundle, DataFile, DataSourceGroup, DataSource, ReportJob, \
                     generator_label, install_supports_jsonfield, DataSourceAlert, \
-                    DataServerMetadatum, AppConfiguration, DeviceIssue, Device, DeviceModel
+                    DataServerMetadatum, AppConfiguration, DeviceIssue, Device, DeviceModel, \
+                    STATUS_CHECK_PERFORMANCE_DATUM
+from .source_listing import SOURCE_LISTING_SORT_FIELDS, SOURCE_LISTING_PAGE_SIZE, SOURCE_LISTING_MAX_PAGE_SIZE, \
+                             decode_listing_cursor, source_listing_query, source_listing_page, source_listing_row
+
+
+def store_single_data_point(point):
+    # Single-point uploads are either written as a one-point DataBundle (a single INSERT, left
+    # for pdk_process_bundles to ingest in bulk) or as a DataPoint whose references are resolved
+    # before the one and only save.
+
+    now = timezone.now()
+
+    as_bundle = False
+
+    try:
+        as_bundle = settings.PDK_ADD_DATA_POINT_AS_BUNDLE
+    except AttributeError:
+        pass
+
+    if as_bundle:
+        bundle = DataBundle(recorded=now)
+
+        if install_supports_jsonfield():
+            bundle.properties = [point]
+        else:
+            bundle.properties = json.dumps([point])
+
+        bundle.save()
+
+        return
+
+    data_point = DataPoint(recorded=now)
+    data_point.source = point['passive-data-metadata']['source']
+    data_point.generator = point['passive-data-metadata']['generator']
+    data_point.created = datetime.datetime.fromtimestamp(point['passive-data-metadata']['timestamp'], tz=timezone.get_default_timezone())
+
+    if 'generator-id' in point['passive-data-metadata']:
+        data_point.generator_identifier = point['passive-data-metadata']['generator-id']
+
+    if install_supports_jsonfield():
+        data_point.properties = point
+    else:
+        data_point.properties = json.dumps(point, indent=2)
+
+    data_point.fetch_secondary_identifier(skip_save=True, properties=point)
+    data_point.fetch_user_agent(skip_save=True, properties=point)
+    data_point.fetch_generator_definition(skip_save=True)
+    data_point.fetch_source_reference(skip_save=True)
+
+    data_point.save()
 
 
 @csrf_exempt
@@ -54,27 +105,7 @@ def pdk_add_data_point(request): # pylint: disable=too-many-statements
 
         point = json.loads(request.body)
 
-        data_point = DataPoint(recorded=timezone.now())
-        data_point.source = point['passive-data-metadata']['source']
-        data_point.generator = point['passive-data-metadata']['generator']
-        data_point.created = datetime.datetime.fromtimestamp(point['passive-data-metadata']['source'], tz=timezone.get_default_timezone())
-
-        if 'generator-id' in point['passive-data-metadata']:
-            data_point.generator_identifier = point['passive-data-metadata']['generator-id']
-
-        if install_supports_jsonfield():
-            data_point.properties = point
-        else:
-            data_point.properties = json.dumps(point, indent=2)
-
-        data_point.save()
-
-        data_point.fetch_secondary_identifier(skip_save=True, properties=data_point.properties)
-        data_point.fetch_user_agent(skip_save=True, properties=data_point.properties)
-        data_point.fetch_generator_definition(skip_save=True)
-        data_point.fetch_source_reference(skip_save=True)
-
-        data_point.save()
+        store_single_data_point(point)
 
         return response
     elif request.method == 'POST':
@@ -89,27 +120,7 @@ def pdk_add_data_point(request): # pylint: disable=too-many-statements
 
         point = json.loads(request.POST['payload'])
 
-        data_point = DataPoint(recorded=timezone.now())
-        data_point.source = point['passive-data-metadata']['source']
-        data_point.generator = point['passive-data-metadata']['generator']
-        data_point.created = datetime.datetime.fromtimestamp(point['passive-data-metadata']['timestamp'], tz=timezone.get_default_timezone())
-
-        if 'generator-id' in point['passive-data-metadata']:
-            data_point.generator_identifier = point['passive-data-metadata']['generator-id']
-
-        if install_supports_jsonfield():
-            data_point.properties = point
-        else:
-            data_point.properties = json.dumps(point, indent=2)
-
-        data_point.save()
-
-        data_point.fetch_secondary_identifier(skip_save=True, properties=data_point.properties)
-        data_point.fetch_user_agent(skip_save=True, properties=data_point.properties)
-        data_point.fetch_generator_definition(skip_save=True)
-        data_point.fetch_source_reference(skip_save=True)
-
-        data_point.save()
+        store_single_data_point(point)
 
         return response
     elif request.method == 'OPTIONS':
@@ -296,6 +307,49 @@ def pdk_add_data_bundle(request): # pylint: disable=too-many-statements, too-man
     return HttpResponseNotAllowed(['CREATE', 'POST', 'HEAD'])
 
 
+def add_home_source(post):
+    # Creates the source added from the home page, with a unique identifier and name.
+
+    identifier = post['source_identifier'].strip()
+    name = post['friendly_name'].strip()
+
+    group = post['assigned_group']
+    group_name = post['new_group_name'].strip()
+
+    final_identifier = identifier
+    final_count = 2
+
+    while DataSource.objects.filter(identifier=final_identifier).count() > 0:
+        final_identifier = identifier + '-' + str(final_count)
+
+        final_count += 1
+
+    final_name = name
+    final_count = 2
+
+    while DataSource.objects.filter(name=final_name).count() > 0:
+        final_name = name + ' ' + str(final_count)
+
+        final_count += 1
+
+    source = DataSource(identifier=final_identifier, name=final_name)
+
+    if group == "-1":
+        pass
+    elif group == "0":
+        group = DataSourceGroup.objects.filter(name=group_name).first()
+
+        if group is None:
+            group = DataSourceGroup(name=group_name)
+            group.save()
+
+        source.group = group
+    else:
+        source.group = DataSourceGroup.objects.get(pk=int(group))
+
+    source.save()
+
+
 @staff_member_required
 def pdk_home(request): # pylint: disable=too-many-branches, too-many-statements
     for app in settings.INSTALLED_APPS:
@@ -312,44 +366,7 @@ def pdk_home(request): # pylint: disable=too-many-branches, too-many-statements
 
     if request.method == 'POST':
         if request.POST['operation'] == 'add_source':
-            identifier = request.POST['source_identifier'].strip()
-            name = request.POST['friendly_name'].strip()
-
-            group = request.POST['assigned_group']
-            group_name = request.POST['new_group_name'].strip()
-
-            final_identifier = identifier
-            final_count = 2
-
-            while DataSource.objects.filter(identifier=final_identifier).count() > 0:
-                final_identifier = identifier + '-' + str(final_count)
-
-                final_count += 1
-
-            final_name = name
-            final_count = 2
-
-            while DataSource.objects.filter(name=final_name).count() > 0:
-                final_name = name + ' ' + str(final_count)
-
-                final_count += 1
-
-            source = DataSource(identifier=final_identifier, name=final_name)
-
-            if group == "-1":
-                pass
-            elif group == "0":
-                group = DataSourceGroup.objects.filter(name=group_name).first()
-
-                if group is None:
-                    group = DataSourceGroup(name=group_name)
-                    group.save()
-
-                source.group = group
-            else:
-                source.group = DataSourceGroup.objects.get(pk=int(group))
-
-            source.save()
+            add_home_source(request.POST)
         elif request.POST['operation'] == 'remove_source':
             DataSource.objects.filter(pk=int(request.POST['pk'])).delete()
         elif request.POST['operation'] == 'move_source':
@@ -376,9 +393,6 @@ def pdk_home(request): # pylint: disable=too-many-branches, too-many-statements
 
             source.save()
 
-    context['groups'] = DataSourceGroup.objects.order_by('name')
-    context['solo_sources'] = DataSource.objects.filter(group=None).order_by('name')
-
     excluded_sources = []
 
     try:
@@ -388,6 +402,21 @@ def pdk_home(request): # pylint: disable=too-many-branches, too-many-statements
 
     context['excluded_sources'] = excluded_sources
 
+    # Only the group counts are rendered here. The tables load their rows from pdk_sources_json.
+
+    group_counts = {}
+
+    for group_pk, count in DataSource.objects.exclude(identifier__in=excluded_sources).order_by().values_list('group').annotate(Count('pk')):
+        group_counts[group_pk] = count
+
+    groups = list(DataSourceGroup.objects.order_by('name'))
+
+    for group in groups:
+        group.source_count = group_counts.get(group.pk, 0)
+
+    context['groups'] = groups
+    context['solo_count'] = group_counts.get(None, 0)
+
     return render(request, 'pdk_home.html', context=context)
 
 
@@ -474,6 +503,43 @@ def pdk_source_generator(request, source_id, generator_id): # pylint: disable=un
     return render(request, 'pdk_source_generator.html', context=context)
 
 
+@staff_member_required
+def pdk_sources_json(request):
+    excluded_sources = []
+
+    try:
+        excluded_sources = settings.PDK_EXCLUDED_SOURCES
+    except AttributeError:
+        pass
+
+    sort = request.GET.get('sort', 'name')
+    descending = (request.GET.get('descending', 'false') == 'true')
+
+    if (sort in SOURCE_LISTING_SORT_FIELDS) is False:
+        return JsonResponse({'message': 'Unknown sort field: ' + sort}, status=400)
+
+    try:
+        page_size = min(int(request.GET.get('page_size', SOURCE_LISTING_PAGE_SIZE)), SOURCE_LISTING_MAX_PAGE_SIZE)
+
+        cursor = None
+
+        if request.GET.get('after', ''):
+            cursor = decode_listing_cursor(request.GET['after'], sort)
+
+        query = source_listing_query(excluded_sources, request.GET.get('search', '').strip(), request.GET.get('group', None), sort, descending)
+    except (TypeError, ValueError) as exc:
+        return JsonResponse({'message': 'Invalid listing parameters: ' + str(exc)}, status=400)
+
+    sources, next_cursor = source_listing_page(query, cursor, max(page_size, 1), descending)
+
+    payload = {
+        'sources': [source_listing_row(source) for source in sources],
+        'next': next_cursor,
+    }
+
+    return JsonResponse(payload, safe=False, json_dumps_params={'indent': 2})
+
+
 @staff_member_required
 def pdk_unmatched_sources(request): # pylint: disable=unused-argument
     sources = DataPoint.objects.sources()
@@ -531,24 +597,21 @@ def pdk_export(request): # pylint: disable=too-many-branches, too-many-locals, t
     except AttributeError:
         pass
 
-    for group in DataSourceGroup.objects.all().order_by('name'):
-        group_def = (group.name, [], group.pk)
+    # Group members are loaded by the page from pdk_sources_json as the list is scrolled.
 
-        for source in group.sources.all().order_by('name'):
-            if (source.identifier in excluded_sources) is False:
-                group_def[1].append(source)
+    listed_sources = DataSource.objects.exclude(identifier__in=excluded_sources)
 
-        if len(group_def[1]) > 0: # pylint: disable=len-as-condition
-            groups.append(group_def)
+    group_counts = {}
 
-    group_def = ('(Not in group)', [], 0)
+    for group_pk, count in listed_sources.order_by().values_list('group').annotate(Count('pk')):
+        group_counts[group_pk] = count
 
-    for source in DataSource.objects.filter(group=None).order_by('name'):
-        if (source.identifier in excluded_sources) is False:
-            group_def[1].append(source)
+    for group in DataSourceGroup.objects.all().order_by('name'):
+        if group_counts.get(group.pk, 0) > 0:
+            groups.append((group.name, group_counts[group.pk], group.pk))
 
-    if len(group_def[1]) > 0: # pylint: disable=len-as-condition
-        groups.append(group_def)
+    if group_counts.get(None, 0) > 0:
+        groups.append(('(Not in group)', group_counts[None], 0))
 
     context['groups'] = groups
     context['sources'] = sorted(DataPoint.objects.sources())
@@ -646,6 +709,35 @@ def pdk_export(request): # pylint: disable=too-many-branches, too-many-locals, t
                 if source != '':
                     export_sources.append(source)
 
+        # Whole groups (or every source) are expanded here, as the page may not have loaded
+        # all of their members.
+
+        selected_groups = []
+
+        for key in request.POST:
+            if key.startswith('group_') and request.POST[key] == 'on':
+                selected_groups.append(int(key.replace('group_', '')))
+
+        expanded_sources = None
+
+        if request.POST.get('all_sources', '') == 'on':
+            expanded_sources = listed_sources
+        elif selected_groups:
+            group_filter = Q(group_id__in=selected_groups)
+
+            if 0 in selected_groups:
+                group_filter = group_filter | Q(group=None)
+
+            expanded_sources = listed_sources.filter(group_filter)
+
+        if expanded_sources is not None:
+            selected_sources = set(export_sources)
+
+            for identifier in expanded_sources.order_by('name').values_list('identifier', flat=True):
+                if (identifier in selected_sources) is False:
+                    export_sources.append(identifier)
+                    selected_sources.add(identifier)
+
         if len(export_sources) == 0: # pylint: disable=len-as-condition
             context['message_type'] = 'error'
 
@@ -666,7 +758,9 @@ def pdk_export(request): # pylint: disable=too-many-branches, too-many-locals, t
 
             date_type = request.POST['date_type']
 
-            created = ReportJob.objects.create_jobs(request.user, export_sources, export_generators, export_raw, data_start, data_end, date_type) # pylint: disable=assignment-from-no-return
+            export_format = request.POST.get('export_format', 'tsv')
+
+            created = ReportJob.objects.create_jobs(request.user, export_sources, export_generators, export_raw, data_start, data_end, date_type, export_format) # pylint: disable=assignment-from-no-return
 
             context['message_type'] = 'ok'
 
@@ -683,12 +777,19 @@ def pdk_export(request): # pylint: disable=too-many-branches, too-many-locals, t
 
 @staff_member_required
 def pdk_system_health(request):
+    context = {}
+
     datum = DataServerMetadatum.objects.filter(key='Server Health').first()
 
     if datum is not None:
-        return render(request, 'pdk_system_health.html', context=json.loads(datum.value))
+        context = json.loads(datum.value)
 
-    return render(request, 'pdk_system_health.html', context={})
+    check_datum = DataServerMetadatum.objects.filter(key=STATUS_CHECK_PERFORMANCE_DATUM).first()
+
+    if check_datum is not None:
+        context['status_checks'] = json.loads(check_datum.value)
+
+    return render(request, 'pdk_system_health.html', context=context)
 
 
 @staff_member_required
@@ -719,7 +820,7 @@ def pdk_profile(request):
     return render(request, 'pdk_user_profile.html', context=context)
 
 @csrf_exempt
-def pdk_app_config(request): # pylint: disable=too-many-statements, too-many-branches
+def pdk_app_config(request):
     identifier = None
     context = None
 
@@ -744,35 +845,14 @@ def pdk_app_config(request): # pylint: disable=too-many-statements, too-many-bra
     except AttributeError:
         pass
 
-    source = DataSource.objects.filter(identifier=identifier).first()
-
-    if source is not None:
-        if source.configuration is not None:
-            response = HttpResponse(json.dumps(source.configuration.configuration(), indent=2), content_type='application/json', status=200)
-
-            response['Access-Control-Allow-Origin'] = '*'
-
-            return response
-
-    for config in AppConfiguration.objects.filter(id_pattern=identifier, is_valid=True, is_enabled=True).order_by('evaluate_order'):
-        if config.context_pattern == '.*' or re.search(config.context_pattern, context) is not None:
-            response = HttpResponse(json.dumps(config.configuration(), indent=2), content_type='application/json', status=200)
+    body, etag = AppConfiguration.objects.resolve_configuration(identifier, context)
 
-            response['Access-Control-Allow-Origin'] = '*'
-
-            return response
-
-    for config in AppConfiguration.objects.filter(is_valid=True, is_enabled=True).order_by('evaluate_order'):
-        if config.id_pattern == '.*' or re.search(config.id_pattern, identifier) is not None:
-            if config.context_pattern == '.*' or re.search(config.context_pattern, context) is not None:
-                response = HttpResponse(json.dumps(config.configuration(), indent=2), content_type='application/json', status=200)
-
-                response['Access-Control-Allow-Origin'] = '*'
-
-                return response
-
-    response = HttpResponse(json.dumps({}, indent=2), content_type='application/json', status=200)
+    if etag in [tag.replace('W/', '', 1) for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json', status=200)
 
+    response['ETag'] = etag
     response['Access-Control-Allow-Origin'] = '*'
 
     return response
@@ -0,0 +1,97 @@
+# pylint: disable=line-too-long
+
+import io
+import itertools
+import struct
+import zipfile
+
+import zipstream
+
+ZIP_COPY_CHUNK_SIZE = 1024 * 1024
+
+LOCAL_HEADER_SIZE = 30
+
+def raw_member_chunks(raw_file, member, chunk_size=ZIP_COPY_CHUNK_SIZE):
+    # Yields the still-compressed bytes of an archive member, skipping its local header.
+
+    raw_file.seek(member.header_offset)
+
+    local_header = raw_file.read(LOCAL_HEADER_SIZE)
+
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+
+    raw_file.seek(member.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    remaining = member.compress_size
+
+    while remaining > 0:
+        chunk = raw_file.read(min(remaining, chunk_size))
+
+        if not chunk:
+            raise zipfile.BadZipfile('Truncated member ' + member.filename + '.')
+
+        remaining -= len(chunk)
+
+        yield chunk
+
+class ZipAssembler(zipstream.ZipFile):
+    '''
+    A zipstream.ZipFile that can also take the members of existing archives as they are
+    stored. Their compressed bytes are streamed into the output without decompressing or
+    recompressing them, so merging child archives costs one sequential read of each.
+    '''
+
+    def write_zip(self, zip_filename):
+        self.paths_to_write.append({'zip_filename': zip_filename})
+
+    def write_iter_files(self, files, compress_type=None):
+        # Writes each (arcname, iterable) pair produced by files, which is only consumed while
+        # the archive is streamed.
+
+        self.paths_to_write.append({'files': files, 'compress_type': compress_type})
+
+    def __iter__(self):
+        # Chained rather than re-yielded, which keeps this usable on Python 2 (no yield from).
+
+        chunks = itertools.chain.from_iterable(self.path_chunks(kwargs) for kwargs in self.paths_to_write)
+
+        return itertools.chain(chunks, self._ZipFile__close()) # pylint: disable=no-member
+
+    def path_chunks(self, kwargs):
+        if 'zip_filename' in kwargs:
+            return self.copy_zip_members(kwargs['zip_filename'])
+
+        if 'files' in kwargs:
+            return self.iterate_files(kwargs['files'], kwargs['compress_type'])
+
+        return self._ZipFile__write(**kwargs) # pylint: disable=no-member
+
+    def iterate_files(self, files, compress_type):
+        # Lazy, so each member's iterable is only started once the previous one is written.
+
+        return itertools.chain.from_iterable(self._ZipFile__write(arcname=arcname, iterable=iterable, compress_type=compress_type) for arcname, iterable in files) # pylint: disable=no-member
+
+    def copy_zip_members(self, zip_filename):
+        with zipfile.ZipFile(zip_filename, 'r') as zip_file:
+            with io.open(zip_filename, 'rb') as raw_file:
+                for member in zip_file.infolist():
+                    copied = zipstream.ZipInfo(member.filename, member.date_time)
+                    copied.compress_type = member.compress_type
+                    copied.create_system = member.create_system
+                    copied.external_attr = member.external_attr
+                    copied.flag_bits = member.flag_bits & ~0x08 # Sizes go in the local header, not a trailing descriptor.
+                    copied.CRC = member.CRC
+                    copied.compress_size = member.compress_size
+                    copied.file_size = member.file_size
+                    copied.header_offset = self.fp.tell()
+
+                    self._writecheck(copied)
+                    self._didModify = True # pylint: disable=attribute-defined-outside-init
+
+                    yield self.fp.write(copied.FileHeader())
+
+                    for chunk in raw_member_chunks(raw_file, member):
+                        yield self.fp.write(chunk)
+
+                    self.filelist.append(copied)
+                    self.NameToInfo[copied.filename] = copied